@@ -1,102 +1,73 @@
-from collections import defaultdict, Counter
-import copy
-import itertools
-
-from common import Func, Block, Cmd, Asm, AsmInstr
-from common import collect_predecessors, new_name, remove_copies
+from collections import defaultdict
+from functools import lru_cache, partial
+import argparse
+import os
+import sys
+
+from common import Func, Block, Cmd, Asm, AsmInstr, Names
+from callgraph import CallGraph
+from cfg import CFG, CFG_ANALYSES
+from common import new_name, remove_copies
+from def_use import DefUse
+from dominance import DominatorTree, effective_predecessors
+from from_ssa import from_ssa
+from func_cache import DEFAULT_MAX_BYTES, FuncCache
+import ir_cache
+from liveness import compute_liveness
+from parallel import map_funcs
+from pass_profile import PassProfile, measure
 from parse import parse
+from passes import PassManager, PipelineError, declare
+from sccp import sccp
 from to_ssa import to_ssa
 
 
 def compute_live_sets(func):
-    defns = get_definitions(func)
+    live_ins, live_outs = compute_liveness(func.blocks, get_definitions(func))
     for block in func.blocks:
-        block.live_in = set()
-        block.live_out = set()
-
-    preds = collect_predecessors(func.blocks)
-
-    is_done = False
-    while not is_done:
-        is_done = True
-        for block in func.blocks:
-            live = block.live_out.copy()
-            for cmd in reversed(block.cmds):
-                live -= set(cmd.results)
-                if cmd.op != 'phi':
-                    live |= set(cmd.args) & defns
-            block.live_in = live.copy()
-
-            for pred in preds[block.name]:
-                old_size = len(pred.live_out)
-
-                pred.live_out |= block.live_in
-                for cmd in block.cmds:
-                    if cmd.op != 'phi':
-                        continue
-                    for a_block, a in zip(cmd.args[::2], cmd.args[1::2]):
-                        if a_block == pred.name:
-                            pred.live_out |= {a} & defns
-
-                if len(pred.live_out) != old_size:
-                    is_done = False
+        block.live_in = live_ins[block.name]
+        block.live_out = live_outs[block.name]
 
 
 def break_live_ranges_across_recursive_calls(funcs):
-    callers = defaultdict(set)
+    call_graph = CallGraph(funcs)
     for func in funcs:
-        for block in func.blocks:
-            for cmd in block.cmds:
-                if cmd.op == 'call':
-                    callers[cmd.args[0]].add(func.name)
-
-    def callers_size():
-        return sum(len(v) for v in callers.values())
-
-    while True:
-        old_size = callers_size()
-        for lers in callers.values():
-            new_lers = set()
-            for ler in lers:
-                # Never add anything to the callers defaultdict, since it is
-                # being iterated.
-                if ler in callers:
-                    new_lers |= callers[ler]
-            lers |= new_lers
-        if callers_size() == old_size:
-            break
+        break_live_ranges(func, call_graph.recursive_callees(func.name))
 
-    for func in funcs:
-        defns = get_definitions(func)
-        still_in_ssa = True
-        for block in func.blocks:
-            new_cmds = []
-            live = block.live_out.copy()
-            for cmd in reversed(block.cmds):
-                if cmd.op == 'call' and cmd.args[0] in callers[func.name]:
-                    live_across = live.copy()
-                    live_across -= set(cmd.results)
-                    if live_across:
-                        still_in_ssa = False
-                        live_across = list(live_across)
-                        # Note that new_cmds is in reverse order
-                        new_cmds.append(Cmd(live_across, 'restore', None, []))
-                        new_cmds.append(cmd)
-                        new_cmds.append(Cmd([], 'save', None, live_across))
-                    else:
-                        new_cmds.append(cmd)
-                    # No values are live across recursive call, so only args of
-                    # call are now live before the call.
-                    live = set(cmd.args) & defns
+
+# Save and restore the values live across calls to recursive_callees, which
+# can call func again, and restore SSA form if any were.
+def break_live_ranges(func, recursive_callees):
+    defns = get_definitions(func)
+    still_in_ssa = True
+    for block in func.blocks:
+        new_cmds = []
+        live = block.live_out.copy()
+        for cmd in reversed(block.cmds):
+            if cmd.op == 'call' and cmd.args[0] in recursive_callees:
+                live_across = live.copy()
+                live_across -= set(cmd.results)
+                if live_across:
+                    still_in_ssa = False
+                    live_across = sorted(live_across)
+                    # Note that new_cmds is in reverse order
+                    new_cmds.append(Cmd(live_across, 'restore', None, []))
+                    new_cmds.append(cmd)
+                    new_cmds.append(Cmd([], 'save', None, live_across))
                 else:
                     new_cmds.append(cmd)
-                    live -= set(cmd.results)
-                    live |= set(cmd.args) & defns
-            new_cmds.reverse()
-            block.cmds = new_cmds
+                # No values are live across recursive call, so only args of
+                # call and the values saved before it are now live before it.
+                live = (set(cmd.args) | set(live_across)) & defns
+            else:
+                new_cmds.append(cmd)
+                live -= set(cmd.results)
+                live |= set(cmd.args) & defns
+        new_cmds.reverse()
+        block.cmds = new_cmds
 
-        if not still_in_ssa:
-            to_ssa(func.blocks)
+    if not still_in_ssa:
+        to_ssa(func.blocks)
 
 
 def get_definitions(func):
@@ -113,21 +84,21 @@ def merge_all_funcs(funcs):
         for block in func.blocks:
             names.add(block.name)
 
-        def new_name(name):
+        def qualify(name):
             if name == '_':
                 return name
             elif name == 'start':
                 return func.name
             elif name in names:
-                return f'{func.name}_{name}'
+                return sys.intern(f'{func.name}_{name}')
             else:
                 return name
 
         for block in func.blocks:
-            block.name = new_name(block.name)
+            block.name = qualify(block.name)
             for cmd in block.cmds:
-                cmd.results = list(map(new_name, cmd.results))
-                cmd.args = list(map(new_name, cmd.args))
+                cmd.results = list(map(qualify, cmd.results))
+                cmd.args = list(map(qualify, cmd.args))
 
     funcs_by_name = {}
     for func in funcs:
@@ -157,16 +128,13 @@ def merge_all_funcs(funcs):
                     cmds.append(cmd)
             block.cmds = cmds
 
-    block_names = set(block.name for func in funcs for block in func.blocks)
+    block_names = Names(block.name for func in funcs for block in func.blocks)
     def new_block_name(name):
-        for i in itertools.chain([''], itertools.count(1)):
-            candidate = f'{name}{i}'
-            if candidate not in block_names:
-                block_names.add(candidate)
-                return candidate
+        return new_name(name, block_names)
 
     blocks = []
-    rts_dest_blocks = defaultdict(set)
+    # The blocks each subroutine returns to, in order of the calls.
+    rts_dest_blocks = defaultdict(dict)
     phi_blocks = defaultdict(set)
     for func in funcs:
         for block in func.blocks:
@@ -181,7 +149,7 @@ def merge_all_funcs(funcs):
                     block = Block(new_block_name(block_name), [])
                     cmd.args.append(block.name)
                     cmds = []
-                    rts_dest_blocks[cmd.args[0]].add(block.name)
+                    rts_dest_blocks[cmd.args[0]][block.name] = None
             phi_blocks[block_name] = block.name
             block.cmds = cmds
             blocks.append(block)
@@ -197,8 +165,10 @@ def merge_all_funcs(funcs):
     return blocks
 
 
-def lower_cmp(blocks):
-    defns = get_blocks_definitions(blocks)
+@declare(uses=['defns'], preserves=[*CFG_ANALYSES, 'defns'])
+def lower_cmp(blocks, defns=None):
+    if defns is None:
+        defns = get_blocks_definitions(blocks)
 
     for block in blocks:
         cmds = []
@@ -209,7 +179,9 @@ def lower_cmp(blocks):
                 cmds.append(Cmd([t], 'ge', cmd.size, [cmd.args[0], cmd.args[1]]))
                 cmds.append(Cmd(cmd.results, 'not', None, [t]))
             elif cmd.op == 'le':
-                cmds.append(Cmd(cmd.results, 'ge', cmd.size, [cmd.args[1], cmd.args[0]]))
+                cmd.op = 'ge'
+                cmd.args.reverse()
+                cmds.append(cmd)
             elif cmd.op == 'gt':
                 t = new_name('t', defns)
                 cmds.append(Cmd([t], 'ge', cmd.size, [cmd.args[1], cmd.args[0]]))
@@ -223,182 +195,213 @@ def lower_cmp(blocks):
         block.cmds = cmds
 
 
-def lower_16(blocks):
-    defns = get_blocks_definitions(blocks)
+# The names given to the bytes of split values, least significant first.
+def byte_suffixes(size):
+    if size == 2:
+        return ['lo', 'hi']
+    return [f'b{i}' for i in range(size)]
+
+
+# Addresses are two bytes wide.
+ADDRESS_SIZE = 2
+
+
+# Lower integer commands wider than a byte to byte commands, splitting the
+# values they use into one value per byte.
+#
+# Each block's commands are legalized off a worklist: a wide command is
+# replaced by narrower ones, which are pushed back to be legalized in turn.
+# The width of each value split is recorded, and widths are then carried
+# across phi webs, so phis, saves and restores are split in a single sweep.
+@declare(uses=['defns'], preserves=CFG_ANALYSES)
+def legalize(blocks, defns=None):
+    if defns is None:
+        defns = get_blocks_definitions(blocks)
 
     split_vars = {}
 
-    def split(var):
-        if var == 'main_i1_lo':
-            breakpoint()
+    def split(var, size):
         if var in split_vars:
-            return split_vars[var]
+            s = split_vars[var]
+            assert len(s) == size, (var, size)
+            return s
+        if var == 'undef':
+            return ['undef'] * size
         if var not in defns:
-            var = int(var, 0)
-            s = [str(var & 0xff), str((var >> 8) & 0xff)]
-        else:
-            s = [
-                new_name(var + '_lo', defns),
-                new_name(var + '_hi', defns),
-            ]
+            value = int(var, 0)
+            return [str((value >> (8 * i)) & 0xff) for i in range(size)]
+        s = [new_name(f'{var}_{suffix}', defns) for suffix in byte_suffixes(size)]
         split_vars[var] = s
         return s
 
-    fixed = False
-    while not fixed:
-        fixed = True
-        for block in blocks:
+    def carry_chain(cmd, carry_name, carry_in):
+        size = cmd.size
+        (result,) = cmd.results
+        args1 = split(cmd.args[0], size)
+        args2 = split(cmd.args[1], size)
+        results = split(result, size)
+        op = 'adc' if cmd.op == 'add' else 'sbc'
+        cmds = []
+        carry = carry_in
+        for i in range(size):
+            carry_out = new_name(carry_name, defns) if i < size - 1 else '_'
+            cmds.append(Cmd([results[i], carry_out], op, None, [args1[i], args2[i], carry]))
+            carry = carry_out
+        return cmds
+
+    def lower(cmd):
+        size = cmd.size
+        if cmd.op == 'add':
+            if size == 1:
+                return [Cmd(cmd.results, 'adc', None, cmd.args + ['0'])]
+            return carry_chain(cmd, 'carry', '0')
+        elif cmd.op == 'sub':
+            if size == 1:
+                return [Cmd(cmd.results, 'sbc', None, cmd.args + ['1'])]
+            return carry_chain(cmd, 'borrow', '1')
+        elif cmd.op == 'lsr':
+            if size == 1:
+                return [Cmd(cmd.results, 'ror', None, cmd.args + ['0'])]
+            (result,) = cmd.results
+            args = split(cmd.args[0], size)
+            results = split(result, size)
+            cmds = []
+            carry = '0'
+            for i in reversed(range(size)):
+                carry_out = new_name('carry', defns) if i > 0 else '_'
+                cmds.append(Cmd([results[i], carry_out], 'ror', None, [args[i], carry]))
+                carry = carry_out
+            return cmds
+        elif cmd.op == 'eq':
+            if size == 1:
+                cmd.size = None
+                return [cmd]
+            (result,) = cmd.results
+            args1 = split(cmd.args[0], size)
+            args2 = split(cmd.args[1], size)
+            eqs = [new_name(f'eq_{s}', defns) for s in byte_suffixes(size)]
+            cmds = [Cmd([eqs[i], '_'], 'cmp', None, [args1[i], args2[i]])
+                    for i in range(size)]
+            all_eq = eqs[0]
+            for i in range(1, size):
+                t = result if i == size - 1 else new_name('t', defns)
+                cmds.append(Cmd([t], 'and', None, [all_eq, eqs[i]]))
+                all_eq = t
+            return cmds
+        elif cmd.op == 'ge':
+            if size == 1:
+                cmd.size = None
+                return [cmd]
+            (result,) = cmd.results
+            args1 = split(cmd.args[0], size)
+            args2 = split(cmd.args[1], size)
+            suffixes = byte_suffixes(size)
+            ges = {i: new_name(f'ge_{suffixes[i]}', defns) for i in reversed(range(size))}
+            eqs = {i: new_name(f'eq_{suffixes[i]}', defns) for i in reversed(range(1, size))}
+
+            # Compare every byte, then combine from the least significant
+            # up: the bytes from i down are ge if byte i is ge, and either
+            # differs or the bytes below it are ge.
             cmds = []
+            for i in reversed(range(size)):
+                cmds.append(Cmd([eqs.get(i, '_'), ges[i]], 'cmp', None, [args1[i], args2[i]]))
+            lower_ge = ges[0]
+            for i in range(1, size):
+                ne = new_name(f'ne_{suffixes[i]}', defns)
+                t = new_name('t', defns)
+                ge = result if i == size - 1 else new_name('t', defns)
+                cmds.append(Cmd([ne], 'not', None, [eqs[i]]))
+                cmds.append(Cmd([t], 'or', None, [ne, lower_ge]))
+                cmds.append(Cmd([ge], 'and', None, [ges[i], t]))
+                lower_ge = ge
+            return cmds
+        elif cmd.op == 'store':
+            if size == 1:
+                addr = split(cmd.args[0], ADDRESS_SIZE)
+                return [Cmd([], 'store', None, [*addr, cmd.args[1]])]
+            values = split(cmd.args[1], size)
+            addr = cmd.args[0]
+            cmds = [Cmd([], 'store', 1, [addr, values[0]])]
+            for value in values[1:]:
+                next_addr = new_name('next_addr', defns)
+                cmds.append(Cmd([next_addr], 'add', ADDRESS_SIZE, [addr, '1']))
+                cmds.append(Cmd([], 'store', 1, [next_addr, value]))
+                addr = next_addr
+            return cmds
+        elif cmd.op == 'split':
+            values = split(cmd.args[0], len(cmd.results))
+            return [Cmd([r], 'copy', None, [v])
+                    for r, v in zip(cmd.results, values) if r != '_']
+        assert False, cmd
 
-            for cmd in block.cmds:
-                if cmd.size is None and cmd.op != 'split':
-                    cmds.append(cmd)
-                    continue
+    for block in blocks:
+        cmds = []
+        work = list(reversed(block.cmds))
+        while work:
+            cmd = work.pop()
+            if cmd.size is None and (cmd.op != 'split' or len(cmd.results) == 1):
+                cmds.append(cmd)
+            else:
+                work.extend(reversed(lower(cmd)))
+        block.cmds = cmds
 
-                if cmd.op == 'add':
-                    assert cmd.size in (1, 2)
-                    if cmd.size == 1:
-                        cmds.append(Cmd(cmd.results, 'adc', None, cmd.args + ['0']))
-                    else:
-                        (result,) = cmd.results
-
-                        arg1_lo, arg1_hi = split(cmd.args[0])
-                        arg2_lo, arg2_hi = split(cmd.args[1])
-                        result_lo, result_hi = split(result)
-                        carry = new_name('carry', defns)
-
-                        cmds.append(Cmd([result_lo, carry], 'adc', None, [arg1_lo, arg2_lo, '0']))
-                        cmds.append(Cmd([result_hi, '_'], 'adc', None, [arg1_hi, arg2_hi, carry]))
-                elif cmd.op == 'sub':
-                    assert cmd.size in (1, 2)
-                    if cmd.size == 1:
-                        cmds.append(Cmd(cmd.results, 'sbc', None, cmd.args + ['1']))
-                    else:
-                        (result,) = cmd.results
-
-                        arg1_lo, arg1_hi = split(cmd.args[0])
-                        arg2_lo, arg2_hi = split(cmd.args[1])
-                        result_lo, result_hi = split(result)
-
-                        borrow = new_name('borrow', defns)
-                        cmds.append(Cmd([result_lo, borrow], 'sbc', None, [arg1_lo, arg2_lo, '1']))
-                        cmds.append(Cmd([result_hi, '_'], 'sbc', None, [arg1_hi, arg2_hi, borrow]))
-                elif cmd.op == 'lsr':
-                    if cmd.size == 1:
-                        cmds.append(Cmd(cmd.results, 'ror', None, cmd.args + ['0']))
-                    else:
-                        (result,) = cmd.results
-
-                        arg_lo, arg_hi = split(cmd.args[0])
-                        result_lo, result_hi = split(result)
-
-                        carry = new_name('carry', defns)
-                        cmds.append(Cmd([result_hi, carry], 'ror', None, [arg_hi, '0']))
-                        cmds.append(Cmd([result_lo, '_'], 'ror', None, [arg_lo, carry]))
-                elif cmd.op == 'eq':
-                    assert cmd.size in (1, 2)
-                    if cmd.size == 1:
-                        cmd.size = None
-                    else:
-                        (result,) = cmd.results
-
-                        arg1_lo, arg1_hi = split(cmd.args[0])
-                        arg2_lo, arg2_hi = split(cmd.args[1])
-                        eq_lo = new_name('eq_lo', defns)
-                        eq_hi = new_name('eq_hi', defns)
-
-                        cmds.append(Cmd([eq_lo, '_'], 'cmp', None, [arg1_lo, arg2_lo]))
-                        cmds.append(Cmd([eq_hi, '_'], 'cmp', None, [arg1_hi, arg2_hi]))
-                        cmds.append(Cmd([result], 'and', None, [eq_lo, eq_hi]))
-                elif cmd.op == 'ge':
-                    assert cmd.size in (1, 2)
-                    if cmd.size == 1:
-                        cmd.size = None
-                    else:
-                        (result,) = cmd.results
-
-                        arg1_lo, arg1_hi = split(cmd.args[0])
-                        arg2_lo, arg2_hi = split(cmd.args[1])
-                        ge_hi = new_name('ge_hi', defns)
-                        ge_lo = new_name('ge_lo', defns)
-                        eq_hi = new_name('eq_hi', defns)
-                        ne_hi = new_name('ne_hi', defns)
-                        t = new_name('t', defns)
-
-                        cmds.append(Cmd([eq_hi, ge_hi], 'cmp', None, [arg1_hi, arg2_hi]))
-                        cmds.append(Cmd(['_', ge_lo], 'cmp', None, [arg1_lo, arg2_lo]))
-                        cmds.append(Cmd([ne_hi], 'not', None, [eq_hi]))
-                        cmds.append(Cmd([t], 'or', None, [ne_hi, ge_lo]))
-                        cmds.append(Cmd([result], 'and', None, [ge_hi, t]))
-                elif cmd.op == 'store':
-                    assert cmd.size in (1, 2)
-                    if cmd.size == 1:
-                        addr_lo, addr_hi = split(cmd.args[0])
-                        cmds.append(Cmd([], 'store', None, [addr_lo, addr_hi, cmd.args[1]]))
-                    else:
-                        fixed = False
-                        arg_lo, arg_hi = split(cmd.args[1])
-                        cmds.append(Cmd([], 'store', 1, [cmd.args[0], arg_lo]))
-                        next_addr = new_name('next_addr', defns)
-                        cmds.append(Cmd([next_addr], 'add', 2, [cmd.args[0], '1']))
-                        cmds.append(Cmd([], 'store', 1, [next_addr, arg_hi]))
-                elif cmd.op == 'split':
-                    if len(cmd.results) == 1:
-                        cmds.append(cmd)
-                    else:
-                        assert len(cmd.results) == 2, cmd
-                        arg_lo, arg_hi = split(cmd.args[0])
-                        if cmd.results[0] != '_':
-                            cmds.append(Cmd([cmd.results[0]], 'copy', None, [arg_lo]))
-                        if cmd.results[1] != '_':
-                            cmds.append(Cmd([cmd.results[1]], 'copy', None, [arg_hi]))
-                else:
-                    assert False, cmd
-            block.cmds = cmds
+    # Values joined by phis have the same width.
+    parent = {}
 
-    fixed = False
-    while not fixed:
-        fixed = True
-        for block in blocks:
-            cmds = []
-            for cmd in block.cmds:
-                if (any(r in split_vars for r in cmd.results) or
-                    any(a in split_vars for a in cmd.args)):
-                    fixed = False
+    def find(var):
+        parent.setdefault(var, var)
+        while parent[var] != var:
+            parent[var] = parent[parent[var]]
+            var = parent[var]
+        return var
 
-                    if cmd.op == 'phi':
-                        (result,) = cmd.results
-                        result_lo, result_hi = split(result)
-
-                        args_lo = []
-                        args_hi = []
-                        for i, arg in enumerate(cmd.args):
-                            if i % 2:
-                                arg_lo, arg_hi = split(arg)
-                                args_lo.append(arg_lo)
-                                args_hi.append(arg_hi)
-                            else:
-                                args_lo.append(arg)
-                                args_hi.append(arg)
-
-                        cmds.append(Cmd([result_lo], 'phi', None, args_lo))
-                        cmds.append(Cmd([result_hi], 'phi', None, args_hi))
-                    elif cmd.op == 'save':
-                        for arg in cmd.args:
-                            arg_lo, arg_hi = split(arg)
-                            cmds.append(Cmd([], 'save', None, [arg_lo]))
-                            cmds.append(Cmd([], 'save', None, [arg_hi]))
-                    elif cmd.op == 'restore':
-                        for result in cmd.results:
-                            result_lo, result_hi = split(result)
-                            cmds.append(Cmd([result_hi], 'restore', None, []))
-                            cmds.append(Cmd([result_lo], 'restore', None, []))
-                    else:
-                        assert False, cmd
+    for block in blocks:
+        for cmd in block.cmds:
+            if cmd.op != 'phi':
+                continue
+            for arg in cmd.args[1::2]:
+                if arg in defns:
+                    parent[find(arg)] = find(cmd.results[0])
 
-                else:
+    web_sizes = {}
+    for var, s in split_vars.items():
+        if var in parent:
+            web_sizes[find(var)] = len(s)
+
+    def width(var):
+        if var in split_vars:
+            return len(split_vars[var])
+        if var in parent:
+            return web_sizes.get(find(var))
+        return None
+
+    for block in blocks:
+        cmds = []
+        for cmd in block.cmds:
+            if cmd.op == 'phi':
+                (result,) = cmd.results
+                size = width(result)
+                if size is None:
                     cmds.append(cmd)
-            block.cmds = cmds
+                    continue
+                results = split(result, size)
+                args = [[arg] * size if i % 2 == 0 else split(arg, size)
+                        for i, arg in enumerate(cmd.args)]
+                for i in range(size):
+                    cmds.append(Cmd([results[i]], 'phi', None, [a[i] for a in args]))
+            elif cmd.op == 'save' and any(width(a) for a in cmd.args):
+                for arg in cmd.args:
+                    size = width(arg)
+                    for byte in split(arg, size) if size else [arg]:
+                        cmds.append(Cmd([], 'save', None, [byte]))
+            elif cmd.op == 'restore' and any(width(r) for r in cmd.results):
+                for result in cmd.results:
+                    size = width(result)
+                    for byte in reversed(split(result, size)) if size else [result]:
+                        cmds.append(Cmd([byte], 'restore', None, []))
+            else:
+                cmds.append(cmd)
+        block.cmds = cmds
 
     for block in blocks:
         for cmd in block.cmds:
@@ -410,6 +413,7 @@ def lower_16(blocks):
     remove_copies(blocks)
 
 
+@declare(preserves=[*CFG_ANALYSES, 'defns'])
 def add_z_results(blocks):
     for block in blocks:
         for cmd in block.cmds:
@@ -418,6 +422,7 @@ def add_z_results(blocks):
             cmd.results.append('_')
 
 
+@declare(preserves=CFG_ANALYSES)
 def const_adc(blocks):
     fixed = True
     for block in blocks:
@@ -449,262 +454,284 @@ def const_adc(blocks):
     return fixed
 
 
-def not_br(blocks):
-    fixed = True
-    nots = {}
-    for block in blocks:
-        for cmd in block.cmds:
-            if cmd.op == 'not':
-                (result,) = cmd.results
-                (arg,) = cmd.args
-                nots[result] = arg
-
-    nots_use_count = Counter()
-    for block in blocks:
-        for cmd in block.cmds:
-            for arg in cmd.args:
-                if arg in nots:
-                    nots_use_count[arg] += 1
-
-    nots_only_used_in_br = set()
-    for block in blocks:
-        for cmd in block.cmds:
-            if cmd.op == 'br' and nots_use_count[cmd.args[0]] == 1:
-                nots_only_used_in_br.add(cmd.args[0])
+# Turn branches on single-use nots, ands and ors into control flow: a br on
+# a not swaps its targets, and a br on an and or or branches on the first
+# operand and then, in a new block placed after it, on the second. Branches
+# are kept on a worklist and requeued only when rewritten, so each rewrite
+# costs constant time. The CFG is updated edge by edge as branches change.
+@declare(uses=['cfg'], preserves=['cfg'])
+def combine_branches(blocks, cfg=None):
+    if cfg is None:
+        cfg = CFG(blocks)
+    du = DefUse(blocks)
+    block_names = Names(b.name for b in blocks)
+
+    # The blocks split off each block, most recent first.
+    split_off = defaultdict(list)
+
+    worklist = list(reversed(blocks))
+    while worklist:
+        block = worklist.pop()
+        br = block.cmds[-1]
+        if br.op != 'br' or len(br.args) != 3:
+            continue
+        cond, true_block, false_block = br.args
+        defn = du.defn(cond)
+        if defn is None or du.use_count(cond) != 1:
+            continue
 
-    for block in blocks:
-        cmds = []
-        for cmd in block.cmds:
-            if cmd.op == 'not':
-                if cmd.results[0] not in nots_only_used_in_br:
-                    cmds.append(cmd)
-            elif cmd.op == 'br':
-                if cmd.args[0] in nots_only_used_in_br:
-                    fixed = False
-                    cmds.append(Cmd([], 'br', None, [nots[cmd.args[0]], cmd.args[2], cmd.args[1]]))
-                else:
-                    cmds.append(cmd)
+        new_block = None
+        if defn.op == 'not':
+            du.erase(defn)
+            du.set_args(br, [defn.args[0], false_block, true_block])
+        elif defn.op in ('and', 'or'):
+            lhs, rhs = defn.args
+            du.erase(defn)
+            new_block = Block(new_name(block.name, block_names), [])
+            du.append(new_block, Cmd([], 'br', None, [rhs, true_block, false_block]))
+            cfg.add(new_block)
+            if defn.op == 'and':
+                du.set_args(br, [lhs, new_block.name, false_block])
             else:
-                cmds.append(cmd)
-        block.cmds = cmds
-
-    return fixed
-
-
-def and_or_br(blocks):
-    orig_blocks = blocks
-
-    fixed = True
-    ands = {}
-    ors = {}
-    for block in blocks:
-        for cmd in block.cmds:
-            if cmd.op == 'and' or cmd.op == 'or':
-                (result,) = cmd.results
-                if cmd.op == 'and':
-                    ands[result] = cmd.args
-                else:
-                    ors[result] = cmd.args
-
-
-    use_count = Counter()
-    for block in blocks:
-        for cmd in block.cmds:
-            for arg in cmd.args:
-                if arg in ands or arg in ors:
-                    use_count[arg] += 1
-
-    only_used_in_br = set()
-    for block in blocks:
-        for cmd in block.cmds:
-            if cmd.op == 'br' and use_count[cmd.args[0]] == 1:
-                only_used_in_br.add(cmd.args[0])
+                du.set_args(br, [lhs, true_block, new_block.name])
+            split_off[block.name].insert(0, new_block)
+            worklist.append(new_block)
+        else:
+            continue
+        cfg.update(block)
+        worklist.append(block)
+
+        # Phis in the targets now get their values through the new block too,
+        # or instead, if the old block no longer branches to them.
+        if new_block is not None:
+            for target in new_block.succs:
+                kept = block in target.preds
+                for phi in target.cmds:
+                    if phi.op != 'phi':
+                        break
+                    args = []
+                    for pred, arg in zip(phi.args[::2], phi.args[1::2]):
+                        if pred == block.name:
+                            if kept:
+                                args += [pred, arg]
+                            pred = new_block.name
+                        args += [pred, arg]
+                    du.set_args(phi, args)
 
-    block_names = set(b.name for b in blocks)
     new_blocks = []
-    for block in blocks:
-        cmds = []
-        for cmd in block.cmds:
-            if cmd.op == 'and' or cmd.op == 'or':
-                if cmd.results[0] not in only_used_in_br:
-                    cmds.append(cmd)
-            elif cmd.op == 'br':
-                if cmd.args[0] in only_used_in_br:
-                    fixed = False
-                    if cmd.args[0] in ands:
-                        lhs, rhs = ands[cmd.args[0]]
-                        new_block_name = new_name(block.name, block_names)
-                        cmds.append(Cmd([], 'br', None, [lhs, new_block_name, cmd.args[2]]))
-                        block.cmds = cmds
-                        new_blocks.append(block)
-                        block = Block(new_block_name, [])
-                        cmds = []
-                        cmds.append(Cmd([], 'br', None, [rhs, cmd.args[1], cmd.args[2]]))
-                    else:
-                        lhs, rhs = ors[cmd.args[0]]
-                        new_block_name = new_name(block.name, block_names)
-                        cmds.append(Cmd([], 'br', None, [lhs, cmd.args[1], new_block_name]))
-                        block.cmds = cmds
-                        new_blocks.append(block)
-                        block = Block(new_block_name, [])
-                        cmds = []
-                        cmds.append(Cmd([], 'br', None, [rhs, cmd.args[1], cmd.args[2]]))
-                else:
-                    cmds.append(cmd)
-            else:
-                cmds.append(cmd)
-        block.cmds = cmds
+    stack = list(reversed(blocks))
+    while stack:
+        block = stack.pop()
         new_blocks.append(block)
-        blocks = new_blocks
-
-    orig_blocks.clear()
-    orig_blocks.extend(blocks)
-    return fixed
+        stack.extend(reversed(split_off[block.name]))
+    blocks[:] = new_blocks
 
 
+@declare(preserves=CFG_ANALYSES)
 def push_down_unique_uses(blocks):
-    use_counts = Counter()
-    used_in_phi = set()
-    for block in blocks:
-        for cmd in block.cmds:
-            for arg in cmd.args:
-                if cmd.op == 'phi':
-                    used_in_phi.add(arg)
-                use_counts[arg] += 1
+    du = DefUse(blocks)
 
-    unique = {}
+    def uniquely_used_result(cmd):
+        result = None
+        for r in cmd.results:
+            if r == '_':
+                continue
+            if du.use_count(r) != 1:
+                return None
+            if du.uses(r)[0].op == 'phi':
+                return None
+            if result is not None:
+                return None
+            result = r
+        return result
 
+    unique = {}
     for block in blocks:
-        cmds = []
         for cmd in block.cmds:
             if cmd.op in ('phi', 'restore'):
-                cmds.append(cmd)
                 continue
-
-            def uniquely_used_result():
-                result = None
-                for r in cmd.results:
-                    if r == '_':
-                        continue
-                    if r in used_in_phi:
-                        return None
-                    if use_counts[r] != 1:
-                        return None
-                    if result is not None:
-                        return None
-                    result = r
-                return result
-
-            result = uniquely_used_result()
-            if result is None:
-                cmds.append(cmd)
+            result = uniquely_used_result(cmd)
+            if result is not None:
+                unique[result] = cmd
+    du.erase_all(unique.values())
+
+    # Place the definitions of each command's uniquely used args just before
+    # it, with the first arg's definition closest. Placed definitions then
+    # have their own args placed in turn.
+    stack = [cmd for block in blocks for cmd in block.cmds]
+    while stack:
+        cmd = stack.pop()
+        anchor = cmd
+        for arg in cmd.args:
+            if arg not in unique:
                 continue
-            unique[result] = cmd
-        block.cmds = cmds
+            defn = unique.pop(arg)
+            du.insert_before(anchor, defn)
+            anchor = defn
+            stack.append(defn)
 
-    while unique:
-        for block in blocks:
-            cmds = []
-            for cmd in block.cmds:
-                for arg in reversed(cmd.args):
-                    if arg in unique:
-                        cmds.append(unique[arg])
-                        del unique[arg]
-                cmds.append(cmd)
-            block.cmds = cmds
 
+# Global value numbering over the dominator tree. A command is redundant if
+# a command with the same op, size and value-numbered args dominates it; its
+# results are renamed to the dominating command's results, and any '_'
+# results of the dominating command take on the redundant command's names.
+#
+# One walk of the dominator tree numbers every command. Uses that the walk
+# reaches before their definitions are renamed afterwards, mostly phi
+# arguments across back edges, and the commands whose arguments change are
+# numbered again from a worklist, along with the users of any values found
+# redundant in turn.
+@declare(uses=['dom_tree'], preserves=CFG_ANALYSES)
+def cse(blocks, dom_tree=None):
+    if dom_tree is None:
+        dom_tree = DominatorTree(blocks)
+    value_number(blocks, dom_tree)
 
-def cse(blocks):
-    fixed = True
-    doms = dominators(blocks)
+
+COMMUTATIVE_OPS = ('add', 'and', 'or', 'adc')
+
+# Side-effecting commands are never numbered.
+UNNUMBERED_OPS = ('br', 'jsr', 'rts', 'ret', 'call', 'save', 'restore', 'store', 'asm')
+
+
+def value_number(blocks, tree):
 
     blocks_by_name = {}
     for block in blocks:
         blocks_by_name[block.name] = block
 
-    for block in blocks:
-        cmds = []
-        for cmd in block.cmds:
-            if cmd.op in ('br', 'jsr', 'rts', 'save', 'restore', 'store'):
-                cmds.append(cmd)
+    # The leader of each value found to be redundant.
+    leaders = {}
+    # Scoped hash table from expression key to numbered command. Entries
+    # added while visiting a block are removed when leaving its subtree.
+    exprs = {}
+    added = []
+    # Every numbered command by key, with the block and position of each
+    # command, for renumbering commands after the walk.
+    numbered = defaultdict(list)
+    position = {}
+    keys = {}
+    removed = set()
+
+    def key(cmd):
+        args = tuple(cmd.args)
+        if cmd.op == 'phi':
+            args = tuple(sorted(zip(args[::2], args[1::2])))
+        elif cmd.op in COMMUTATIVE_OPS and len(args) >= 2:
+            args = tuple(sorted(args[:2])) + args[2:]
+        return (cmd.op, cmd.size, args)
+
+    def dominates(a, b):
+        (a_block, a_i), (b_block, b_i) = position[id(a)], position[id(b)]
+        if a_block == b_block:
+            return a_i < b_i
+        return tree.dominates(a_block, b_block)
+
+    # Rename the results of cmd to those of dom_cmd. Returns the renamed
+    # results.
+    def merge(cmd, dom_cmd):
+        renamed = []
+        for i in range(len(cmd.results)):
+            if cmd.results[i] == '_':
+                continue
+            if dom_cmd.results[i] == '_':
+                dom_cmd.results[i] = cmd.results[i]
+            else:
+                leaders[cmd.results[i]] = dom_cmd.results[i]
+                renamed.append(cmd.results[i])
+        return renamed
+
+    def visit(block):
+        for i, cmd in enumerate(block.cmds):
+            position[id(cmd)] = (block.name, i)
+            cmd.args = [leaders.get(a, a) for a in cmd.args]
+            if cmd.op in UNNUMBERED_OPS:
                 continue
 
-            def find_dom_cmd():
-                for dom_cmd in block.cmds:
-                    if dom_cmd is cmd:
-                        break
-                    if cmd.op == dom_cmd.op and cmd.args == dom_cmd.args:
-                        return dom_cmd
-
-                for dom in doms[block.name]:
-                    if dom == block.name:
-                        continue
-                    dom = blocks_by_name[dom]
-                    for dom_cmd in dom.cmds:
-                        if cmd.op == dom_cmd.op and cmd.args == dom_cmd.args:
-                            return dom_cmd
-
-            dom_cmd = find_dom_cmd()
+            k = key(cmd)
+            dom_cmd = exprs.get(k)
             if dom_cmd is None:
-                cmds.append(cmd)
+                exprs[k] = cmd
+                added.append(k)
+                numbered[k].append(cmd)
+                keys[id(cmd)] = k
                 continue
-            fixed = False
-            for i in range(len(cmd.results)):
-                if cmd.results[i] == '_':
-                    continue
-                if dom_cmd.results[i] == '_':
-                    dom_cmd.results[i] = cmd.results[i]
-                else:
-                    cmds.append(Cmd([cmd.results[i]], 'copy', None, [dom_cmd.results[i]]))
-        block.cmds = cmds
-
-    remove_copies(blocks)
-    return fixed
+            merge(cmd, dom_cmd)
+            removed.add(id(cmd))
 
+    for root in tree.names:
+        if tree.idom[root] is not None:
+            continue
+        stack = [(root, None)]
+        while stack:
+            name, scope = stack.pop()
+            if scope is not None:
+                for k in added[scope:]:
+                    del exprs[k]
+                del added[scope:]
+                continue
+            stack.append((name, len(added)))
+            visit(blocks_by_name[name])
+            for child in reversed(tree.children[name]):
+                stack.append((child, None))
 
-def get_blocks_definitions(blocks):
-    defns = set()
+    users = defaultdict(list)
     for block in blocks:
         for cmd in block.cmds:
-            defns |= set(cmd.results)
-    return defns
+            if id(cmd) not in removed:
+                for a in cmd.args:
+                    users[a].append(cmd)
+
+    def rename_uses(values):
+        for v in values:
+            leader = leaders[v]
+            while leader in leaders:
+                leader = leaders[leader]
+            for user in users.pop(v, ()):
+                if id(user) in removed:
+                    continue
+                user.args = [leader if a == v else a for a in user.args]
+                users[leader].append(user)
+                worklist.append(user)
 
+    # Phi args and uses not dominated by their definitions.
+    worklist = []
+    rename_uses([v for v in leaders if v in users])
 
-def dominators(blocks):
-    preds = collect_predecessors(blocks)
+    while worklist:
+        cmd = worklist.pop()
+        if id(cmd) in removed or cmd.op in UNNUMBERED_OPS:
+            continue
+        k = key(cmd)
+        if k == keys[id(cmd)]:
+            continue
+        numbered[keys[id(cmd)]].remove(cmd)
+        dom_cmd = next((c for c in numbered[k] if dominates(c, cmd)), None)
+        if dom_cmd is not None:
+            removed.add(id(cmd))
+            rename_uses(merge(cmd, dom_cmd))
+            continue
+        # The new key may also match commands that cmd dominates.
+        for c in [c for c in numbered[k] if dominates(cmd, c)]:
+            numbered[k].remove(c)
+            removed.add(id(c))
+            rename_uses(merge(c, cmd))
+        numbered[k].append(cmd)
+        keys[id(cmd)] = k
 
-    jsr_dom = {}
     for block in blocks:
-        for cmd in block.cmds:
-            if cmd.op == 'jsr':
-                jsr_dom[cmd.args[1]] = block.name
+        block.cmds = [cmd for cmd in block.cmds if id(cmd) not in removed]
 
 
-    doms = defaultdict(set)
+def get_blocks_definitions(blocks):
+    defns = Names()
     for block in blocks:
-        if not preds[block.name]:
-            doms[block.name] = {block.name}
-            continue
-        for block2 in blocks:
-            if block2.name != block.name:
-                doms[block.name].add(block2.name)
-
-    fixed = False
-    while not fixed:
-        fixed = True
-        for block in blocks:
-            if not preds[block.name]:
-                continue
-            new_doms = {block.name} | set.intersection(*(doms[p.name] for p in preds[block.name]))
-            if block.name in jsr_dom:
-                new_doms |= doms[jsr_dom[block.name]]
-            if new_doms != doms[block.name]:
-                fixed = False
-            doms[block.name] = new_doms
-
-    return doms
+        for cmd in block.cmds:
+            defns |= set(cmd.results)
+    return defns
 
 
+@declare(preserves=CFG_ANALYSES)
 def ge_zero(blocks):
     fixed = True
     for block in blocks:
@@ -712,9 +739,11 @@ def ge_zero(blocks):
         for cmd in block.cmds:
             if cmd.op == 'cmp' and cmd.args[1] == '0' and cmd.results[1] != '_':
                 fixed = False
+                ge = cmd.results[1]
                 if cmd.results[0] != '_':
-                    cmds.append(Cmd([cmd.results[0], '_'], 'cmp', None, cmd.args))
-                cmds.append(Cmd([cmd.results[1]], 'copy', None, ['true']))
+                    cmd.results[1] = '_'
+                    cmds.append(cmd)
+                cmds.append(Cmd([ge], 'copy', None, ['true']))
             else:
                 cmds.append(cmd)
         block.cmds = cmds
@@ -723,6 +752,7 @@ def ge_zero(blocks):
     return fixed
 
 
+@declare(preserves=CFG_ANALYSES)
 def const_and(blocks):
     fixed = True
     for block in blocks:
@@ -732,14 +762,16 @@ def const_and(blocks):
                 fixed = False
                 if all(a in ('true', 'false') for a in cmd.args):
                     result = 'true' if cmd.args[0] == 'true' and cmd.args[1] == 'true' else 'false'
-                    cmds.append(Cmd(cmd.results, 'copy', None, [result]))
+                    cmd.args = [result]
                 else:
                     if cmd.args[0] not in ('true', 'false'):
                         cmd.args[0], cmd.args[1] = cmd.args[1], cmd.args[0]
                     if cmd.args[0] == 'true':
-                        cmds.append(Cmd(cmd.results, 'copy', None, [cmd.args[1]]))
+                        del cmd.args[0]
                     else:
-                        cmds.append(Cmd(cmd.results, 'copy', None, ['false']))
+                        cmd.args = ['false']
+                cmd.op = 'copy'
+                cmds.append(cmd)
             else:
                 cmds.append(cmd)
         block.cmds = cmds
@@ -748,46 +780,61 @@ def const_and(blocks):
     return fixed
 
 
-def redundant_cmp_zero(blocks):
+@declare(uses=['defns'], preserves=CFG_ANALYSES)
+def redundant_cmp_zero(blocks, defns=None):
     fixed = True
 
-    defns = {}
+    defn_cmds = {}
+    defn_blocks = {}
     for block in blocks:
         for cmd in block.cmds:
             for result in cmd.results:
                 if result != '_':
-                    defns[result] = cmd
+                    defn_cmds[result] = cmd
+                    defn_blocks[result] = block.name
 
-    defns_set = get_blocks_definitions(blocks)
+    defns_set = defns if defns is not None else get_blocks_definitions(blocks)
 
     phis_for_block = defaultdict(list)
     cmps_for_block = defaultdict(list)
 
+    # Each phi compared with zero gets a phi of its arguments' comparisons
+    # with zero, named here and built below. An argument that is itself a phi
+    # uses that phi's new phi rather than a new comparison, so that a cycle of
+    # phis gives a cycle of new phis instead of one more phi every round.
+    eq_phis = {}
+    new_phis = []
+
+    def eq_phi(phi):
+        work = [phi]
+        while work:
+            p = work.pop()
+            (result,) = p.results
+            if result in eq_phis:
+                continue
+            eq_phis[result] = new_name(f'{result}_eq', defns_set)
+            new_phis.append(p)
+            for arg in p.args[1::2]:
+                defn = defn_cmds.get(arg)
+                if defn is not None and defn.op == 'phi':
+                    work.append(defn)
+        return eq_phis[phi.results[0]]
+
     for block in blocks:
         cmds = []
         for cmd in block.cmds:
-            if cmd.op == 'cmp' and cmd.args[1] == '0':
-                assert cmd.results[1] == '_'
-                if cmd.args[0] not in defns:
+            if cmd.op == 'cmp' and cmd.args[1] == '0' and cmd.results[1] == '_':
+                if cmd.args[0] == 'undef':
+                    cmds.append(Cmd([cmd.results[0]], 'copy', None, ['undef']))
+                    continue
+                if cmd.args[0] not in defn_cmds:
                     v = int(cmd.args[0])
                     cmds.append(Cmd([cmd.results[0]], 'copy', None, ['1' if v else '0']))
                     continue
-                defn = defns[cmd.args[0]]
+                defn = defn_cmds[cmd.args[0]]
                 if defn.op == 'phi':
                     fixed = False
-                    phi_args = []
-                    for i in range(0, len(defn.args), 2):
-                        pred = defn.args[i]
-                        arg = defn.args[i+1]
-                        cmp_name = new_name(f'{arg}_eq', defns_set)
-                        cmp = Cmd([cmp_name, '_'], 'cmp', None, [arg, '0'])
-                        cmps_for_block[pred].append(cmp)
-                        phi_args.append(pred)
-                        phi_args.append(cmp_name)
-
-                    phi_name = new_name(f'{defn.results[0]}_eq', defns_set)
-                    phis_for_block[block.name].append(Cmd([phi_name], 'phi', None, phi_args))
-                    source = phi_name
+                    source = eq_phi(defn)
                 else:
                     if defn.results[-1] == '_':
                         defn.results[-1] = new_name('eq', defns_set)
@@ -797,6 +844,20 @@ def redundant_cmp_zero(blocks):
                 cmds.append(cmd)
         block.cmds = cmds
 
+    for phi in new_phis:
+        phi_args = []
+        for pred, arg in zip(phi.args[::2], phi.args[1::2]):
+            defn = defn_cmds.get(arg)
+            if defn is not None and defn.op == 'phi':
+                cmp_name = eq_phis[arg]
+            else:
+                cmp_name = new_name(f'{arg}_eq', defns_set)
+                cmps_for_block[pred].append(Cmd([cmp_name, '_'], 'cmp', None, [arg, '0']))
+            phi_args += [pred, cmp_name]
+        (result,) = phi.results
+        phis_for_block[defn_blocks[result]].append(
+            Cmd([eq_phis[result]], 'phi', None, phi_args))
+
     for block in blocks:
         block.cmds = [*phis_for_block[block.name], *block.cmds[:-1], *cmps_for_block[block.name], block.cmds[-1]]
 
@@ -804,165 +865,189 @@ def redundant_cmp_zero(blocks):
 
 
 
-def from_ssa(blocks):
-    new_blocks = []
-
-    block_names = set(b.name for b in blocks)
-    phi_headers = {}
-
-    for block in blocks:
-        copies_for_predecessor = {}
-
-        cmds = []
-        for cmd in block.cmds:
-            if cmd.op != 'phi':
-                cmds.append(cmd)
-                continue
-            for i in range(0, len(cmd.args), 2):
-                pred = cmd.args[i]
-                arg = cmd.args[i+1]
-                if pred not in copies_for_predecessor:
-                    copies_for_predecessor[pred] = []
-                copies_for_predecessor[pred].append(Cmd(cmd.results, 'copy', None, [arg]))
-        block.cmds = cmds
-
-        for pred, copies in copies_for_predecessor.items():
-            name = new_name(f'{block.name}_from_{pred}', block_names)
-            br = Cmd([], 'br', None, [block.name])
-            header = Block(name, [*copies, br])
-            phi_headers[pred, block.name] = header
-            new_blocks.append(header)
-        new_blocks.append(block)
-
-    for block in blocks:
-        term = block.cmds[-1]
-        if term.op == 'rts':
-            continue
-        if term.op == 'br':
-            if len(term.args) == 1:
-                if (block.name, term.args[0]) in phi_headers:
-                    term.args[0] = phi_headers[block.name, term.args[0]].name
-            else:
-                if (block.name, term.args[1]) in phi_headers:
-                    term.args[1] = phi_headers[block.name, term.args[1]].name
-                if (block.name, term.args[2]) in phi_headers:
-                    term.args[2] = phi_headers[block.name, term.args[2]].name
-        else:
-            assert term.op == 'jsr'
-            if (block.name, term.args[0]) in phi_headers:
-                header = phi_headers[block.name, term.args[0]]
-                block.cmds[-1] = Cmd([], 'br', None, [header.name])
-                header.cmds[-1] = term
-
-    blocks.clear()
-    blocks.extend(new_blocks)
-
-
+# The live sets of every block, across br, jsr and rts edges alike.
 def compute_blocks_live_sets(blocks):
-    live_ins = {}
-    live_outs = {}
-
-    defns = get_blocks_definitions(blocks)
-    blocks_by_name = {}
-
-    for block in blocks:
-        blocks_by_name[block.name] = block
-        live_ins[block.name] = set()
-        live_outs[block.name] = set()
-
-    fixed = False
-    while not fixed:
-        fixed = True
-
-        for block in blocks:
-            def successors():
-                term = block.cmds[-1]
-                if term.op == 'br':
-                    if len(term.args) == 1:
-                        return term.args
-                    else:
-                        return term.args[1:]
-                else:
-                    # TODO: JSR, RTS
-                    return []
-
-            for succ in successors():
-                if not (live_ins[succ] <= live_outs[block.name]):
-                    fixed = False
-                    live_outs[block.name] |= live_ins[succ]
-
-                for cmd in blocks_by_name[succ].cmds:
-                    if cmd.op != 'phi':
-                        break
-                    for i in range(0, len(cmd.args), 2):
-                        b = cmd.args[i]
-                        arg = cmd.args[i+1]
-                        if b == block.name and arg in defns and arg not in live_outs[block.name]:
-                            fixed = False
-                            live_outs[block.name].add(arg)
-
-            live = copy.deepcopy(live_outs[block.name])
-            for cmd in reversed(block.cmds):
-                live -= set(cmd.results)
-                if cmd.op != 'phi':
-                    live |= set(cmd.args) & defns
-            if live != live_ins[block.name]:
-                fixed = False
-                live_ins[block.name] = live
-
-    return live_ins, live_outs
-
-
-funcs = parse()
-
-for func in funcs:
-    to_ssa(func.blocks)
+    return compute_liveness(blocks, get_blocks_definitions(blocks))
+
+
+PASSES = {
+    'to_ssa': to_ssa,
+    'lower_cmp': lower_cmp,
+    'legalize': legalize,
+    'add_z_results': add_z_results,
+    'const_adc': const_adc,
+    'ge_zero': ge_zero,
+    'const_and': const_and,
+    'redundant_cmp_zero': redundant_cmp_zero,
+    'sccp': sccp,
+    'remove_copies': remove_copies,
+    'cse': cse,
+    'combine_branches': combine_branches,
+    'push_down_unique_uses': push_down_unique_uses,
+    'from_ssa': from_ssa,
+}
+
+# The dominator tree, from the edges of the CFG analysis.
+@declare(uses=['cfg'])
+def cfg_dominator_tree(blocks, cfg=None):
+    return DominatorTree(blocks, effective_predecessors(blocks, cfg))
+
+
+ANALYSES = {
+    'defns': get_blocks_definitions,
+    'cfg': CFG,
+    'dom_tree': cfg_dominator_tree,
+    'live_sets': compute_blocks_live_sets,
+}
+
+# The passes run on the merged program unless --passes or --pipeline is given.
+DEFAULT_PIPELINE = """
+cmp_zero = redundant_cmp_zero
+
+to_ssa lower_cmp legalize add_z_results
+sccp
+cmp_zero remove_copies
+cse
+combine_branches
+push_down_unique_uses
+"""
+
+
+# The per-function stage before merging: conversion to SSA form, the live sets
+# of each block and, given the recursive callees of each function, the breaking
+# of live ranges across recursive calls.
+def prepare_func(func, engine, recursive_callees=None):
+    to_ssa(func.blocks, engine=engine)
     compute_live_sets(func)
+    if recursive_callees is not None:
+        break_live_ranges(func, recursive_callees[func.name])
+
+
+# The modules whose code parses and prepares functions. Cached prepared
+# functions are keyed on their source, so that changing any of them doesn't
+# leave stale IR in a cache.
+PREPARE_MODULES = ['alpha', 'callgraph', 'cfg', 'common', 'def_use', 'dominance',
+                   'ir_cache', 'liveness', 'parse', 'scc', 'to_ssa']
+
+
+@lru_cache(maxsize=None)
+def prepare_code_version():
+    here = os.path.dirname(os.path.abspath(__file__))
+    return ir_cache.code_version(
+        os.path.join(here, f'{name}.py') for name in PREPARE_MODULES)
+
+
+# Parse the input files, convert each function to SSA form and compute its
+# live sets, running jobs functions at a time. With a cache_dir, the result is
+# saved there and reused by later runs on the same input text with the same
+# engine and the same code.
+def load_ssa_funcs(files, engine, cache_dir=None, jobs=1):
+    if cache_dir is not None and files:
+        key = ir_cache.source_key(files, 'ssa', engine, prepare_code_version())
+        path = ir_cache.cache_path(cache_dir, key)
+        try:
+            return ir_cache.load(path, key)
+        except (OSError, ir_cache.CacheError):
+            pass
+
+    funcs = map_funcs(partial(prepare_func, engine=engine), parse(files), jobs)
+
+    if cache_dir is not None and files:
+        os.makedirs(cache_dir, exist_ok=True)
+        ir_cache.dump(funcs, path, key)
+    return funcs
+
+
+# Like load_ssa_funcs followed by break_live_ranges_across_recursive_calls,
+# but with each function's result saved in a FuncCache and reused while the
+# function's text, the engine, its recursive callees and the code that prepares
+# it stay the same. The cache's hit and miss counts are kept in its directory.
+def load_funcs_cached(files, engine, cache, jobs=1):
+    funcs = parse(files)
+    call_graph = CallGraph(funcs)
+    recursive_callees = {f.name: call_graph.recursive_callees(f.name) for f in funcs}
+    keys = [cache.key(f, engine, recursive_callees[f.name], prepare_code_version())
+            for f in funcs]
+    cached = [cache.get(key) for key in keys]
+
+    misses = [f for f, c in zip(funcs, cached) if c is None]
+    compiled = iter(map_funcs(
+        partial(prepare_func, engine=engine, recursive_callees=recursive_callees),
+        misses, jobs))
+    funcs = []
+    for key, func in zip(keys, cached):
+        if func is None:
+            func = next(compiled)
+            cache.put(key, func)
+        funcs.append(func)
+    cache.close()
+    return funcs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    pipeline = parser.add_mutually_exclusive_group()
+    pipeline.add_argument('--passes', help='pipeline text, with ";" between lines')
+    pipeline.add_argument('--pipeline', type=argparse.FileType('r'),
+                          help='file containing pipeline text')
+    parser.add_argument('--ssa-engine', choices=['braun', 'cytron'], default='braun',
+                        help='SSA construction used on each function before merging')
+    cache = parser.add_mutually_exclusive_group()
+    cache.add_argument('--ir-cache', metavar='DIR',
+                       help='directory caching the IR of input files after to_ssa')
+    cache.add_argument('--func-cache', metavar='DIR',
+                       help='directory caching each function before merging')
+    parser.add_argument('--func-cache-size', type=int, default=DEFAULT_MAX_BYTES,
+                        metavar='BYTES', help='bytes kept in the function cache')
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                        help='processes for the per-function stage before merging '
+                             '(0 for one per CPU)')
+    parser.add_argument('--profile', type=argparse.FileType('w'), metavar='FILE',
+                        help='write a JSON report of the time, IR size and peak '
+                             'traced memory of each pass to FILE, and a summary '
+                             'to stderr')
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    profile = PassProfile() if args.profile is not None else None
+    manager = PassManager(PASSES, ANALYSES, profile=profile)
+    steps = manager.parse(DEFAULT_PIPELINE)
+    try:
+        if args.passes is not None:
+            steps = manager.parse(args.passes)
+        elif args.pipeline is not None:
+            steps = manager.parse(args.pipeline.read())
+    except PipelineError as e:
+        parser.error(e)
+
+    with measure(profile, 'prepare_funcs'):
+        if args.func_cache is not None:
+            cache = FuncCache(args.func_cache, args.func_cache_size)
+            funcs = load_funcs_cached(args.files, args.ssa_engine, cache, args.jobs)
+        else:
+            funcs = load_ssa_funcs(args.files, args.ssa_engine, args.ir_cache,
+                                   args.jobs)
+            break_live_ranges_across_recursive_calls(funcs)
 
-break_live_ranges_across_recursive_calls(funcs)
-
-blocks = merge_all_funcs(funcs)
-
-to_ssa(blocks)
-lower_cmp(blocks)
-lower_16(blocks)
-add_z_results(blocks)
-
-fixed = False
-while not fixed:
-    fixed = True
-    fixed &= const_adc(blocks)
-    fixed &= ge_zero(blocks)
-    fixed &= const_and(blocks)
-
-fixed = False
-while not fixed:
-    fixed = True
-    fixed &= redundant_cmp_zero(blocks)
-remove_copies(blocks)
+    with measure(profile, 'merge_all_funcs'):
+        blocks = merge_all_funcs(funcs)
 
-fixed = False
-while not fixed:
-    fixed = True
-    fixed &= cse(blocks)
+    manager.run(blocks, steps)
 
-fixed = False
-while not fixed:
-    fixed = True
-    fixed &= not_br(blocks)
-    fixed &= and_or_br(blocks)
-
-push_down_unique_uses(blocks)
+    if profile is not None:
+        profile.stop()
+        profile.write_json(args.profile)
+        args.profile.close()
+        print(profile.table(), file=sys.stderr)
 
-live_ins, live_outs = compute_blocks_live_sets(blocks)
+    live_ins, live_outs = compute_blocks_live_sets(blocks)
 
-for block in blocks:
-    print(live_ins[block.name])
-    print(block)
-    print(live_outs[block.name])
-    print()
+    for block in blocks:
+        print(live_ins[block.name])
+        print(block)
+        print(live_outs[block.name])
+        print()
 
-# from_ssa(blocks)
 
-# for block in blocks:
-#     print(block)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+from alpha import combine_branches, get_blocks_definitions, legalize
+from alpha import break_live_ranges_across_recursive_calls, cse, prepare_func
+from alpha import redundant_cmp_zero
+
+import unittest
+from textwrap import dedent
+
+from common import strcat
+from parse import parse_lines
+
+
+class TestBreakLiveRanges(unittest.TestCase):
+  # x is saved for the second call, so it is live across the first.
+  def test_saved_across_earlier_call(self):
+    funcs = parse_lines("""
+      f
+        inputs n
+        start
+          x = add n 1
+          a = call f n
+          b = call f a
+          c = add x b
+          ret c
+      end
+    """)
+    for func in funcs:
+      prepare_func(func, 'braun')
+    break_live_ranges_across_recursive_calls(funcs)
+    self.assertEqual(strcat(*funcs[0].blocks), dedent("""\
+      start
+        x = add n 1
+        save x
+        a = call f n
+        x1 = restore
+        save x1
+        b = call f a
+        x2 = restore
+        c = add x2 b
+        ret c
+    """))
+
+
+class TestCombineBranches(unittest.TestCase):
+  def test_nested_conditions(self):
+    (func,) = parse_lines("""
+      main
+        inputs a b c d
+        start
+          x = not a
+          y = or b x
+          z = and y c
+          w = not z
+          v = and w d
+          br v yes no
+        yes
+          u = and a b
+          br u start no
+        no
+          ret
+      end
+    """)
+    combine_branches(func.blocks)
+    self.assertEqual(strcat(*func.blocks), dedent("""\
+      start
+        br b start2 start3
+      start3
+        br a start1 start2
+      start2
+        br c no start1
+      start1
+        br d yes no
+      yes
+        br a yes1 no
+      yes1
+        br b start no
+      no
+        ret
+    """))
+
+  def test_shared_condition_kept(self):
+    (func,) = parse_lines("""
+      main
+        inputs a b
+        start
+          x = not a
+          y = and x b
+          br y left right
+        left
+          ret x
+        right
+          ret
+      end
+    """)
+    combine_branches(func.blocks)
+    self.assertEqual(strcat(*func.blocks), dedent("""\
+      start
+        x = not a
+        br x start1 right
+      start1
+        br b left right
+      left
+        ret x
+      right
+        ret
+    """))
+
+  def test_phis_in_targets(self):
+    (func,) = parse_lines("""
+      main
+        inputs a b
+        start
+          y = and a b
+          br y left right
+        left
+          p = phi start 1
+          ret p
+        right
+          q = phi start 2
+          ret q
+      end
+    """)
+    combine_branches(func.blocks)
+    self.assertEqual(strcat(*func.blocks), dedent("""\
+      start
+        br a start1 right
+      start1
+        br b left right
+      left
+        p = phi start1 1
+        ret p
+      right
+        q = phi start 2 start1 2
+        ret q
+    """))
+
+
+class TestCse(unittest.TestCase):
+  # b is only found redundant after p is numbered, which makes p the same
+  # as q, and then r the same as s.
+  def test_back_edge_phi(self):
+    (func,) = parse_lines("""
+      main
+        inputs n
+        start
+          br loop
+        loop
+          p = phi start 0 loop b
+          q = phi start 0 loop a
+          s = add q 1
+          r = add p 1
+          a = add n 1
+          b = add n 1
+          c = eq r 9
+          br c loop done
+        done
+          ret s r
+      end
+    """)
+    cse(func.blocks)
+    self.assertEqual(strcat(*func.blocks), dedent("""\
+      start
+        br loop
+      loop
+        p = phi loop a start 0
+        s = add p 1
+        a = add n 1
+        c = eq s 9
+        br c loop done
+      done
+        ret s s
+    """))
+
+
+class TestLegalize(unittest.TestCase):
+  def lower(self, text):
+    (func,) = parse_lines(text)
+    defns = get_blocks_definitions(func.blocks)
+    defns |= set(func.inputs)
+    legalize(func.blocks, defns)
+    return strcat(*func.blocks)
+
+  def test_long_add_chains_carries(self):
+    self.assertEqual(self.lower("""
+      main
+        inputs a
+        start
+          b = add4 a 0x10203
+          ret
+      end
+    """), dedent("""\
+      start
+        b_b0 carry = adc a_b0 3 0
+        b_b1 carry1 = adc a_b1 2 carry
+        b_b2 carry2 = adc a_b2 1 carry1
+        b_b3 _ = adc a_b3 0 carry2
+        ret
+    """))
+
+  def test_long_ge(self):
+    self.assertEqual(self.lower("""
+      main
+        inputs a b
+        start
+          c = ge4 a b
+          br c start start
+      end
+    """), dedent("""\
+      start
+        eq_b3 ge_b3 = cmp a_b3 b_b3
+        eq_b2 ge_b2 = cmp a_b2 b_b2
+        eq_b1 ge_b1 = cmp a_b1 b_b1
+        _ ge_b0 = cmp a_b0 b_b0
+        ne_b1 = not eq_b1
+        t = or ne_b1 ge_b0
+        t1 = and ge_b1 t
+        ne_b2 = not eq_b2
+        t2 = or ne_b2 t1
+        t3 = and ge_b2 t2
+        ne_b3 = not eq_b3
+        t4 = or ne_b3 t3
+        c = and ge_b3 t4
+        br c start start
+    """))
+
+  def test_store_in_one_pass(self):
+    self.assertEqual(self.lower("""
+      main
+        inputs p v
+        start
+          store2 p v
+          ret
+      end
+    """), dedent("""\
+      start
+        store p_lo p_hi v_lo
+        next_addr_lo carry = adc p_lo 1 0
+        next_addr_hi _ = adc p_hi 0 carry
+        store next_addr_lo next_addr_hi v_hi
+        ret
+    """))
+
+  def test_phi_web_save_restore(self):
+    self.assertEqual(self.lower("""
+      main
+        start
+          br loop
+        loop
+          x = phi start 0 loop z
+          save x
+          y = restore
+          z = phi loop y
+          w = add4 z 1
+          br loop
+      end
+    """), dedent("""\
+      start
+        br loop
+      loop
+        x_b0 = phi loop z_b0 start 0
+        x_b1 = phi loop z_b1 start 0
+        x_b2 = phi loop z_b2 start 0
+        x_b3 = phi loop z_b3 start 0
+        save x_b0
+        save x_b1
+        save x_b2
+        save x_b3
+        y_b3 = restore
+        y_b2 = restore
+        y_b1 = restore
+        y_b0 = restore
+        z_b0 = phi loop y_b0
+        z_b1 = phi loop y_b1
+        z_b2 = phi loop y_b2
+        z_b3 = phi loop y_b3
+        w_b0 carry = adc z_b0 1 0
+        w_b1 carry1 = adc z_b1 0 carry
+        w_b2 carry2 = adc z_b2 0 carry1
+        w_b3 _ = adc z_b3 0 carry2
+        br loop
+    """))
+
+
+  def test_byte_save_restore_kept_grouped(self):
+    self.assertEqual(self.lower("""
+      main
+        inputs a b
+        start
+          save a b
+          c d = restore
+          ret c d
+      end
+    """), dedent("""\
+      start
+        save a b
+        c d = restore
+        ret c d
+    """))
+
+class TestRedundantCmpZero(unittest.TestCase):
+  def test_phi_in_other_block(self):
+    (func,) = parse_lines("""
+      main
+        inputs a b
+        start
+          br b left join
+        left
+          br join
+        join
+          y = phi start a left 1
+          br next
+        next
+          c _ = cmp y 0
+          ret c
+      end
+    """)
+    self.assertFalse(redundant_cmp_zero(func.blocks))
+    self.assertEqual(strcat(*func.blocks), dedent("""\
+      start
+        a_eq _ = cmp a 0
+        br b left join
+      left
+        1_eq _ = cmp 1 0
+        br join
+      join
+        y_eq = phi left 1_eq start a_eq
+        y = phi left 1 start a
+        br next
+      next
+        c = copy y_eq
+        ret c
+    """))
+
+  def test_phi_cycle(self):
+    (func,) = parse_lines("""
+      main
+        inputs a
+        start
+          x _ _ = adc a 1 0
+          br loop
+        loop
+          y = phi start x body z
+          c _ = cmp y 0
+          br c body done
+        body
+          z = phi loop y
+          br loop
+        done
+          ret
+      end
+    """)
+    self.assertFalse(redundant_cmp_zero(func.blocks))
+    self.assertTrue(redundant_cmp_zero(func.blocks))
+    self.assertEqual(strcat(*func.blocks), dedent("""\
+      start
+        x _ eq = adc a 1 0
+        x_eq = copy eq
+        br loop
+      loop
+        y_eq = phi body z_eq start x_eq
+        y = phi body z start x
+        c = copy y_eq
+        br c body done
+      body
+        z_eq = phi loop y_eq
+        z = phi loop y
+        br loop
+      done
+        ret
+    """))
+
+  def test_undef(self):
+    (func,) = parse_lines("""
+      main
+        start
+          c _ = cmp undef 0
+          ret c
+      end
+    """)
+    self.assertTrue(redundant_cmp_zero(func.blocks))
+    self.assertEqual(strcat(*func.blocks), dedent("""\
+      start
+        c = copy undef
+        ret c
+    """))
+
+  def test_ge_used(self):
+    (func,) = parse_lines("""
+      main
+        inputs a
+        start
+          c g = cmp a 0
+          ret c g
+      end
+    """)
+    self.assertTrue(redundant_cmp_zero(func.blocks))
+    self.assertEqual(strcat(*func.blocks), dedent("""\
+      start
+        c g = cmp a 0
+        ret c g
+    """))
@@ -0,0 +1,207 @@
+import argparse
+import gc
+import json
+import math
+import statistics
+import sys
+import time
+
+from alpha import ANALYSES, DEFAULT_PIPELINE, PASSES, cfg_dominator_tree
+from alpha import break_live_ranges_across_recursive_calls, merge_all_funcs
+from alpha import prepare_func
+from cfg import CFG
+from common import Func
+from gen_ir import GenConfig, generate_program
+import ir_cache
+from parse import parse_lines
+from passes import PassManager
+
+# Times each stage of alpha.py on generated programs of growing size and fits
+# a scaling exponent to each: the k in time ~ size^k, with size the number of
+# commands the stage is given. (Earlier stages grow the program by different
+# amounts at different sizes, so the size of the generated program would
+# misstate the scaling of later ones.) A linear pass has k near 1 and a
+# quadratic one near 2. The exponents can be saved as a baseline, and later
+# runs compared against it, failing if any stage scales worse by more than a
+# tolerance.
+#
+# Each stage is run on copies of its input, restored from an ir_cache
+# snapshot, at least MIN_RUNS times and until the runs add up to min_time, and
+# the median run is kept. A single run, or the fastest of a few, lets one
+# lucky or unlucky size tilt the fitted line by more than the tolerance. As
+# with timeit, the garbage collector is off while a stage runs, since its
+# collections take time proportional to everything allocated so far.
+#
+# A baseline is only saved if every stage scales no worse than MAX_LINEAR, so
+# it can't record a superlinear stage as the reference to hold later runs to.
+# A stage missing from the baseline fails if it scales worse than MAX_LINEAR.
+
+SIZES = (50, 100, 200, 400)
+MIN_TIME = 0.5
+MIN_RUNS = 5
+MAX_LINEAR = 1.5
+
+
+# The median of runs of run on copies of funcs, repeated at least MIN_RUNS
+# times and until they add up to min_time, and the functions the last run
+# left.
+def time_stage(run, funcs, min_time):
+    snapshot = ir_cache.dumps(funcs, bytes(32))
+    runs = []
+    while True:
+        funcs = ir_cache.loads(snapshot)
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run(funcs)
+            seconds = time.perf_counter() - start
+        finally:
+            gc.enable()
+        runs.append(seconds)
+        if len(runs) >= MIN_RUNS and sum(runs) >= min_time:
+            return statistics.median(runs), funcs
+
+
+def count_cmds(funcs):
+    return sum(len(b.cmds) for f in funcs for b in f.blocks)
+
+
+# The time each stage of the pipeline takes on the program text, and the
+# number of commands it is given.
+def time_pipeline(text, pipeline, min_time):
+    manager = PassManager(PASSES, ANALYSES)
+    steps = manager.parse(pipeline)
+    times = {}
+    sizes = {}
+
+    def stage(name, run, funcs):
+        sizes.setdefault(name, count_cmds(funcs))
+        seconds, funcs = time_stage(run, funcs, min_time)
+        times[name] = times.get(name, 0.0) + seconds
+        return funcs
+
+    def prepare(funcs):
+        for func in funcs:
+            prepare_func(func, 'braun')
+
+    funcs = stage('to_ssa+live_sets', prepare, parse_lines(text))
+    funcs = stage('break_live_ranges', break_live_ranges_across_recursive_calls,
+                  funcs)
+    funcs = [Func('merged', [], merge_all_funcs(funcs))]
+    funcs = stage(
+        'dom_tree',
+        lambda funcs: cfg_dominator_tree(funcs[0].blocks, CFG(funcs[0].blocks)),
+        funcs)
+    for step in steps:
+        funcs = stage(step, lambda funcs: manager.run(funcs[0].blocks, [step]),
+                      funcs)
+    return times, sizes
+
+
+# The least squares slope of log(seconds) against log(size).
+def fit_exponent(sizes, seconds):
+    xs = [math.log(n) for n in sizes]
+    ys = [math.log(max(s, 1e-9)) for s in seconds]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    return sxy / sxx
+
+
+def run(config, sizes, pipeline, min_time):
+    cmds = []
+    times = {}
+    stage_cmds = {}
+    for blocks in sizes:
+        config.blocks = blocks
+        text = generate_program(config)
+        cmds.append(count_cmds(parse_lines(text)))
+        stage_times, stage_sizes = time_pipeline(text, pipeline, min_time)
+        for name, s in stage_times.items():
+            times.setdefault(name, []).append(s)
+            stage_cmds.setdefault(name, []).append(stage_sizes[name])
+        print(f'{blocks} blocks per function: {cmds[-1]} commands', file=sys.stderr)
+
+    exponents = {name: fit_exponent(stage_cmds[name], seconds)
+                 for name, seconds in times.items()}
+    return cmds, times, exponents
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Fit how the time of each pass scales with program size.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='blocks per function of each program')
+    parser.add_argument('--funcs', type=int, default=4)
+    parser.add_argument('--loop-depth', type=int, default=2)
+    parser.add_argument('--vars', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-time', type=float, default=MIN_TIME,
+                        help='seconds to spend timing each stage at each size')
+    parser.add_argument('--passes', default=DEFAULT_PIPELINE,
+                        help='pipeline text, with ";" between lines')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the exponents as a baseline')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='compare the exponents against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='how much larger an exponent may be than its baseline')
+    args = parser.parse_args()
+
+    if len(args.sizes) < 2:
+        parser.error('at least two sizes are needed to fit an exponent')
+    config = GenConfig(funcs=args.funcs, loop_depth=args.loop_depth,
+                       num_vars=args.vars, seed=args.seed)
+    cmds, times, exponents = run(config, args.sizes, args.passes, args.min_time)
+
+    settings = {'sizes': list(args.sizes), 'funcs': args.funcs,
+                'loop_depth': args.loop_depth, 'vars': args.vars,
+                'seed': args.seed, 'passes': args.passes}
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        baseline = saved['exponents']
+        if saved['settings'] != settings:
+            print(f'warning: {args.baseline} was saved with other settings',
+                  file=sys.stderr)
+
+    regressions = []
+    width = max(len(name) for name in times)
+    print(f'{"pass":{width}} ' + ' '.join(f'{n:>9}' for n in cmds)
+          + f' {"exponent":>9} {"baseline":>9}')
+    for name, seconds in times.items():
+        k = exponents[name]
+        base = baseline.get(name)
+        line = f'{name:{width}} ' + ' '.join(f'{s:9.4f}' for s in seconds)
+        line += f' {k:9.2f} {"-" if base is None else f"{base:.2f}":>9}'
+        if base is not None:
+            regressed = k > base + args.tolerance
+        else:
+            regressed = args.baseline is not None and k > MAX_LINEAR
+        if regressed:
+            regressions.append(name)
+            line += '  REGRESSION'
+        elif k > MAX_LINEAR:
+            line += '  superlinear'
+        print(line)
+
+    if args.save is not None:
+        worse = [n for n, k in exponents.items() if k > MAX_LINEAR]
+        if worse:
+            print(f'not saving {args.save}: superlinear stages: '
+                  f'{", ".join(worse)}', file=sys.stderr)
+            sys.exit(1)
+        with open(args.save, 'w') as f:
+            json.dump({'settings': settings, 'commands': cmds,
+                       'exponents': exponents}, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if regressions:
+        print(f'scaling regressions: {", ".join(regressions)}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
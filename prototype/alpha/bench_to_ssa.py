@@ -0,0 +1,55 @@
+import argparse
+import random
+import time
+
+from parse import parse_lines
+from to_ssa import to_ssa
+
+
+# A random function with the given number of blocks and variables. Each block
+# reassigns a few variables and then branches forward, or back to make loops.
+def random_func(num_blocks, num_vars, seed):
+    rng = random.Random(seed)
+    lines = ['main', 'b0']
+    lines += [f'v{i} = copy 0' for i in range(num_vars)]
+    lines.append('br b1')
+    for i in range(1, num_blocks):
+        lines.append(f'b{i}')
+        for _ in range(rng.randrange(4)):
+            dst = rng.randrange(num_vars)
+            src = rng.randrange(num_vars)
+            lines.append(f'v{dst} = add v{src} 1')
+        if i == num_blocks - 1:
+            lines.append('ret ' + ' '.join(f'v{j}' for j in range(num_vars)))
+            continue
+        other = rng.randrange(1, num_blocks)
+        lines.append(f'c = lt v{rng.randrange(num_vars)} 10')
+        lines.append(f'br c b{i+1} b{other}')
+    lines.append('end')
+    (func,) = parse_lines('\n'.join(lines))
+    return func
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the SSA construction engines of to_ssa.')
+    parser.add_argument('--blocks', type=int, default=2000)
+    parser.add_argument('--vars', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for engine in ('braun', 'cytron'):
+        best = None
+        for _ in range(args.repeat):
+            func = random_func(args.blocks, args.vars, args.seed)
+            start = time.perf_counter()
+            to_ssa(func.blocks, engine=engine)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        phis = sum(cmd.op == 'phi' for b in func.blocks for cmd in b.cmds)
+        print(f'{engine:8} {best:8.3f}s {phis:8} phis')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+from scc import strongly_connected_components
+
+CALL_OPS = ('call', 'jsr')
+
+
+# The call graph of a list of functions, from their call and jsr commands.
+#
+# Functions that call each other, directly or not, form a strongly connected
+# component. sccs lists the components bottom up: each one comes after every
+# component it calls into, so interprocedural passes can visit callees before
+# their callers. Callees outside of the functions given, such as runtime
+# routines, get components of their own.
+class CallGraph:
+    def __init__(self, funcs):
+        self.callees = {}
+        for func in funcs:
+            # A dict keeps the callees in order of first call.
+            callees = {}
+            for block in func.blocks:
+                for cmd in block.cmds:
+                    if cmd.op in CALL_OPS:
+                        callees[cmd.args[0]] = None
+            self.callees[func.name] = list(callees)
+        self.sccs = strongly_connected_components(
+            self.callees, lambda name: self.callees.get(name, ()))
+        self.scc_of = {}
+        for scc in self.sccs:
+            for name in scc:
+                self.scc_of[name] = scc
+
+    # Whether a call from caller to callee can reach caller again before it
+    # returns.
+    def is_recursive_call(self, caller, callee):
+        return self.scc_of[caller] is self.scc_of.get(callee)
+
+    # Whether a function can call itself.
+    def is_recursive(self, name):
+        return len(self.scc_of[name]) > 1 or name in self.callees.get(name, ())
+
+    # The functions that name calls and that can call it again.
+    def recursive_callees(self, name):
+        return [callee for callee in self.callees[name]
+                if self.is_recursive_call(name, callee)]
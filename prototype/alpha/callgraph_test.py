@@ -0,0 +1,53 @@
+from callgraph import CallGraph
+
+import unittest
+
+from parse import parse_lines
+
+
+TEXT = """
+  main
+    start
+      a = call even 10
+      b = call print a
+      ret b
+  end
+  even
+    inputs n
+    start
+      r = call odd n
+      ret r
+  end
+  odd
+    inputs n
+    start
+      r = call even n
+      ret r
+  end
+  fact
+    inputs n
+    start
+      r = call fact n
+      ret r
+  end
+"""
+
+
+class TestCallGraph(unittest.TestCase):
+  def test_sccs(self):
+    graph = CallGraph(parse_lines(TEXT))
+    self.assertEqual(graph.sccs,
+                     [['even', 'odd'], ['print'], ['main'], ['fact']])
+    self.assertEqual(graph.callees['main'], ['even', 'print'])
+
+  def test_recursion(self):
+    graph = CallGraph(parse_lines(TEXT))
+    self.assertTrue(graph.is_recursive_call('even', 'odd'))
+    self.assertTrue(graph.is_recursive_call('fact', 'fact'))
+    self.assertFalse(graph.is_recursive_call('main', 'even'))
+    self.assertFalse(graph.is_recursive_call('main', 'print'))
+    self.assertEqual(
+        [f for f in ['main', 'even', 'odd', 'fact'] if graph.is_recursive(f)],
+        ['even', 'odd', 'fact'])
+    self.assertEqual(graph.recursive_callees('even'), ['odd'])
+    self.assertEqual(graph.recursive_callees('main'), [])
@@ -0,0 +1,65 @@
+from common import successor_names
+
+
+# Passes that leave the control flow graph unchanged preserve these analyses.
+CFG_ANALYSES = ('cfg', 'dom_tree')
+
+
+# The control flow graph of a list of blocks.
+#
+# Each block gets succs and preds lists of the blocks it branches to and is
+# branched to from. Each neighbour is listed once, successors in terminator
+# order and predecessors in the order their edges were added. Blocks are also
+# indexed by name. The edges stay up to date as long as terminators are only
+# changed and blocks only added or removed through the methods below, so
+# passes that reshape the graph don't have to rescan every terminator.
+class CFG:
+    def __init__(self, blocks):
+        self.blocks_by_name = {b.name: b for b in blocks}
+        for block in blocks:
+            block.succs = []
+            block.preds = []
+        for block in blocks:
+            self._link(block)
+
+    def block(self, name):
+        return self.blocks_by_name[name]
+
+    # Replace the terminator of a block.
+    def set_terminator(self, block, term):
+        self._unlink(block)
+        block.cmds[-1] = term
+        self._link(block)
+
+    # Re-read the edges out of a block after its terminator was changed in
+    # place.
+    def update(self, block):
+        self._unlink(block)
+        self._link(block)
+
+    # Add a block, which may only branch to blocks already in the graph.
+    def add(self, block):
+        self.blocks_by_name[block.name] = block
+        block.succs = []
+        block.preds = []
+        self._link(block)
+
+    # Remove blocks that no block outside of them still branches to.
+    def remove_all(self, blocks):
+        for block in blocks:
+            self._unlink(block)
+        for block in blocks:
+            assert not block.preds, (block.name, [p.name for p in block.preds])
+            del self.blocks_by_name[block.name]
+
+    def _link(self, block):
+        for name in successor_names(block):
+            succ = self.blocks_by_name[name]
+            if succ not in block.succs:
+                block.succs.append(succ)
+                succ.preds.append(block)
+
+    def _unlink(self, block):
+        for succ in block.succs:
+            succ.preds.remove(block)
+        block.succs = []
@@ -0,0 +1,91 @@
+from cfg import CFG
+
+import unittest
+
+from common import Block, Cmd
+from parse import parse_lines
+from sccp import sccp
+
+
+def parse_blocks(text):
+  (func,) = parse_lines(text)
+  return func.blocks
+
+
+def edges(blocks):
+  return {b.name: ([s.name for s in b.succs], [p.name for p in b.preds])
+          for b in blocks}
+
+
+class TestCFG(unittest.TestCase):
+  def setUp(self):
+    self.blocks = parse_blocks("""
+      main
+        start
+          br c left right
+        left
+          br c join join
+        right
+          jsr foo right_ret
+        right_ret
+          br join
+        join
+          ret
+        foo
+          rts right_ret
+      end
+    """)
+    self.cfg = CFG(self.blocks)
+
+  def test_edges(self):
+    self.assertEqual(edges(self.blocks), {
+        'start': (['left', 'right'], []),
+        'left': (['join'], ['start']),
+        'right': (['foo'], ['start']),
+        'right_ret': (['join'], ['foo']),
+        'join': ([], ['left', 'right_ret']),
+        'foo': (['right_ret'], ['right']),
+    })
+    self.assertIs(self.cfg.block('join'), self.blocks[4])
+
+  def test_update(self):
+    start, left = self.blocks[:2]
+    start.cmds[-1].args = ['join']
+    self.cfg.update(start)
+    self.cfg.set_terminator(left, Cmd([], 'ret', None, []))
+    self.assertEqual(edges(self.blocks)['start'], (['join'], []))
+    self.assertEqual(edges(self.blocks)['left'], ([], []))
+    self.assertEqual(edges(self.blocks)['join'], ([], ['right_ret', 'start']))
+
+  def test_add_and_remove(self):
+    start, left = self.blocks[:2]
+    new = Block('new', [Cmd([], 'br', None, ['join'])])
+    self.cfg.add(new)
+    start.cmds[-1].args = ['c', 'new', 'right']
+    self.cfg.update(start)
+    self.cfg.remove_all([left])
+    self.assertEqual(edges([new])['new'], (['join'], ['start']))
+    self.assertEqual(edges(self.blocks)['join'], ([], ['right_ret', 'new']))
+    self.assertNotIn('left', self.cfg.blocks_by_name)
+
+  def test_sccp_keeps_cfg(self):
+    blocks = parse_blocks("""
+      main
+        start
+          br 0 call done
+        call
+          jsr foo call_ret
+        call_ret
+          br done
+        done
+          ret
+        foo
+          rts call_ret
+      end
+    """)
+    cfg = CFG(blocks)
+    sccp(blocks, cfg=cfg)
+    updated = edges(blocks)
+    CFG(blocks)
+    self.assertEqual(updated, edges(blocks))
+    self.assertEqual(list(cfg.blocks_by_name), ['start', 'done'])
@@ -1,11 +1,15 @@
 from attr import attrs, attrib, Factory
-from collections import defaultdict
 from operator import itemgetter
-import itertools
+import sys
 import textwrap
 
+from def_use import is_use
 
-@attrs
+
+# The IR classes are slotted, so the many commands and blocks of a merged
+# program carry no per-instance __dict__. Passes rewrite commands in place
+# where they can rather than allocating replacements.
+@attrs(slots=True)
 class Func:
     name = attrib()
     inputs = attrib()
@@ -17,22 +21,31 @@ class Func:
         return f'{self.name}\n{body}end\n'
 
 
-@attrs(cmp=False)
+# succs and preds are the blocks' edges in the control flow graph. They are
+# only filled in and kept up to date by a cfg.CFG built over the blocks.
+# live_in and live_out are set by compute_live_sets.
+@attrs(cmp=False, slots=True)
 class Block:
     name = attrib()
     cmds = attrib(repr=False)
+    succs = attrib(default=Factory(list), repr=False)
+    preds = attrib(default=Factory(list), repr=False)
+    live_in = attrib(default=None, repr=False)
+    live_out = attrib(default=None, repr=False)
 
     def __str__(self):
         body = textwrap.indent(strcat(*self.cmds), '  ')
         return f'{self.name}\n{body}'
 
 
-@attrs
+# block is the block containing the command, as recorded by def_use.DefUse.
+@attrs(slots=True)
 class Cmd:
     results = attrib()
     op = attrib()
     size = attrib()
     args = attrib()
+    block = attrib(default=None, repr=False, cmp=False, kw_only=True)
 
     def is_terminator(self):
         return self.op in ('br', 'ret', 'jsr', 'rts')
@@ -53,7 +66,7 @@ class Cmd:
         return f'{results_str}{op_str}{args_str}\n'
 
 
-@attrs
+@attrs(slots=True)
 class Asm(Cmd):
     inputs = attrib()
     clobbers = attrib()
@@ -68,7 +81,7 @@ class Asm(Cmd):
         return f'{cmd_str}{body}end\n'
 
 
-@attrs
+@attrs(slots=True)
 class AsmInstr:
     op = attrib()
     args = attrib()
@@ -78,58 +91,74 @@ class AsmInstr:
 
 
 
-def collect_predecessors(blocks):
-    preds = defaultdict(set)
-    for block in blocks:
-        term = block.cmds[-1]
-        if term.op == 'br':
-            if len(term.args) == 1:
-                preds[term.args[0]].add(block)
-            else:
-                preds[term.args[1]].add(block)
-                preds[term.args[2]].add(block)
-        elif term.op == 'jsr':
-            preds[term.args[0]].add(block)
-        elif term.op == 'rts':
-            for a in term.args:
-                preds[a].add(block)
-    return preds
+def successor_names(block):
+    term = block.cmds[-1]
+    if term.op == 'br':
+        if len(term.args) == 1:
+            return [term.args[0]]
+        return [term.args[1], term.args[2]]
+    elif term.op == 'jsr':
+        return [term.args[0]]
+    elif term.op == 'rts':
+        return list(term.args)
+    return []
 
 
+# Replace the uses of each copy's result with the copy's source and remove the
+# copies. Copies are linked into a union-find from result to arg, so a chain of
+# copies resolves to its root source, with paths compressed as they are
+# followed. Operands are rewritten in place.
 def remove_copies(blocks):
-    # Collect and remove copies
-    copies = {}
-    for block in blocks:
-        for cmd in block.cmds:
-            if cmd.op == 'copy':
-                (result,) = cmd.results
-                (arg,) = cmd.args
-                copies[result] = arg
-        block.cmds = list(filter(lambda c: c.op != 'copy', block.cmds))
-
-    is_closed = False
-    while not is_closed:
-        is_closed = True
-        for copy, val in copies.items():
-            if val in copies:
-                copies[copy] = copies[val]
-                is_closed = False
-
-    # Propagate uses of copies
+    source = {}
     for block in blocks:
         for cmd in block.cmds:
-            def relabel(val):
-                if val in copies:
-                    return copies[val]
-                return val
-            cmd.args = list(map(relabel, cmd.args))
-
+            if cmd.op == 'copy' and cmd.results[0] != '_':
+                source[cmd.results[0]] = cmd.args[0]
+    if not source:
+        return
+
+    def find(value):
+        root = value
+        while root in source:
+            root = source[root]
+        while value != root:
+            source[value], value = root, source[value]
+        return root
 
+    for block in blocks:
+        cmds = block.cmds
+        if any(cmd.op == 'copy' for cmd in cmds):
+            cmds[:] = [cmd for cmd in cmds if cmd.op != 'copy']
+        for cmd in cmds:
+            args = cmd.args
+            for i, a in enumerate(args):
+                if a in source and is_use(cmd, i):
+                    args[i] = find(a)
+
+
+# A set of names that also remembers the next numeric suffix to try for each
+# base name given to new_name, so that suffixes already handed out are never
+# probed again.
+class Names(set):
+    def __init__(self, names=()):
+        super().__init__(names)
+        self.next_suffix = {}
+
+
+# Choose the first of name, name1, name2, ... not in defns and add it to defns.
+# Names are interned, so passes comparing and hashing them take the identity
+# fast path.
 def new_name(name, defns):
     if name == '_':
         return name
-    candidates = itertools.chain([name], (f'{name}{n}' for n in itertools.count(1)))
-    chosen = next(c for c in candidates if c not in defns)
+    next_suffix = defns.next_suffix if isinstance(defns, Names) else {}
+    chosen = name
+    n = next_suffix.get(name, 1)
+    while chosen in defns:
+        chosen = f'{name}{n}'
+        n += 1
+    next_suffix[name] = n
+    chosen = sys.intern(chosen)
     defns.add(chosen)
     return chosen
 
@@ -0,0 +1,94 @@
+from common import Block, Cmd, Names, new_name, remove_copies
+
+import unittest
+from textwrap import dedent
+
+from parse import parse_lines
+
+
+class TestIr(unittest.TestCase):
+  def test_slots(self):
+    cmd = Cmd(['a'], 'add', None, ['b', '1'])
+    block = Block('start', [cmd])
+    with self.assertRaises(AttributeError):
+      cmd.extra = 1
+    with self.assertRaises(AttributeError):
+      block.extra = 1
+    self.assertIsNone(cmd.block)
+    self.assertEqual(cmd, Cmd(['a'], 'add', None, ['b', '1'], block=block))
+
+
+class TestNewName(unittest.TestCase):
+  def test_unused_name_is_kept(self):
+    defns = Names()
+    self.assertEqual(new_name('a', defns), 'a')
+    self.assertEqual(defns, {'a'})
+
+  def test_first_free_suffix(self):
+    defns = Names(['a', 'a1', 'a3'])
+    self.assertEqual(new_name('a', defns), 'a2')
+    self.assertEqual(new_name('a', defns), 'a4')
+    self.assertEqual(new_name('a', defns), 'a5')
+
+  def test_suffixes_are_per_base(self):
+    defns = Names(['a', 'b'])
+    self.assertEqual(new_name('a', defns), 'a1')
+    self.assertEqual(new_name('b', defns), 'b1')
+    self.assertEqual(new_name('a1', defns), 'a11')
+    self.assertEqual(new_name('a', defns), 'a2')
+
+  def test_underscore(self):
+    defns = Names(['_'])
+    self.assertEqual(new_name('_', defns), '_')
+
+  def test_plain_set(self):
+    defns = {'a', 'a1'}
+    self.assertEqual(new_name('a', defns), 'a2')
+    self.assertIn('a2', defns)
+
+
+class TestRemoveCopies(unittest.TestCase):
+  def test_chains(self):
+    (func,) = parse_lines("""
+      main
+        start
+          c = copy b
+          b = copy a
+          a = add 1 1
+          d = add c b
+          ret d
+      end
+    """)
+    remove_copies(func.blocks)
+    self.assertMultiLineEqual(str(func), dedent("""\
+      main
+        start
+          a = add 1 1
+          d = add a a
+          ret d
+      end
+    """))
+
+  def test_phi_block_names_kept(self):
+    (func,) = parse_lines("""
+      main
+        start
+          x = copy 1
+          start = copy 2
+          br next
+        next
+          y = phi start x
+          ret y
+      end
+    """)
+    remove_copies(func.blocks)
+    self.assertEqual(str(func.blocks[1]), 'next\n  y = phi start 1\n  ret y\n')
+
+  def test_long_chain(self):
+    n = 10000
+    lines = ['main', 'start', 'v0 = add 1 1']
+    lines += [f'v{i+1} = copy v{i}' for i in range(n)]
+    lines += [f'ret v{n}', 'end']
+    (func,) = parse_lines('\n'.join(lines))
+    remove_copies(func.blocks)
+    self.assertEqual(str(func.blocks[0]), 'start\n  v0 = add 1 1\n  ret v0\n')
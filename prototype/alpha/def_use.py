@@ -0,0 +1,118 @@
+# Def-use and use-def links for the commands in a list of blocks.
+#
+# Values are names, so the links are kept by name: each value maps to its
+# defining command and to the commands that use it, in an insertion-ordered
+# dict keyed by id, so that unlinking a command is constant time however many
+# other commands use the value. Each command also records the block containing
+# it. The links stay up to date as long as commands are only changed through
+# the methods below, so finding or rewriting the uses of a value costs time
+# proportional to its number of uses.
+#
+# The block names in phi arguments are not uses.
+class DefUse:
+    def __init__(self, blocks):
+        self.defs = {}
+        # Map from value to the commands using it, keyed by id.
+        self.users = {}
+        # Number of times each value appears as an argument.
+        self.counts = {}
+        for block in blocks:
+            for cmd in block.cmds:
+                self._link(cmd, block)
+
+    # The command defining a value, or None for inputs and constants.
+    def defn(self, value):
+        return self.defs.get(value)
+
+    def uses(self, value):
+        return list(self.users.get(value, {}).values())
+
+    # The number of times a value appears as an argument.
+    def use_count(self, value):
+        return self.counts.get(value, 0)
+
+    # Rewrite every use of old to new.
+    def replace_all_uses(self, old, new):
+        if old == new:
+            return
+        for cmd in self.uses(old):
+            self.set_args(cmd, [new if a == old and is_use(cmd, i) else a
+                                for i, a in enumerate(cmd.args)])
+
+    def set_args(self, cmd, args):
+        self._unlink_uses(cmd)
+        cmd.args = args
+        self._link_uses(cmd)
+
+    # Remove a command from its block.
+    def erase(self, cmd):
+        cmds = cmd.block.cmds
+        del cmds[index_of(cmds, cmd)]
+        self._unlink(cmd)
+
+    # Remove many commands, filtering each affected block once.
+    def erase_all(self, cmds):
+        erased = {}
+        for cmd in cmds:
+            erased[id(cmd)] = cmd
+        blocks = {}
+        for cmd in erased.values():
+            blocks[id(cmd.block)] = cmd.block
+            self._unlink(cmd)
+        for block in blocks.values():
+            block.cmds = [c for c in block.cmds if id(c) not in erased]
+
+    def insert_before(self, anchor, cmd):
+        block = anchor.block
+        block.cmds.insert(index_of(block.cmds, anchor), cmd)
+        self._link(cmd, block)
+
+    def append(self, block, cmd):
+        block.cmds.append(cmd)
+        self._link(cmd, block)
+
+    def _link(self, cmd, block):
+        cmd.block = block
+        for r in cmd.results:
+            if r != '_':
+                self.defs[r] = cmd
+        self._link_uses(cmd)
+
+    def _unlink(self, cmd):
+        for r in cmd.results:
+            if self.defs.get(r) is cmd:
+                del self.defs[r]
+        self._unlink_uses(cmd)
+
+    def _link_uses(self, cmd):
+        for i, a in enumerate(cmd.args):
+            if is_use(cmd, i):
+                users = self.users.get(a)
+                if users is None:
+                    users = self.users[a] = {}
+                users[id(cmd)] = cmd
+                self.counts[a] = self.counts.get(a, 0) + 1
+
+    def _unlink_uses(self, cmd):
+        for i, a in enumerate(cmd.args):
+            if not is_use(cmd, i):
+                continue
+            users = self.users.get(a)
+            if users is None:
+                continue
+            users.pop(id(cmd), None)
+            self.counts[a] -= 1
+            if not users:
+                del self.users[a]
+                del self.counts[a]
+
+
+def is_use(cmd, i):
+    return cmd.op != 'phi' or i % 2 == 1
+
+
+def index_of(cmds, cmd):
+    for i, c in enumerate(cmds):
+        if c is cmd:
+            return i
+    raise ValueError(cmd)
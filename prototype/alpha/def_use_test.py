@@ -0,0 +1,101 @@
+from def_use import DefUse
+
+import time
+import unittest
+from textwrap import dedent
+
+from common import Block, Cmd
+from parse import parse_lines
+
+
+class TestDefUse(unittest.TestCase):
+  def setUp(self):
+    (self.func,) = parse_lines("""
+      main
+        start
+          a = add 1 1
+          b = add a a
+          br 1 next start
+        next
+          c = phi start b next c
+          d = add c a
+          ret d
+      end
+    """)
+    self.du = DefUse(self.func.blocks)
+
+  def test_links(self):
+    start, next_ = self.func.blocks
+    self.assertIs(self.du.defn('a'), start.cmds[0])
+    self.assertIsNone(self.du.defn('1'))
+    self.assertEqual(self.du.use_count('a'), 3)
+    self.assertEqual(self.du.use_count('c'), 2)
+    self.assertEqual(self.du.use_count('start'), 1)
+    self.assertEqual(self.du.uses('b'), [next_.cmds[0]])
+    self.assertIs(next_.cmds[1].block, next_)
+
+  def test_replace_all_uses(self):
+    self.du.replace_all_uses('a', 'z')
+    self.assertEqual(self.du.use_count('a'), 0)
+    self.assertEqual(self.du.use_count('z'), 3)
+    self.assertEqual(str(self.func.blocks[0].cmds[1]), 'b = add z z\n')
+
+  def test_replace_does_not_touch_phi_blocks(self):
+    self.du.replace_all_uses('next', 'elsewhere')
+    self.assertEqual(str(self.func.blocks[1].cmds[0]), 'c = phi next c start b\n')
+
+  def test_erase_and_insert(self):
+    start = self.func.blocks[0]
+    b = self.du.defn('b')
+    self.du.erase(b)
+    self.assertIsNone(self.du.defn('b'))
+    self.assertEqual(self.du.use_count('a'), 1)
+
+    e = Cmd(['e'], 'add', None, ['a', '2'])
+    self.du.insert_before(start.cmds[-1], e)
+    self.assertEqual(str(start), dedent("""\
+      start
+        a = add 1 1
+        e = add a 2
+        br 1 next start
+    """))
+    self.assertIs(self.du.defn('e'), e)
+    self.assertEqual(self.du.use_count('a'), 2)
+
+  def test_set_args(self):
+    d = self.du.defn('d')
+    self.du.set_args(d, ['c', 'c'])
+    self.assertEqual(self.du.use_count('a'), 2)
+    self.assertEqual(self.du.use_count('c'), 3)
+
+    self.assertEqual(self.du.uses('c'), [self.func.blocks[1].cmds[0], d])
+    self.du.set_args(d, ['1', '1'])
+    self.assertEqual(self.du.uses('c'), [self.func.blocks[1].cmds[0]])
+
+
+# Rewriting and erasing the users of shared constants one at a time should
+# take time linear in their number: each unlink must not scan the constant's
+# other users.
+class TestDefUseScaling(unittest.TestCase):
+  def rewrite_time(self, n):
+    best = None
+    for _ in range(3):
+      block = Block('start', [Cmd([f'v{i}'], 'add', 1, ['1', '0'])
+                              for i in range(n)])
+      du = DefUse([block])
+      cmds = list(block.cmds)
+      start = time.perf_counter()
+      for cmd in cmds:
+        du.set_args(cmd, ['2', '0'])
+      du.erase_all(cmds)
+      seconds = time.perf_counter() - start
+      best = seconds if best is None else min(best, seconds)
+      self.assertEqual(du.use_count('0'), 0)
+      self.assertEqual(du.uses('2'), [])
+    return best
+
+  def test_unlink_is_constant_time(self):
+    small = self.rewrite_time(5000)
+    large = self.rewrite_time(40000)
+    # Linear is 8 times slower; quadratic would be 64.
+    self.assertLess(large, 24 * small + 0.05)
@@ -0,0 +1,167 @@
+from cfg import CFG
+
+
+# The dominator tree of a list of blocks, computed with the Cooper, Harvey and
+# Kennedy iterative algorithm.
+#
+# Blocks without predecessors are roots of the tree. The return block of a
+# jsr is immediately dominated by the block containing the jsr, since control
+# only reaches it through the subroutine call; the rts edges into it are
+# ignored for dominance. Other predecessor maps, from block name to the names
+# of its predecessors, can be given instead.
+class DominatorTree:
+    def __init__(self, blocks, preds=None):
+        self.names = [b.name for b in blocks]
+        if preds is None:
+            preds = effective_predecessors(blocks)
+        self.preds = preds
+        succs = {name: [] for name in self.names}
+        for name, ps in preds.items():
+            for p in ps:
+                succs[p].append(name)
+
+        # Postorder numbering, with roots visited first in program order.
+        # Blocks only reachable through a cycle with no way in become roots
+        # too.
+        candidates = [name for name in self.names if not preds[name]]
+        candidates += self.names
+        roots = []
+        order = []
+        visited = set()
+        for root in candidates:
+            if root in visited:
+                continue
+            roots.append(root)
+            visited.add(root)
+            stack = [(root, iter(succs[root]))]
+            while stack:
+                name, it = stack[-1]
+                for succ in it:
+                    if succ not in visited:
+                        visited.add(succ)
+                        stack.append((succ, iter(succs[succ])))
+                        break
+                else:
+                    stack.pop()
+                    order.append(name)
+        po_num = {name: i for i, name in enumerate(order)}
+
+        # A virtual root above all real roots, numbered last in postorder.
+        virtual = len(order)
+        po_num_idom = {virtual: virtual}
+        for root in roots:
+            po_num_idom[po_num[root]] = virtual
+
+        def intersect(a, b):
+            while a != b:
+                while a < b:
+                    a = po_num_idom[a]
+                while b < a:
+                    b = po_num_idom[b]
+            return a
+
+        root_set = set(roots)
+        rpo = [name for name in reversed(order) if name not in root_set]
+        changed = True
+        while changed:
+            changed = False
+            for name in rpo:
+                new_idom = None
+                for p in preds[name]:
+                    p_num = po_num[p]
+                    if p_num not in po_num_idom:
+                        continue
+                    if new_idom is None:
+                        new_idom = p_num
+                    else:
+                        new_idom = intersect(p_num, new_idom)
+                if po_num_idom.get(po_num[name]) != new_idom:
+                    po_num_idom[po_num[name]] = new_idom
+                    changed = True
+
+        self.idom = {}
+        for name in self.names:
+            d = po_num_idom[po_num[name]]
+            self.idom[name] = None if d == virtual else order[d]
+
+        self.children = {name: [] for name in self.names}
+        for name in self.names:
+            if self.idom[name] is not None:
+                self.children[self.idom[name]].append(name)
+
+        # Number the tree in preorder and postorder so that dominance queries
+        # take constant time.
+        self.pre = {}
+        self.post = {}
+        counter = 0
+        for root in roots:
+            stack = [(root, iter(self.children[root]))]
+            self.pre[root] = counter
+            counter += 1
+            while stack:
+                name, it = stack[-1]
+                for child in it:
+                    self.pre[child] = counter
+                    counter += 1
+                    stack.append((child, iter(self.children[child])))
+                    break
+                else:
+                    stack.pop()
+                    self.post[name] = counter
+                    counter += 1
+
+        self._frontiers = None
+
+    # Whether a dominates b. Every block dominates itself.
+    def dominates(self, a, b):
+        return self.pre[a] <= self.pre[b] and self.post[b] <= self.post[a]
+
+    def strictly_dominates(self, a, b):
+        return a != b and self.dominates(a, b)
+
+    # The dominators of a block, from the block itself up to its root.
+    def dominators(self, name):
+        while name is not None:
+            yield name
+            name = self.idom[name]
+
+    # A preorder walk of the tree.
+    def preorder(self):
+        return sorted(self.names, key=self.pre.__getitem__)
+
+    @property
+    def frontiers(self):
+        if self._frontiers is None:
+            df = {name: set() for name in self.names}
+            for name in self.names:
+                preds = self.preds[name]
+                if len(preds) < 2:
+                    continue
+                for p in preds:
+                    runner = p
+                    while runner is not None and runner != self.idom[name]:
+                        df[runner].add(name)
+                        runner = self.idom[runner]
+            self._frontiers = df
+        return self._frontiers
+
+
+# The predecessors used for dominance: the CFG predecessors, except that the
+# return block of a jsr has only the jsr block as its predecessor. The edges
+# are read from cfg, which is built if not given.
+def effective_predecessors(blocks, cfg=None):
+    if cfg is None:
+        cfg = CFG(blocks)
+    jsr_dom = {}
+    for block in blocks:
+        term = block.cmds[-1]
+        if term.op == 'jsr' and len(term.args) > 1:
+            jsr_dom[term.args[1]] = block.name
+    preds = {}
+    for block in blocks:
+        name = block.name
+        preds[name] = [p.name for p in cfg.block(name).preds
+                       if name not in jsr_dom or p.cmds[-1].op != 'rts']
+        if name in jsr_dom:
+            preds[name].append(jsr_dom[name])
+    return preds
@@ -0,0 +1,88 @@
+from dominance import DominatorTree
+
+import unittest
+
+from parse import parse_lines
+
+
+class TestDominance(unittest.TestCase):
+  def test_diamond(self):
+    (func,) = parse_lines("""
+      main
+        start
+          br 1 left right
+        left
+          br join
+        right
+          br join
+        join
+          ret
+      end
+    """)
+    tree = DominatorTree(func.blocks)
+    self.assertEqual(tree.idom, {
+        'start': None, 'left': 'start', 'right': 'start', 'join': 'start'})
+    self.assertTrue(tree.dominates('start', 'join'))
+    self.assertTrue(tree.dominates('join', 'join'))
+    self.assertFalse(tree.dominates('left', 'join'))
+    self.assertFalse(tree.strictly_dominates('join', 'join'))
+    self.assertEqual(tree.frontiers, {
+        'start': set(), 'left': {'join'}, 'right': {'join'}, 'join': set()})
+
+  def test_loop(self):
+    (func,) = parse_lines("""
+      main
+        start
+          br loop
+        loop
+          br 1 body done
+        body
+          br loop
+        done
+          ret
+      end
+    """)
+    tree = DominatorTree(func.blocks)
+    self.assertEqual(tree.idom['body'], 'loop')
+    self.assertEqual(tree.idom['done'], 'loop')
+    self.assertEqual(list(tree.dominators('body')), ['body', 'loop', 'start'])
+    self.assertEqual(tree.frontiers['body'], {'loop'})
+    self.assertEqual(tree.frontiers['loop'], {'loop'})
+
+  def test_jsr_dominates_return_block(self):
+    (func,) = parse_lines("""
+      main
+        start
+          br 1 left right
+        left
+          jsr foo left_ret
+        left_ret
+          br join
+        right
+          jsr foo right_ret
+        right_ret
+          br join
+        join
+          ret
+        foo
+          rts left_ret right_ret
+      end
+    """)
+    tree = DominatorTree(func.blocks)
+    self.assertEqual(tree.idom['left_ret'], 'left')
+    self.assertEqual(tree.idom['right_ret'], 'right')
+    self.assertEqual(tree.idom['foo'], 'start')
+    self.assertEqual(tree.idom['join'], 'start')
+    self.assertFalse(tree.dominates('foo', 'left_ret'))
+
+  def test_blocks_without_preds_are_roots(self):
+    (func,) = parse_lines("""
+      main
+        start
+          ret
+        other
+          br start
+      end
+    """)
+    tree = DominatorTree(func.blocks)
+    self.assertEqual(tree.idom, {'start': 'other', 'other': None})
@@ -0,0 +1,314 @@
+from attr import attrs, attrib
+
+from cfg import CFG
+from common import Block, Cmd, Names, new_name
+from def_use import is_use
+from liveness import compute_liveness
+from passes import declare
+
+# Translation out of SSA form, after Boissinot et al., "Revisiting Out-of-SSA
+# Translation for Correctness, Code Quality, and Efficiency".
+#
+# Critical edges from brs into blocks with phis are split. Each phi then gets
+# a copy of each of its arguments at the end of the corresponding predecessor
+# and a copy of its result at the top of its block, and is rewritten to join
+# the new values. The phi's new values form a class that can share one
+# variable. Classes joined by a copy are then coalesced unless two of their
+# values interfere: one is live at the definition of the other, and they hold
+# different values.
+#
+# An rts returns to the block after the jsr that called it, so its edges can't
+# be split. The copies for a return block's phis go before the rts instead,
+# and run on the way back to every caller; their values are new, and coalescing
+# them with a value live into another caller counts as interference.
+#
+# Interference is checked for each pair of members at their definitions,
+# rather than only against the members dominating each one. A value defined
+# before a jsr is used after the jsr returns without a phi, so it is live at
+# definitions that it doesn't dominate in the CFG, and values defined in the
+# subroutine are live at definitions in the return block that they don't
+# dominate when the jsr is taken to dominate it.
+#
+# Finally each value is renamed to its class's variable and the phis are
+# deleted. The copies placed at each point happen in parallel, so those left
+# are ordered into sequential copies, saving a value in a temporary only to
+# break a cycle.
+
+
+# Counts of copies, for reporting.
+@attrs
+class CopyStats:
+    # One copy per phi argument, as placed before coalescing.
+    phi_copies = attrib(default=0)
+    # The copies left afterwards, including those through a temporary.
+    copies = attrib(default=0)
+    # The number of cycles broken with a temporary.
+    temps = attrib(default=0)
+
+    @property
+    def removed(self):
+        return self.phi_copies - self.copies
+
+
+@declare(uses=['cfg'], preserves=['cfg'], reports=True)
+def from_ssa(blocks, cfg=None, report=None):
+    stats = out_of_ssa(blocks, cfg)
+    if report is not None:
+        report.update(phi_copies=stats.phi_copies, removed=stats.removed,
+                      cycles_broken=stats.temps)
+
+
+# Translate blocks out of SSA form, returning a CopyStats.
+def out_of_ssa(blocks, cfg=None):
+    if cfg is None:
+        cfg = CFG(blocks)
+    stats = CopyStats()
+    headers = split_critical_edges(blocks, cfg)
+
+    defns = Names(r for b in blocks for cmd in b.cmds for r in cmd.results)
+    introduced = set()
+
+    def fresh(var):
+        name = new_name(var, defns)
+        introduced.add(name)
+        return name
+
+    # Union-find over values.
+    parent = {}
+
+    def find(v):
+        root = v
+        while parent[root] != root:
+            root = parent[root]
+        while v != root:
+            parent[v], v = root, parent[v]
+        return root
+
+    # Place the copies. Each list in groups is one parallel copy.
+    groups = []
+    for block in blocks:
+        phis = [cmd for cmd in block.cmds if cmd.op == 'phi']
+        if not phis:
+            continue
+        for phi in phis:
+            for pred in phi.args[::2]:
+                if cfg.block(pred) not in block.preds:
+                    raise ValueError(
+                        f'phi in {block.name} has an argument from {pred}, '
+                        'which is not a predecessor')
+        body = block.cmds[len(phis):]
+
+        # With only one predecessor, each phi is just a copy.
+        if len(block.preds) == 1:
+            starts = []
+            for phi in phis:
+                args = [a for a in phi.args[1::2] if a != 'undef']
+                stats.phi_copies += len(args)
+                if args:
+                    starts.append(Cmd(phi.results, 'copy', None, args[:1]))
+            block.cmds = starts + body
+            groups.append(starts)
+            continue
+
+        ends = {}
+        starts = []
+        for phi in phis:
+            (result,) = phi.results
+            joined = fresh(result)
+            congruent = [joined]
+            args = []
+            for pred, arg in zip(phi.args[::2], phi.args[1::2]):
+                if arg == 'undef':
+                    continue
+                stats.phi_copies += 1
+                new_arg = fresh(result)
+                ends.setdefault(pred, []).append(Cmd([new_arg], 'copy', None, [arg]))
+                congruent.append(new_arg)
+                args += [pred, new_arg]
+            phi.results = [joined]
+            phi.args = args
+            starts.append(Cmd([result], 'copy', None, [joined]))
+            for v in congruent:
+                parent[v] = joined
+        block.cmds = phis + starts + body
+        groups.append(starts)
+        for pred, copies in ends.items():
+            cmds = cfg.block(pred).cmds
+            cmds[-1:-1] = copies
+            groups.append(copies)
+
+    def_at = {}
+    source = {}
+    for block in blocks:
+        for i, cmd in enumerate(block.cmds):
+            for r in cmd.results:
+                if r != '_':
+                    def_at[r] = (block.name, i)
+                    parent.setdefault(r, r)
+            if cmd.op == 'copy':
+                source[cmd.results[0]] = cmd.args[0]
+    _, live_outs = compute_liveness(blocks, def_at, lambda b: [s.name for s in b.succs])
+    last_use = {}
+    for block in blocks:
+        for i, cmd in enumerate(block.cmds):
+            if cmd.op != 'phi':
+                for a in cmd.args:
+                    last_use[block.name, a] = i
+
+    members = {}
+    for v in parent:
+        members.setdefault(find(v), []).append(v)
+
+    # The value held by a value: copies hold the value of their source.
+    def value(v):
+        while v in source:
+            v = source[v]
+        return v
+
+    # Whether a is live just after the definition of b.
+    def live_at_def(a, b):
+        (a_block, a_i), (b_block, b_i) = def_at[a], def_at[b]
+        if a_block == b_block and a_i > b_i:
+            return False
+        return a in live_outs[b_block] or last_use.get((b_block, a), -1) > b_i
+
+    def interfere(x_root, y_root):
+        for u in members[x_root]:
+            for v in members[y_root]:
+                if value(u) != value(v) and (live_at_def(u, v) or live_at_def(v, u)):
+                    return True
+        return False
+
+    for group in groups:
+        for copy in group:
+            (dst,), (src,) = copy.results, copy.args
+            if src not in def_at:
+                continue
+            x, y = find(dst), find(src)
+            if x == y or interfere(x, y):
+                continue
+            parent[y] = x
+            members[x] += members.pop(y)
+
+    # Name each class after its first original value in program order.
+    block_index = {b.name: i for i, b in enumerate(blocks)}
+
+    def position(v):
+        name, i = def_at[v]
+        return (block_index[name], i)
+
+    names = {}
+    for root, ms in members.items():
+        originals = [m for m in ms if m not in introduced]
+        names[root] = min(originals or ms, key=position)
+
+    def rename(v):
+        return names[find(v)] if v in parent else v
+
+    temp = None
+    group_of = {}
+    for group in groups:
+        for copy in group:
+            group_of[id(copy)] = group
+    for block in blocks:
+        cmds = []
+        for cmd in block.cmds:
+            if cmd.op == 'phi':
+                continue
+            group = group_of.get(id(cmd))
+            if group is None:
+                cmd.results = [rename(r) for r in cmd.results]
+                cmd.args = [rename(a) if is_use(cmd, i) else a
+                            for i, a in enumerate(cmd.args)]
+                cmds.append(cmd)
+                continue
+            # Each group is sequentialized in place of its first copy.
+            if group[0] is not cmd:
+                continue
+            if temp is None:
+                temp = new_name('t', defns)
+            parallel = [(rename(c.results[0]), rename(c.args[0])) for c in group]
+            copies, cycles = sequentialize(parallel, temp)
+            stats.copies += len(copies)
+            stats.temps += cycles
+            cmds += [Cmd([dst], 'copy', None, [src]) for dst, src in copies]
+        block.cmds = cmds
+
+    # Unsplit the edges that were left without copies.
+    empty = [h for h in headers if len(h.cmds) == 1]
+    for header in empty:
+        (pred,), (succ,) = header.preds, header.succs
+        term = pred.cmds[-1]
+        term.args = [succ.name if a == header.name else a for a in term.args]
+        cfg.update(pred)
+    cfg.remove_all(empty)
+    removed = set(map(id, empty))
+    blocks[:] = [b for b in blocks if id(b) not in removed]
+    return stats
+
+
+# Split the edges from brs with several successors into blocks with phis and
+# several predecessors. The new blocks go just before the phis' block, and are
+# returned.
+def split_critical_edges(blocks, cfg):
+    block_names = Names(b.name for b in blocks)
+    headers = []
+    new_blocks = []
+    for block in blocks:
+        if block.cmds[0].op != 'phi' or len(block.preds) < 2:
+            new_blocks.append(block)
+            continue
+        for pred in list(block.preds):
+            term = pred.cmds[-1]
+            if len(pred.succs) < 2 or term.op != 'br':
+                continue
+            name = new_name(f'{block.name}_from_{pred.name}', block_names)
+            header = Block(name, [Cmd([], 'br', None, [block.name])])
+            cfg.add(header)
+            term.args = [term.args[0]] + [
+                name if a == block.name else a for a in term.args[1:]]
+            cfg.update(pred)
+            for cmd in block.cmds:
+                if cmd.op == 'phi':
+                    cmd.args = [name if i % 2 == 0 and a == pred.name else a
+                                for i, a in enumerate(cmd.args)]
+            headers.append(header)
+            new_blocks.append(header)
+        new_blocks.append(block)
+    blocks[:] = new_blocks
+    return headers
+
+
+# Order a parallel copy, given as (dst, src) pairs with distinct dsts, into
+# sequential copies. A dst is written once its old value is no longer needed
+# or has been copied elsewhere, and one value of each cycle is saved in temp.
+# Returns the copies and the number of cycles broken.
+def sequentialize(parallel, temp):
+    pred = {}
+    # Where each source's value can currently be found.
+    loc = {}
+    for dst, src in parallel:
+        if dst != src:
+            pred[dst] = src
+            loc[src] = src
+    ready = [dst for dst in pred if dst not in loc]
+    todo = list(pred)
+    written = set()
+    copies = []
+    cycles = 0
+    while todo:
+        while ready:
+            dst = ready.pop()
+            src = pred[dst]
+            copies.append((dst, loc[src]))
+            written.add(dst)
+            if loc[src] == src and src in pred:
+                ready.append(src)
+            loc[src] = dst
+        dst = todo.pop()
+        if dst not in written:
+            copies.append((temp, dst))
+            loc[dst] = temp
+            ready.append(dst)
+            cycles += 1
+    return copies, cycles
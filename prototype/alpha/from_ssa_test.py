@@ -0,0 +1,201 @@
+from from_ssa import out_of_ssa, sequentialize
+
+import unittest
+from textwrap import dedent
+
+from alpha import merge_all_funcs
+from common import strcat
+from parse import parse_lines
+from to_ssa import to_ssa
+
+
+def run(text):
+  (func,) = parse_lines(text)
+  stats = out_of_ssa(func.blocks)
+  return strcat(*func.blocks), stats
+
+
+class TestOutOfSsa(unittest.TestCase):
+  def test_coalesce_loop(self):
+    text, stats = run("""
+      main
+        inputs n
+        start
+          r = copy n
+          br loop
+        loop
+          i = phi start 0 loop j
+          s = phi start r loop t
+          j = add i 1
+          t = add s j
+          c = lt j n
+          br c loop done
+        done
+          ret t
+      end
+    """)
+    self.assertEqual(text, dedent("""\
+      start
+        r = copy n
+        i = copy 0
+        br loop
+      loop
+        i = add i 1
+        r = add r i
+        c = lt i n
+        br c loop done
+      done
+        ret r
+    """))
+    self.assertEqual((stats.phi_copies, stats.removed), (4, 3))
+
+  def test_swap(self):
+    text, stats = run("""
+      main
+        inputs n
+        start
+          br loop
+        loop
+          x = phi start 1 loop y
+          y = phi start 2 loop x
+          c = lt x n
+          br c loop done
+        done
+          ret x y
+      end
+    """)
+    self.assertEqual(text, dedent("""\
+      start
+        y = copy 2
+        x2 = copy 1
+        br loop
+      loop_from_loop
+        x2 = copy y
+        y = copy x
+        br loop
+      loop
+        x = copy x2
+        c = lt x n
+        br c loop_from_loop done
+      done
+        ret x y
+    """))
+    self.assertEqual(stats.temps, 0)
+
+  def test_lost_copy(self):
+    text, _ = run("""
+      main
+        start
+          br loop
+        loop
+          x = phi start 0 loop y
+          y = add x 1
+          c = lt y 10
+          br c loop done
+        done
+          ret x
+      end
+    """)
+    self.assertEqual(text, dedent("""\
+      start
+        x = copy 0
+        br loop
+      loop_from_loop
+        x = copy y
+        br loop
+      loop
+        y = add x 1
+        c = lt y 10
+        br c loop_from_loop done
+      done
+        ret x
+    """))
+
+  def test_not_a_predecessor(self):
+    with self.assertRaises(ValueError):
+      run("""
+        main
+          start
+            br next
+          next
+            x = phi other 1
+            ret x
+          other
+            ret
+        end
+      """)
+
+
+  # f returns to two call sites from two rts blocks, so each return block's
+  # phi is on critical rts edges. The first result stays live through the
+  # second call, where the copies for the second phi are made.
+  def test_return_to_two_callers(self):
+    blocks = merge_all_funcs(parse_lines("""
+      main
+        start
+          a = call f 0
+          b = call f 1
+          s = add a b
+          ret s
+      end
+
+      f
+        inputs x
+        start
+          br x one two
+        one
+          ret 1
+        two
+          ret 2
+      end
+    """))
+    to_ssa(blocks)
+    out_of_ssa(blocks)
+    self.assertEqual(strcat(*blocks), dedent("""\
+      main
+        f_x2 = copy 0
+        jsr f main1
+      main1
+        __f_o12 = copy __f_o121
+        f_x2 = copy 1
+        jsr f main2
+      main2
+        main_s = add __f_o12 __f_o13
+        rts
+      f
+        br f_x2 f_one f_two
+      f_one
+        __f_o121 = copy 1
+        __f_o13 = copy 1
+        rts main1 main2
+      f_two
+        __f_o121 = copy 2
+        __f_o13 = copy 2
+        rts main1 main2
+    """))
+
+class TestSequentialize(unittest.TestCase):
+  def run_copies(self, parallel):
+    copies, cycles = sequentialize(parallel, 't')
+    values = {}
+    for dst, src in copies:
+      values[dst] = values.get(src, src)
+    for dst, src in parallel:
+      self.assertEqual(values.get(dst, dst), src)
+    return copies, cycles
+
+  def test_chain(self):
+    copies, cycles = self.run_copies([('a', 'b'), ('b', 'c'), ('c', '1')])
+    self.assertEqual(copies, [('a', 'b'), ('b', 'c'), ('c', '1')])
+    self.assertEqual(cycles, 0)
+
+  def test_cycles(self):
+    copies, cycles = self.run_copies(
+        [('a', 'b'), ('b', 'a'), ('c', 'd'), ('d', 'e'), ('e', 'c'), ('f', 'c')])
+    self.assertEqual(len(copies), 7)
+    self.assertEqual(cycles, 1)
+
+  def test_fan_out(self):
+    copies, cycles = self.run_copies([('a', 'b'), ('c', 'b'), ('b', 'a')])
+    self.assertEqual(len(copies), 3)
+    self.assertEqual(cycles, 0)
@@ -0,0 +1,130 @@
+import argparse
+import hashlib
+import json
+import os
+
+from common import strcat
+import ir_cache
+
+# A directory of compiled functions, keyed by a hash of each function's text
+# and of everything else the compiled form depends on, so that an edit to one
+# function only recompiles that function.
+#
+# Each entry is one function in the ir_cache format. Reading an entry touches
+# its modification time, and once the entries take up more than max_bytes the
+# least recently used are deleted. Hit and miss counts are kept across runs in
+# stats.json, and shown by running this module on the directory.
+
+DEFAULT_MAX_BYTES = 64 << 20
+SUFFIX = '.irc'
+STATS = 'stats.json'
+
+
+class FuncCache:
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # The key for a function compiled with the given configuration, which is
+    # made of values whose str() identifies them.
+    def key(self, func, *config):
+        h = hashlib.sha256()
+        for x in (ir_cache.VERSION, *config):
+            h.update(str(x).encode())
+            h.update(b'\0')
+        h.update(f'{func.name}\n{" ".join(func.inputs)}\n'.encode())
+        h.update(strcat(*func.blocks).encode())
+        return h.digest()
+
+    # The function cached for key, or None.
+    def get(self, key):
+        path = ir_cache.cache_path(self.dir, key)
+        try:
+            (func,) = ir_cache.load(path, key)
+            os.utime(path)
+        except (OSError, ValueError, ir_cache.CacheError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return func
+
+    def put(self, key, func):
+        ir_cache.dump([func], ir_cache.cache_path(self.dir, key), key)
+
+    # Add this run's counts to the totals and evict entries down to max_bytes.
+    def close(self):
+        stats = read_stats(self.dir)
+        stats['hits'] += self.hits
+        stats['misses'] += self.misses
+        path = os.path.join(self.dir, STATS)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(stats, f)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.dir):
+            if entry.name.endswith(SUFFIX):
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, entry.name, st.st_size))
+        total = sum(size for _, _, size in entries)
+        entries.sort()
+        evicted = 0
+        for _, name, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        return evicted
+
+
+def read_stats(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, STATS)) as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        stats = {}
+    return {'hits': stats.get('hits', 0), 'misses': stats.get('misses', 0)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Show the hit and miss counts of a function cache.')
+    parser.add_argument('dir')
+    parser.add_argument('--reset', action='store_true',
+                        help='remove the entries and counts')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        parser.error(f'{args.dir}: not a directory')
+    names = [n for n in os.listdir(args.dir) if n.endswith(SUFFIX)]
+    if args.reset:
+        for name in names + [STATS]:
+            try:
+                os.remove(os.path.join(args.dir, name))
+            except FileNotFoundError:
+                pass
+        return
+
+    stats = read_stats(args.dir)
+    size = sum(os.path.getsize(os.path.join(args.dir, n)) for n in names)
+    lookups = stats['hits'] + stats['misses']
+    rate = f'{100 * stats["hits"] / lookups:.1f}%' if lookups else '-'
+    print(f'entries  {len(names)}')
+    print(f'bytes    {size}')
+    print(f'hits     {stats["hits"]}')
+    print(f'misses   {stats["misses"]}')
+    print(f'hit rate {rate}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+from func_cache import FuncCache, read_stats
+
+import os
+import tempfile
+import unittest
+from textwrap import dedent
+from unittest import mock
+
+from alpha import load_funcs_cached
+from common import strcat
+from parse import parse_lines
+
+
+TEXT = """
+  f
+    inputs n
+    start
+      r = call f n
+      x = add r n
+      ret x
+  end
+  g
+    inputs n
+    start
+      r = call f n
+      ret r
+  end
+"""
+
+
+class TestFuncCache(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = self.tmp.name
+
+  def tearDown(self):
+    self.tmp.cleanup()
+
+  def test_key(self):
+    cache = FuncCache(self.dir)
+    f, g = parse_lines(TEXT)
+    (f2, _) = parse_lines(TEXT.replace('add r n', 'sub r n'))
+    self.assertEqual(cache.key(f, 'braun'), cache.key(parse_lines(TEXT)[0], 'braun'))
+    self.assertNotEqual(cache.key(f, 'braun'), cache.key(g, 'braun'))
+    self.assertNotEqual(cache.key(f, 'braun'), cache.key(f2, 'braun'))
+    self.assertNotEqual(cache.key(f, 'braun'), cache.key(f, 'cytron'))
+
+  def test_get_put(self):
+    cache = FuncCache(self.dir)
+    (f, _) = parse_lines(TEXT)
+    key = cache.key(f)
+    self.assertIsNone(cache.get(key))
+    cache.put(key, f)
+    self.assertEqual(strcat(*cache.get(key).blocks), strcat(*f.blocks))
+    self.assertEqual((cache.hits, cache.misses), (1, 1))
+    cache.close()
+    cache.close()
+    self.assertEqual(read_stats(self.dir), {'hits': 2, 'misses': 2})
+
+  def test_evict_least_recently_used(self):
+    f, g = parse_lines(TEXT)
+    cache = FuncCache(self.dir)
+    f_key, g_key = cache.key(f), cache.key(g)
+    cache.put(f_key, f)
+    cache.put(g_key, g)
+    entries = [n for n in os.listdir(self.dir) if n.endswith('.irc')]
+    size = max(os.path.getsize(os.path.join(self.dir, n)) for n in entries)
+    os.utime(os.path.join(self.dir, f_key.hex() + '.irc'), ns=(0, 0))
+    os.utime(os.path.join(self.dir, g_key.hex() + '.irc'), ns=(1, 1))
+    cache.get(f_key)
+    cache.max_bytes = size
+    self.assertEqual(cache.evict(), 1)
+    self.assertIsNotNone(cache.get(f_key))
+    self.assertIsNone(cache.get(g_key))
+
+  def test_load_funcs_cached(self):
+    src = os.path.join(self.dir, 'a.ir')
+    with open(src, 'w') as f:
+      f.write(dedent(TEXT))
+    cache_dir = os.path.join(self.dir, 'cache')
+    first = load_funcs_cached([src], 'braun', FuncCache(cache_dir))
+    cache = FuncCache(cache_dir)
+    second = load_funcs_cached([src], 'braun', cache)
+    self.assertEqual(cache.hits, 2)
+    self.assertEqual([strcat(*f.blocks) for f in second],
+                     [strcat(*f.blocks) for f in first])
+    self.assertIn('save', strcat(*second[0].blocks))
+    # A change to the code that prepares functions misses.
+    cache = FuncCache(cache_dir)
+    with mock.patch('alpha.prepare_code_version', return_value='changed'):
+      load_funcs_cached([src], 'braun', cache)
+    self.assertEqual((cache.hits, cache.misses), (0, 2))
@@ -0,0 +1,221 @@
+import argparse
+import random
+
+from attr import attrs, attrib
+
+# Random programs in the format read by parse.py, for testing and timing
+# passes on inputs of any size.
+#
+# Each function is a structured mix of straight-line code, if/else diamonds
+# and counted loops nested up to loop_depth deep, over num_vars variables.
+# Each variable has a fixed width, 2 bytes with probability wide and 1 byte
+# otherwise, and is only combined with values of the same width. The first
+# function is main, and every other function takes and returns one 2-byte
+# value, n. main reads its n from hardware instead. The variables start out as
+# distinct sums of n or its bytes and a constant, and calls pass and return
+# variables, so that no value is known at compile time and sccp leaves the
+# program at its generated size.
+#
+# Functions call functions defined after them and, with recursive set,
+# sometimes themselves or functions before them other than main, so that
+# there are call graph cycles whose live ranges are broken around the calls.
+# Those calls are only made in the then arms of if/else diamonds, so that the
+# recursion can end.
+
+@attrs
+class GenConfig:
+    funcs = attrib(default=4)
+    # Blocks per function, roughly: control flow is only added while there
+    # are fewer.
+    blocks = attrib(default=20)
+    loop_depth = attrib(default=2)
+    num_vars = attrib(default=8)
+    # The fraction of variables that are 2 bytes wide.
+    wide = attrib(default=0.5)
+    recursive = attrib(default=True)
+    seed = attrib(default=0)
+
+
+def generate_program(config):
+    rng = random.Random(config.seed)
+    names = ['main'] + [f'f{i}' for i in range(1, config.funcs)]
+    text = []
+    for i, name in enumerate(names):
+        text.append(FuncGenerator(config, rng, names, i).generate())
+    return '\n\n'.join(text) + '\n'
+
+
+class FuncGenerator:
+    def __init__(self, config, rng, func_names, index):
+        self.config = config
+        self.rng = rng
+        self.func_names = func_names
+        self.index = index
+        self.widths = [2 if rng.random() < config.wide else 1
+                       for _ in range(config.num_vars)]
+        self.lines = []
+        self.num_blocks = 0
+        self.num_temps = 0
+        # Whether the code being generated is in the then arm of a diamond,
+        # the only place recursive calls go so that every function has a
+        # path that returns.
+        self.in_then = False
+
+    def generate(self):
+        name = self.func_names[self.index]
+        self.lines = [name]
+        if self.index > 0:
+            self.lines.append('  inputs n')
+            self.open_block('start')
+        else:
+            self.read_input()
+        self.emit('lo hi = split n')
+        for v, width in enumerate(self.widths):
+            if width == 2:
+                self.emit(f'v{v} = add2 n {self.rng.randrange(100)}')
+            else:
+                half = self.rng.choice(['lo', 'hi'])
+                self.emit(f'v{v} = add1 {half} {self.rng.randrange(100)}')
+        # Call the next function, so that every function is reachable.
+        if self.index + 1 < len(self.func_names):
+            self.call(self.var(2), self.index + 1)
+        while self.num_blocks < self.config.blocks:
+            self.statement(0)
+        self.emit(f'ret {self.arg()}' if self.index > 0 else 'ret')
+        self.lines.append('end')
+        return '\n'.join(self.lines)
+
+    # Make main's n a value unknown at compile time: the number of reads of
+    # the RANDOM register before one returns zero.
+    def read_input(self):
+        self.open_block('start')
+        self.emit('n = copy 0')
+        self.emit('br read')
+        self.open_block('read')
+        self.emit('n = add2 n 1')
+        self.emit('r = asm')
+        self.lines.append('      lda 0xD20A')
+        self.emit('end')
+        self.emit('br r read read_done')
+        self.open_block('read_done')
+
+    def emit(self, line):
+        self.lines.append(f'    {line}')
+
+    def open_block(self, name):
+        self.lines.append(f'  {name}')
+        self.num_blocks += 1
+
+    def new_name(self, prefix):
+        self.num_temps += 1
+        return f'{prefix}{self.num_temps}'
+
+    def var(self, width=None, other=None):
+        vs = [v for v, w in enumerate(self.widths)
+              if width in (None, w) and v != other]
+        return self.rng.choice(vs) if vs else None
+
+    # A variable other than other or a constant. Combining a variable with
+    # itself would give values like v - v that sccp folds.
+    def operand(self, width, other=None):
+        v = self.var(width, other)
+        if v is None or self.rng.random() < 0.3:
+            return str(self.rng.randrange(1, 256 if width == 1 else 1000))
+        return f'v{v}'
+
+    # A 2-byte variable, or n if there are none.
+    def arg(self):
+        v = self.var(2)
+        return 'n' if v is None else f'v{v}'
+
+    def condition(self):
+        v = self.var()
+        width = self.widths[v]
+        c = self.new_name('c')
+        op = self.rng.choice(['lt', 'le', 'gt', 'ge', 'eq', 'ne'])
+        self.emit(f'{c} = {op}{width} v{v} {self.operand(width, v)}')
+        return c
+
+    def straight(self):
+        for _ in range(self.rng.randrange(1, 5)):
+            dst = self.var()
+            width = self.widths[dst]
+            r = self.rng.random()
+            if r < 0.1:
+                self.emit(f'v{dst} = lsr{width} v{self.var(width)}')
+            elif width == 2 and r < 0.2 and self.index + 1 < len(self.func_names):
+                self.call(dst, self.rng.randrange(self.index + 1, len(self.func_names)))
+            elif (width == 2 and r < 0.25 and self.config.recursive and
+                  self.index > 0 and self.in_then):
+                self.call(dst, self.rng.randrange(1, self.index + 1))
+            else:
+                op = self.rng.choice(['add', 'sub'])
+                v = self.var(width)
+                self.emit(f'v{dst} = {op}{width} v{v} {self.operand(width, v)}')
+
+    def call(self, dst, callee):
+        call = f'call {self.func_names[callee]} {self.arg()}'
+        self.emit(call if dst is None else f'v{dst} = {call}')
+
+    def statement(self, depth):
+        self.straight()
+        if self.num_blocks >= self.config.blocks:
+            return
+        r = self.rng.random()
+        if r < 0.3 and depth < self.config.loop_depth:
+            self.loop(depth)
+        elif r < 0.6:
+            self.diamond(depth)
+
+    def diamond(self, depth):
+        c = self.condition()
+        then, other, join = (self.new_name(p) for p in ('then', 'else', 'join'))
+        self.emit(f'br {c} {then} {other}')
+        in_then = self.in_then
+        for name in (then, other):
+            self.open_block(name)
+            self.in_then = in_then or name == then
+            self.statement(depth)
+            self.emit(f'br {join}')
+        self.in_then = in_then
+        self.open_block(join)
+
+    def loop(self, depth):
+        k = self.new_name('k')
+        head, body, done = (self.new_name(p) for p in ('head', 'body', 'done'))
+        self.emit(f'{k} = copy 0')
+        self.emit(f'br {head}')
+        self.open_block(head)
+        c = self.new_name('c')
+        self.emit(f'{c} = lt1 {k} {self.rng.randrange(2, 20)}')
+        self.emit(f'br {c} {body} {done}')
+        self.open_block(body)
+        for _ in range(self.rng.randrange(1, 3)):
+            self.statement(depth + 1)
+        self.emit(f'{k} = add1 {k} 1')
+        self.emit(f'br {head}')
+        self.open_block(done)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print a random program.')
+    defaults = GenConfig()
+    parser.add_argument('--funcs', type=int, default=defaults.funcs)
+    parser.add_argument('--blocks', type=int, default=defaults.blocks,
+                        help='blocks per function')
+    parser.add_argument('--loop-depth', type=int, default=defaults.loop_depth)
+    parser.add_argument('--vars', type=int, default=defaults.num_vars)
+    parser.add_argument('--wide', type=float, default=defaults.wide,
+                        help='fraction of 2-byte variables')
+    parser.add_argument('--no-recursion', action='store_true',
+                        help='only call functions defined later')
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    config = GenConfig(args.funcs, args.blocks, args.loop_depth, args.vars,
+                       args.wide, not args.no_recursion, args.seed)
+    print(generate_program(config), end='')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+from gen_ir import GenConfig, generate_program
+
+import unittest
+
+from alpha import ANALYSES, DEFAULT_PIPELINE, PASSES
+from alpha import break_live_ranges_across_recursive_calls, merge_all_funcs
+from alpha import prepare_func
+from callgraph import CallGraph
+from parse import parse_lines
+from passes import PassManager
+
+
+class TestGenerateProgram(unittest.TestCase):
+  def test_deterministic(self):
+    config = GenConfig(seed=3)
+    self.assertEqual(generate_program(config), generate_program(config))
+    self.assertNotEqual(generate_program(config),
+                        generate_program(GenConfig(seed=4)))
+
+  def test_shape(self):
+    funcs = parse_lines(generate_program(GenConfig(funcs=5, blocks=30, seed=1)))
+    self.assertEqual([f.name for f in funcs], ['main', 'f1', 'f2', 'f3', 'f4'])
+    for func in funcs:
+      self.assertGreaterEqual(len(func.blocks), 30)
+    graph = CallGraph(funcs)
+    self.assertTrue(any(graph.is_recursive(f.name) for f in funcs))
+    funcs = parse_lines(generate_program(
+        GenConfig(funcs=5, blocks=30, recursive=False, seed=1)))
+    graph = CallGraph(funcs)
+    self.assertFalse(any(graph.is_recursive(f.name) for f in funcs))
+
+  def test_compiles(self):
+    for seed in range(3):
+      funcs = parse_lines(generate_program(GenConfig(seed=seed)))
+      for func in funcs:
+        prepare_func(func, 'braun')
+      break_live_ranges_across_recursive_calls(funcs)
+      blocks = merge_all_funcs(funcs)
+      manager = PassManager(PASSES, ANALYSES)
+      manager.run(blocks, manager.parse(DEFAULT_PIPELINE))
+
+  def test_not_constant(self):
+    # Nothing is known at compile time, so sccp can't fold the program away.
+    funcs = parse_lines(generate_program(GenConfig(blocks=50)))
+    for func in funcs:
+      prepare_func(func, 'braun')
+    break_live_ranges_across_recursive_calls(funcs)
+    blocks = merge_all_funcs(funcs)
+    manager = PassManager(PASSES, ANALYSES)
+    manager.run(blocks, manager.parse('to_ssa lower_cmp legalize add_z_results'))
+    before = sum(len(b.cmds) for b in blocks)
+    manager.run(blocks, ['sccp'])
+    self.assertGreater(sum(len(b.cmds) for b in blocks), 0.95 * before)
@@ -0,0 +1,263 @@
+from array import array
+from itertools import islice
+import hashlib
+import mmap
+import os
+import struct
+import sys
+
+from common import Asm, AsmInstr, Block, Cmd, Func
+
+# A binary serialization of functions, so that parsed IR, or IR that has
+# already been through to_ssa, can be cached between runs.
+#
+# A file is a header followed by a payload of three parts: the end offset of
+# each string in the string table, a stream of 32-bit words describing the
+# functions, and the bytes of the strings. The words refer to strings by
+# index and give the length of each list before its elements:
+#
+#   funcs: count, then for each: name, inputs, blocks
+#   block: name, count of cmds, then each cmd, then 1 followed by the
+#          live_in and live_out sets, or 0 if they weren't computed
+#   cmd:   kind (0 for Cmd, 1 for Asm), op, size + 1 (0 for None), results,
+#          args, and for Asm also inputs, clobbers and instrs (op, args)
+#
+# The header records the key the file was written for, usually a hash of the
+# source text and of the code that compiled it, and a digest of the payload.
+# Loading maps the file, reads the words where they lie, and decodes each
+# string from the map when it is first used. A file with the wrong magic,
+# format version, key or digest is rejected with a CacheError.
+
+MAGIC = b'LCCIR\0\0\0'
+VERSION = 2
+HEADER = struct.Struct('<8sI32s32sIII')
+
+
+class CacheError(Exception):
+    pass
+
+
+# A key for the contents of the given files, along with any other things the
+# cached IR depends on (the pipeline stage, the options used, ...).
+def source_key(paths, *extra):
+    h = hashlib.sha256()
+    for x in extra:
+        h.update(str(x).encode())
+        h.update(b'\0')
+    for path in paths:
+        with open(path, 'rb') as f:
+            h.update(f.read())
+        h.update(b'\0')
+    return h.digest()
+
+
+# A hash of the source of the given files, for keying cached IR on the code
+# that produced it as well as on its input.
+def code_version(paths):
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            h.update(f.read())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+# The file a cache directory holds for a key.
+def cache_path(cache_dir, key):
+    return os.path.join(cache_dir, key.hex() + '.irc')
+
+
+def dumps(funcs, key):
+    writer = Writer()
+    writer.funcs(funcs)
+
+    ends = array('I')
+    end = 0
+    encoded = [s.encode() for s in writer.strings]
+    for b in encoded:
+        end += len(b)
+        ends.append(end)
+    words = writer.words
+    if sys.byteorder != 'little':
+        ends.byteswap()
+        words.byteswap()
+    payload = b''.join([ends.tobytes(), words.tobytes(), *encoded])
+    header = HEADER.pack(MAGIC, VERSION, key, digest(payload),
+                         len(encoded), len(words), end)
+    return header + payload
+
+
+# Write funcs to path, replacing it atomically.
+def dump(funcs, path, key):
+    data = dumps(funcs, key)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def load(path, key=None):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise CacheError(f'{path}: truncated')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            view = memoryview(m)
+            try:
+                return loads(view, key, path)
+            finally:
+                view.release()
+
+
+def loads(data, key=None, name='<bytes>'):
+    data = memoryview(data)
+    if len(data) < HEADER.size:
+        raise CacheError(f'{name}: truncated')
+    magic, version, file_key, file_digest, num_strings, num_words, string_bytes = (
+        HEADER.unpack_from(data))
+    if magic != MAGIC or version != VERSION:
+        raise CacheError(f'{name}: not a version {VERSION} IR cache file')
+    if key is not None and file_key != key:
+        raise CacheError(f'{name}: written for a different source')
+    payload = data[HEADER.size:]
+    if len(payload) != 4 * (num_strings + num_words) + string_bytes:
+        raise CacheError(f'{name}: truncated')
+    if digest(payload) != file_digest:
+        raise CacheError(f'{name}: digest mismatch')
+
+    words_start = 4 * num_strings
+    strings_start = words_start + 4 * num_words
+    ends = payload[:words_start].cast('I')
+    words = payload[words_start:strings_start].cast('I')
+    if sys.byteorder != 'little':
+        ends = array('I', ends)
+        ends.byteswap()
+        words = array('I', words)
+        words.byteswap()
+    text = payload[strings_start:]
+
+    # Strings are decoded straight from the buffer, the first time they are
+    # referred to.
+    strings = [None] * num_strings
+
+    def string(i):
+        s = strings[i]
+        if s is None:
+            start = ends[i - 1] if i else 0
+            s = strings[i] = sys.intern(str(text[start:ends[i]], 'utf-8'))
+        return s
+
+    try:
+        return read_funcs(words, string)
+    finally:
+        if isinstance(words, memoryview):
+            words.release()
+            ends.release()
+        text.release()
+
+
+def digest(payload):
+    return hashlib.blake2b(payload, digest_size=32).digest()
+
+
+class Writer:
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+        self.words = array('I')
+
+    def string(self, s):
+        i = self.index.get(s)
+        if i is None:
+            i = self.index[s] = len(self.strings)
+            self.strings.append(s)
+        self.words.append(i)
+
+    def string_list(self, strings):
+        self.words.append(len(strings))
+        for s in strings:
+            self.string(s)
+
+    def funcs(self, funcs):
+        self.words.append(len(funcs))
+        for func in funcs:
+            self.string(func.name)
+            self.string_list(func.inputs)
+            self.words.append(len(func.blocks))
+            for block in func.blocks:
+                self.block(block)
+
+    def block(self, block):
+        self.string(block.name)
+        self.words.append(len(block.cmds))
+        for cmd in block.cmds:
+            is_asm = isinstance(cmd, Asm)
+            self.words.append(int(is_asm))
+            self.string(cmd.op)
+            self.words.append(0 if cmd.size is None else cmd.size + 1)
+            self.string_list(cmd.results)
+            self.string_list(cmd.args)
+            if is_asm:
+                self.string_list(cmd.inputs)
+                self.string_list(cmd.clobbers)
+                self.words.append(len(cmd.instrs))
+                for instr in cmd.instrs:
+                    self.string(instr.op)
+                    self.string_list(instr.args)
+        if block.live_in is None:
+            self.words.append(0)
+        else:
+            self.words.append(1)
+            self.string_list(block.live_in)
+            self.string_list(block.live_out)
+
+
+# Rebuild the functions from the word stream, with string giving the string
+# for an index. The words are walked with one iterator; each list is read as
+# its length followed by its elements.
+def read_funcs(words, string):
+    it = iter(words)
+    word = it.__next__
+
+    def string_list():
+        n = word()
+        strs = list(map(string, islice(it, n)))
+        if len(strs) != n:
+            raise StopIteration
+        return strs
+
+    def cmd():
+        is_asm = word()
+        op = string(word())
+        size = word()
+        size = None if size == 0 else size - 1
+        results = string_list()
+        args = string_list()
+        if not is_asm:
+            return Cmd(results, op, size, args)
+        inputs = string_list()
+        clobbers = string_list()
+        instrs = []
+        for _ in range(word()):
+            instr_op = string(word())
+            instrs.append(AsmInstr(instr_op, string_list()))
+        return Asm(results, op, size, args, inputs, clobbers, instrs)
+
+    try:
+        funcs = []
+        for _ in range(word()):
+            name = string(word())
+            inputs = string_list()
+            blocks = []
+            for _ in range(word()):
+                block_name = string(word())
+                block = Block(block_name, [cmd() for _ in range(word())])
+                if word():
+                    block.live_in = set(string_list())
+                    block.live_out = set(string_list())
+                blocks.append(block)
+            funcs.append(Func(name, inputs, blocks))
+    except (IndexError, StopIteration) as e:
+        raise CacheError('malformed IR cache payload') from e
+    if next(it, None) is not None:
+        raise CacheError('trailing data in IR cache payload')
+    return funcs
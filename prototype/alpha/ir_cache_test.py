@@ -0,0 +1,94 @@
+import ir_cache
+from ir_cache import CacheError
+
+import os
+import tempfile
+import unittest
+from textwrap import dedent
+from unittest import mock
+
+from alpha import load_ssa_funcs
+from common import strcat
+from parse import parse_lines
+
+
+TEXT = """
+  main
+    inputs n
+    start
+      x = add n 1
+      c = lt.2 x 10
+      br c loop done
+    loop
+      y, z = mul.2 x n
+      asm n y z : x : a
+        lda $1
+        sta $2
+      end
+      br done
+    done
+      ret x
+  end
+"""
+
+
+def text(funcs):
+  return [(f.name, f.inputs, strcat(*f.blocks)) for f in funcs]
+
+
+class TestIrCache(unittest.TestCase):
+  def test_round_trip(self):
+    funcs = parse_lines(TEXT)
+    loaded = ir_cache.loads(ir_cache.dumps(funcs, b'k' * 32), b'k' * 32)
+    self.assertEqual(text(loaded), text(funcs))
+    self.assertIsNone(loaded[0].blocks[0].live_in)
+
+  def test_live_sets(self):
+    (func,) = parse_lines(TEXT)
+    for block in func.blocks:
+      block.live_in = {'n'}
+      block.live_out = {'n', 'x'}
+    (loaded,) = ir_cache.loads(ir_cache.dumps([func], b'k' * 32))
+    self.assertEqual([(b.live_in, b.live_out) for b in loaded.blocks],
+                     [({'n'}, {'n', 'x'})] * 3)
+
+  def test_wrong_key(self):
+    data = ir_cache.dumps(parse_lines(TEXT), b'k' * 32)
+    with self.assertRaisesRegex(CacheError, 'different source'):
+      ir_cache.loads(data, b'j' * 32)
+
+  def test_corrupted(self):
+    data = bytearray(ir_cache.dumps(parse_lines(TEXT), b'k' * 32))
+    data[-1] ^= 1
+    with self.assertRaisesRegex(CacheError, 'digest'):
+      ir_cache.loads(data)
+    with self.assertRaisesRegex(CacheError, 'truncated'):
+      ir_cache.loads(data[:-1])
+
+  def test_load_ssa_funcs(self):
+    with tempfile.TemporaryDirectory() as d:
+      src = os.path.join(d, 'a.ir')
+      with open(src, 'w') as f:
+        f.write(dedent(TEXT))
+      cache = os.path.join(d, 'cache')
+      funcs = load_ssa_funcs([src], 'braun', cache)
+      (path,) = os.listdir(cache)
+      self.assertEqual(text(load_ssa_funcs([src], 'braun', cache)), text(funcs))
+      # A different engine is keyed separately.
+      load_ssa_funcs([src], 'cytron', cache)
+      self.assertEqual(len(os.listdir(cache)), 2)
+      # So is IR prepared by different code.
+      with mock.patch('alpha.prepare_code_version', return_value='changed'):
+        load_ssa_funcs([src], 'braun', cache)
+      self.assertEqual(len(os.listdir(cache)), 3)
+
+  def test_code_version(self):
+    with tempfile.TemporaryDirectory() as d:
+      path = os.path.join(d, 'm.py')
+      with open(path, 'w') as f:
+        f.write('x = 1\n')
+      before = ir_cache.code_version([path])
+      self.assertEqual(ir_cache.code_version([path]), before)
+      with open(path, 'w') as f:
+        f.write('x = 2\n')
+      self.assertNotEqual(ir_cache.code_version([path]), before)
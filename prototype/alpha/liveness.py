@@ -0,0 +1,122 @@
+from common import successor_names
+
+
+# Compute the live-in and live-out sets of every block, considering only the
+# values in defns. Returns a pair of dicts from block name to set of values.
+# successors gives the names of the blocks that control may flow to from a
+# block; by default, this follows br, jsr and rts terminators.
+#
+# Values are numbered densely and sets are kept as Python ints used as
+# bitsets. Blocks are processed with a worklist seeded in the postorder of a
+# depth-first search along successor edges, so most blocks settle on their
+# first visit.
+#
+# Phi arguments are live-out of the corresponding predecessor only, not
+# live-in to the block containing the phi.
+def compute_liveness(blocks, defns, successors=successor_names):
+    index = {}
+    values = []
+    for val in defns:
+        index[val] = len(values)
+        values.append(val)
+
+    def bits(vals):
+        b = 0
+        for v in vals:
+            i = index.get(v)
+            if i is not None:
+                b |= 1 << i
+        return b
+
+    succs = {}
+    preds = {}
+    for block in blocks:
+        succs[block.name] = []
+        preds[block.name] = []
+    for block in blocks:
+        for succ in successors(block):
+            if succ not in succs[block.name]:
+                succs[block.name].append(succ)
+                preds[succ].append(block.name)
+
+    # Upward-exposed uses and definitions of each block.
+    gen = {}
+    kill = {}
+    # Uses by phis in succ of values coming from pred, keyed by (pred, succ).
+    phi_uses = {}
+    for block in blocks:
+        g = 0
+        k = 0
+        for cmd in reversed(block.cmds):
+            r = bits(cmd.results)
+            k |= r
+            g &= ~r
+            if cmd.op == 'phi':
+                for a_block, a in zip(cmd.args[::2], cmd.args[1::2]):
+                    key = (a_block, block.name)
+                    phi_uses[key] = phi_uses.get(key, 0) | bits((a,))
+            else:
+                g |= bits(cmd.args)
+        gen[block.name] = g
+        kill[block.name] = k
+
+    order = postorder(blocks, succs)
+
+    live_in = dict.fromkeys(succs, 0)
+    live_out = dict.fromkeys(succs, 0)
+
+    # A stack popped from the end, so reverse to visit in postorder first.
+    worklist = list(reversed(order))
+    on_worklist = set(worklist)
+    while worklist:
+        name = worklist.pop()
+        on_worklist.discard(name)
+
+        out = 0
+        for succ in succs[name]:
+            out |= live_in[succ] | phi_uses.get((name, succ), 0)
+        live_out[name] = out
+
+        new_in = gen[name] | (out & ~kill[name])
+        if new_in == live_in[name]:
+            continue
+        live_in[name] = new_in
+        for pred in preds[name]:
+            if pred not in on_worklist:
+                on_worklist.add(pred)
+                worklist.append(pred)
+
+    def to_set(b):
+        s = set()
+        while b:
+            low = b & -b
+            s.add(values[low.bit_length() - 1])
+            b ^= low
+        return s
+
+    live_ins = {name: to_set(b) for name, b in live_in.items()}
+    live_outs = {name: to_set(b) for name, b in live_out.items()}
+    return live_ins, live_outs
+
+
+# Depth-first postorder of block names, starting from the first block. Blocks
+# not reachable from it are visited afterwards in program order.
+def postorder(blocks, succs):
+    order = []
+    visited = set()
+    for root in blocks:
+        if root.name in visited:
+            continue
+        visited.add(root.name)
+        stack = [(root.name, iter(succs[root.name]))]
+        while stack:
+            name, it = stack[-1]
+            for succ in it:
+                if succ not in visited:
+                    visited.add(succ)
+                    stack.append((succ, iter(succs[succ])))
+                    break
+            else:
+                stack.pop()
+                order.append(name)
+    return order
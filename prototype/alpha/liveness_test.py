@@ -0,0 +1,110 @@
+from liveness import compute_liveness
+
+import unittest
+
+from parse import parse_lines
+
+
+def definitions(func):
+  defns = set(func.inputs)
+  for block in func.blocks:
+    for cmd in block.cmds:
+      defns |= set(cmd.results)
+  return defns
+
+
+class TestLiveness(unittest.TestCase):
+  def test_straight_line(self):
+    (func,) = parse_lines("""
+      main
+        inputs n
+        start
+          a = add n 1
+          br next
+        next
+          b = add a 2
+          ret b
+      end
+    """)
+    live_ins, live_outs = compute_liveness(func.blocks, definitions(func))
+    self.assertEqual(live_ins, {'start': {'n'}, 'next': {'a'}})
+    self.assertEqual(live_outs, {'start': {'a'}, 'next': set()})
+
+  def test_loop(self):
+    (func,) = parse_lines("""
+      main
+        inputs n
+        start
+          br loop
+        loop
+          i = phi start 0 loop j
+          j = add i n
+          c = lt j 10
+          br c loop done
+        done
+          ret j
+      end
+    """)
+    live_ins, live_outs = compute_liveness(func.blocks, definitions(func))
+    self.assertEqual(live_ins['loop'], {'n'})
+    self.assertEqual(live_outs['loop'], {'n', 'j'})
+    self.assertEqual(live_outs['start'], {'n'})
+    self.assertEqual(live_ins['done'], {'j'})
+
+  def test_phi_args_live_out_of_matching_pred(self):
+    (func,) = parse_lines("""
+      main
+        start
+          a = add 1 1
+          b = add 2 2
+          br 1 left right
+        left
+          br join
+        right
+          br join
+        join
+          c = phi left a right b
+          ret c
+      end
+    """)
+    live_ins, live_outs = compute_liveness(func.blocks, definitions(func))
+    self.assertEqual(live_outs['left'], {'a'})
+    self.assertEqual(live_outs['right'], {'b'})
+    self.assertEqual(live_ins['join'], set())
+    self.assertEqual(live_outs['start'], {'a', 'b'})
+
+  def test_jsr_rts(self):
+    (func,) = parse_lines("""
+      main
+        start
+          a = add 1 1
+          jsr foo footer
+        foo
+          b = add 2 2
+          rts footer
+        footer
+          c = add a b
+          ret c
+      end
+    """)
+    live_ins, live_outs = compute_liveness(func.blocks, definitions(func))
+    self.assertEqual(live_outs['start'], {'a'})
+    self.assertEqual(live_ins['foo'], {'a'})
+    self.assertEqual(live_outs['foo'], {'a', 'b'})
+
+  def test_custom_successors(self):
+    (func,) = parse_lines("""
+      main
+        start
+          a = add 1 1
+          jsr foo footer
+        foo
+          rts footer
+        footer
+          ret a
+      end
+    """)
+    live_ins, live_outs = compute_liveness(
+        func.blocks, definitions(func), lambda block: [])
+    self.assertEqual(live_outs, {'start': set(), 'foo': set(), 'footer': set()})
+    self.assertEqual(live_ins['footer'], {'a'})
@@ -0,0 +1,71 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import os
+
+import ir_cache
+
+# Running a step on each function of a program in a pool of worker processes.
+#
+# step is called with one Func and changes it in place, so it must be a
+# module-level function (or a functools.partial of one) for the workers to
+# unpickle it. Functions are sent in chunks of consecutive functions, each in
+# the ir_cache format, and the step's results, live sets included, come back
+# the same way. The chunks are put back together in input order, so the result
+# doesn't depend on which worker finishes first.
+
+# Chunks per worker, so that a worker given small functions can take another
+# chunk while the others are still busy.
+CHUNKS_PER_JOB = 4
+
+KEY = bytes(32)
+
+
+# The number of workers for a --jobs value: 0 means one per CPU.
+def job_count(jobs):
+    return jobs or os.cpu_count() or 1
+
+
+# Run step on each of funcs and return the resulting functions. With one job
+# step runs here, on the functions themselves.
+def map_funcs(step, funcs, jobs=1):
+    jobs = job_count(jobs)
+    if jobs == 1 or len(funcs) < 2:
+        for func in funcs:
+            step(func)
+        return funcs
+
+    chunks = split(funcs, jobs * CHUNKS_PER_JOB)
+    with ProcessPoolExecutor(min(jobs, len(chunks))) as pool:
+        results = pool.map(run_chunk, repeat(step),
+                           [ir_cache.dumps(chunk, KEY) for chunk in chunks])
+        new_funcs = []
+        for data in results:
+            new_funcs += ir_cache.loads(data, KEY)
+    return new_funcs
+
+
+# Split funcs into at most n runs of consecutive functions with about the same
+# number of commands in each.
+def split(funcs, n):
+    sizes = [sum(len(b.cmds) for b in func.blocks) for func in funcs]
+    target = sum(sizes) / n
+    chunks = []
+    chunk = []
+    size = 0
+    for func, func_size in zip(funcs, sizes):
+        chunk.append(func)
+        size += func_size
+        if size >= target:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def run_chunk(step, data):
+    funcs = ir_cache.loads(data, KEY)
+    for func in funcs:
+        step(func)
+    return ir_cache.dumps(funcs, KEY)
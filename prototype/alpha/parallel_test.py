@@ -0,0 +1,52 @@
+from parallel import map_funcs, split
+
+import unittest
+from functools import partial
+
+from alpha import prepare_func
+from common import strcat
+from parse import parse_lines
+
+
+TEXT = """
+  f
+    inputs n
+    start
+      br loop
+    loop
+      i = add i 1
+      c = lt i n
+      br c loop done
+    done
+      ret i
+  end
+  g
+    inputs x
+    start
+      y = call f x
+      ret y
+  end
+  h
+    start
+      ret 0
+  end
+"""
+
+
+def result(funcs):
+  return [(f.name, strcat(*f.blocks), [(b.live_in, b.live_out) for b in f.blocks])
+          for f in funcs]
+
+
+class TestMapFuncs(unittest.TestCase):
+  def test_same_as_serial(self):
+    step = partial(prepare_func, engine='braun')
+    serial = map_funcs(step, parse_lines(TEXT))
+    self.assertEqual(result(map_funcs(step, parse_lines(TEXT), jobs=2)),
+                     result(serial))
+
+  def test_split(self):
+    funcs = parse_lines(TEXT)
+    chunks = split(funcs, 2)
+    self.assertEqual([[f.name for f in c] for c in chunks], [['f'], ['g', 'h']])
+    self.assertEqual(len(split(funcs, 8)), 3)
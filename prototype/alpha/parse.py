@@ -1,5 +1,6 @@
 import fileinput
 import re
+import sys
 
 from common import Func, Block, Cmd, Asm, AsmInstr
 
@@ -8,16 +9,17 @@ class ParseError(Exception):
     pass
 
 
-def parse():
-    return Parser(None).parse()
+def parse(files=None):
+    return Parser(None, files).parse()
 
 def parse_lines(inline):
     return Parser(inline).parse()
 
 class Parser:
-    def __init__(self, inline):
+    def __init__(self, inline, files=None):
         self.debug_line = None
         self.inline = inline
+        self.files = files
 
     def parse(self):
         try:
@@ -34,7 +36,7 @@ class Parser:
         return self.lineno if self.inline else fileinput.lineno()
 
     def _read_lines(self):
-        lines = self.inline.splitlines() if self.inline else fileinput.input()
+        lines = self.inline.splitlines() if self.inline else fileinput.input(self.files)
         self.lineno = 0
         for line in lines:
             self.lineno += 1
@@ -61,7 +63,7 @@ def _parse_func(first, rest):
 
     inputs = []
     while first.split()[0] == 'inputs':
-        inputs = first.split()[1:]
+        inputs = _split(first)[1:]
         first = next(rest)
 
     blocks = _parse_section(first, rest, _parse_block)
@@ -69,7 +71,7 @@ def _parse_func(first, rest):
 
 
 def _parse_block(first, rest):
-    (name,) = first.split()
+    (name,) = _split(first)
     first = next(rest)
     cmds = _parse_cmds(first, rest)
     return Block(name, cmds)
@@ -87,8 +89,8 @@ def _parse_cmds(first, rest):
 
 def _parse_cmd(first, rest):
     (results, expr) = re.fullmatch(r'(?:(.*) = )?(.*)', first).groups()
-    results = results.split() if results else []
-    (op_str, *args) = expr.split()
+    results = _split(results) if results else []
+    (op_str, *args) = _split(expr)
     (op, size) = re.fullmatch(r'(.*?)(\d)?', op_str).groups()
     size = size and int(size)
     if op == 'asm':
@@ -127,3 +129,7 @@ def _parse_section(first, rest, _parse_item):
             return items
 
 
+# Split a line into interned names, so that equal names share one string
+# object and compare by identity.
+def _split(line):
+    return list(map(sys.intern, line.split()))
@@ -0,0 +1,140 @@
+from contextlib import contextmanager, nullcontext
+import json
+import time
+import tracemalloc
+
+from attr import asdict, attrs, attrib
+
+# Profiling of pipeline passes, for finding out which passes and fixpoint
+# groups a compile spends its time and memory in.
+#
+# A PassManager given a PassProfile records each pass it runs: the time taken
+# (including the analyses the pass asks for), the group and round of the group
+# it ran in, whether it reported itself fixed, the block and command counts
+# before and after, and the peak memory traced while it ran. The number of
+# rounds each group took is recorded too, as are any counts a pass reports.
+# Without a profile the pass manager does none of this.
+
+@attrs(slots=True)
+class PassRecord:
+    name = attrib()
+    group = attrib(default=None)
+    # Which round of the group this was, counting from 1.
+    iteration = attrib(default=None)
+    fixed = attrib(default=None)
+    seconds = attrib(default=0.0)
+    blocks_before = attrib(default=None)
+    cmds_before = attrib(default=None)
+    blocks_after = attrib(default=None)
+    cmds_after = attrib(default=None)
+    # Traced memory when the pass started, and the most traced while it ran.
+    start_bytes = attrib(default=None)
+    peak_bytes = attrib(default=None)
+    # What the pass counted, if it reports anything.
+    report = attrib(default=None)
+
+
+# profile.measure, or nothing without a profile.
+def measure(profile, name, blocks=None, **info):
+    if profile is None:
+        return nullcontext()
+    return profile.measure(name, blocks, **info)
+
+
+def ir_size(blocks):
+    return len(blocks), sum(len(b.cmds) for b in blocks)
+
+
+class PassProfile:
+    def __init__(self, memory=True):
+        self.records = []
+        # (group, rounds) for each run of a group.
+        self.groups = []
+        self.memory = memory
+        self.started_tracing = memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    def stop(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    # Measure the code run in the with statement, and record it under name.
+    # Given blocks, their size is recorded before and after. The record is
+    # yielded for the caller to fill in anything else.
+    @contextmanager
+    def measure(self, name, blocks=None, **info):
+        record = PassRecord(name, **info)
+        if blocks is not None:
+            record.blocks_before, record.cmds_before = ir_size(blocks)
+        if self.memory:
+            tracemalloc.reset_peak()
+            record.start_bytes = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            if self.memory:
+                record.peak_bytes = tracemalloc.get_traced_memory()[1]
+            if blocks is not None:
+                record.blocks_after, record.cmds_after = ir_size(blocks)
+            self.records.append(record)
+
+    def report(self):
+        return {
+            'total_seconds': sum(r.seconds for r in self.records),
+            'passes': [asdict(r) for r in self.records],
+            'groups': [{'group': g, 'rounds': n} for g, n in self.groups],
+        }
+
+    def write_json(self, f):
+        json.dump(self.report(), f, indent=2)
+        f.write('\n')
+
+    # The counts reported by each pass, summed over its runs.
+    def reports(self):
+        totals = {}
+        for r in self.records:
+            if r.report:
+                counts = totals.setdefault(r.name, {})
+                for k, v in r.report.items():
+                    counts[k] = counts.get(k, 0) + v
+        return totals
+
+    # A table with a line for each pass name, in order of first use, then a
+    # line for each group and for each pass that reported counts.
+    def table(self):
+        rows = {}
+        for r in self.records:
+            row = rows.get(r.name)
+            if row is None:
+                row = rows[r.name] = {'calls': 0, 'seconds': 0.0, 'peak': None,
+                                      'before': (r.blocks_before, r.cmds_before)}
+            row['calls'] += 1
+            row['seconds'] += r.seconds
+            row['after'] = (r.blocks_after, r.cmds_after)
+            if r.peak_bytes is not None:
+                row['peak'] = max(row['peak'] or 0, r.peak_bytes)
+        total = sum(row['seconds'] for row in rows.values()) or 1
+
+        def size(blocks_cmds):
+            blocks, cmds = blocks_cmds
+            return '-' if blocks is None else f'{blocks}/{cmds}'
+
+        width = max([len('pass')] + [len(name) for name in rows])
+        lines = [f'{"pass":{width}} {"calls":>6} {"seconds":>9} {"%":>6} '
+                 f'{"blocks/cmds before":>18} {"after":>13} {"peak MB":>8}']
+        for name, row in rows.items():
+            peak = '-' if row['peak'] is None else f'{row["peak"] / 2**20:.1f}'
+            lines.append(
+                f'{name:{width}} {row["calls"]:6} {row["seconds"]:9.3f} '
+                f'{100 * row["seconds"] / total:6.1f} {size(row["before"]):>18} '
+                f'{size(row["after"]):>13} {peak:>8}')
+        for group, rounds in self.groups:
+            lines.append(f'group {group}: {rounds} rounds')
+        for name, counts in self.reports().items():
+            counts = ', '.join(f'{k} {v}' for k, v in counts.items())
+            lines.append(f'{name}: {counts}')
+        return '\n'.join(lines)
@@ -0,0 +1,149 @@
+import re
+
+
+class PipelineError(Exception):
+    pass
+
+
+# Declare the analyses a pass uses and the analyses it leaves valid. Each
+# used analysis is passed to the pass as a keyword argument of the same name.
+# Analyses not preserved are dropped from the cache after the pass runs.
+#
+# A pass declared with reports=True is also passed a dict as the keyword
+# argument report, in which it can count what it did. The counts are kept in
+# the pass's profile record, if there is a profile.
+#
+# A pass declared with after=[...] relies on the IR shape those passes leave,
+# and a pipeline that runs it before all of them have run is rejected.
+def declare(uses=(), preserves=(), reports=False, after=()):
+    def wrap(f):
+        f.uses = tuple(uses)
+        f.preserves = tuple(preserves)
+        f.reports = reports
+        f.after = tuple(after)
+        return f
+    return wrap
+
+
+# Lazily computed analyses of a block list. Results are cached until a pass
+# that doesn't preserve them runs. Analyses can declare the analyses they use
+# in the same way as passes.
+class AnalysisCache:
+    def __init__(self, analyses, blocks):
+        self.analyses = analyses
+        self.blocks = blocks
+        self.results = {}
+
+    def get(self, name):
+        if name not in self.results:
+            f = self.analyses[name]
+            kwargs = {a: self.get(a) for a in getattr(f, 'uses', ())}
+            self.results[name] = f(self.blocks, **kwargs)
+        return self.results[name]
+
+    def invalidate(self, preserved=()):
+        for name in list(self.results):
+            if name not in preserved:
+                del self.results[name]
+
+
+# Runs pipelines of passes over a block list.
+#
+# A pipeline is a sequence of steps, each of which is either a pass name or
+# the name of a group. A group is a list of passes run in order until every
+# one of them reports that it is fixed by returning a true value. Passes that
+# return None are treated as fixed.
+#
+# With a pass_profile.PassProfile, each pass run and the rounds of each group
+# are recorded in it.
+class PassManager:
+    def __init__(self, passes, analyses, groups=None, profile=None):
+        self.passes = passes
+        self.analyses = analyses
+        self.groups = dict(groups or {})
+        self.profile = profile
+
+    def run(self, blocks, steps):
+        cache = AnalysisCache(self.analyses, blocks)
+        for step in steps:
+            self._run_step(step, blocks, cache)
+
+    def _run_step(self, step, blocks, cache):
+        if step in self.groups:
+            fixed = False
+            rounds = 0
+            while not fixed:
+                fixed = True
+                rounds += 1
+                for name in self.groups[step]:
+                    fixed &= self._run_pass(name, blocks, cache, step, rounds)
+            if self.profile is not None:
+                self.profile.groups.append((step, rounds))
+        else:
+            self._run_pass(step, blocks, cache)
+
+    def _run_pass(self, name, blocks, cache, group=None, iteration=None):
+        if self.profile is None:
+            return self._call_pass(name, blocks, cache)
+        with self.profile.measure(name, blocks, group=group,
+                                  iteration=iteration) as record:
+            if getattr(self.passes[name], 'reports', False):
+                record.report = {}
+            record.fixed = self._call_pass(name, blocks, cache, record.report)
+        return record.fixed
+
+    def _call_pass(self, name, blocks, cache, report=None):
+        f = self.passes[name]
+        kwargs = {a: cache.get(a) for a in getattr(f, 'uses', ())}
+        if getattr(f, 'reports', False):
+            kwargs['report'] = {} if report is None else report
+        fixed = f(blocks, **kwargs)
+        cache.invalidate(getattr(f, 'preserves', ()))
+        return fixed is None or bool(fixed)
+
+    # Parse pipeline text and check that every step names a known pass or
+    # group, and that each pass runs after the passes it is declared after.
+    # Group definitions in the text are added to this manager. Returns the
+    # list of steps.
+    def parse(self, text):
+        groups, steps = parse_pipeline(text)
+        for name, members in groups.items():
+            for member in members:
+                if member not in self.passes:
+                    raise PipelineError(f'unknown pass in group {name}: {member}')
+        self.groups.update(groups)
+        for step in steps:
+            if step not in self.passes and step not in self.groups:
+                raise PipelineError(f'unknown pass: {step}')
+        ran = set()
+        for step in steps:
+            for name in self.groups.get(step, [step]):
+                for before in getattr(self.passes[name], 'after', ()):
+                    if before not in ran:
+                        raise PipelineError(f'{name} must run after {before}')
+                ran.add(name)
+        return steps
+
+
+# Parse pipeline text into group definitions and steps.
+#
+# Lines (or ';'-separated statements) are either a group definition of the
+# form 'name = pass pass ...' or a list of steps separated by whitespace or
+# commas. '#' starts a comment.
+def parse_pipeline(text):
+    groups = {}
+    steps = []
+    for line in text.splitlines():
+        line = line.split('#', 1)[0]
+        for stmt in line.split(';'):
+            names = re.split(r'[\s,]+', stmt.strip())
+            names = [n for n in names if n]
+            if not names:
+                continue
+            if '=' in names:
+                if len(names) < 3 or names[1] != '=' or names.count('=') != 1:
+                    raise PipelineError(f'malformed group: {stmt.strip()}')
+                groups[names[0]] = names[2:]
+            else:
+                steps.extend(names)
+    return groups, steps
@@ -0,0 +1,140 @@
+from passes import PassManager, PipelineError, declare, parse_pipeline
+
+import unittest
+
+from common import Block, Cmd
+from pass_profile import PassProfile
+
+
+class TestParsePipeline(unittest.TestCase):
+  def test_steps_and_groups(self):
+    groups, steps = parse_pipeline("""
+      # A comment
+      fold = a b
+      x, y fold  # Another comment
+      z; g = c
+    """)
+    self.assertEqual(groups, {'fold': ['a', 'b'], 'g': ['c']})
+    self.assertEqual(steps, ['x', 'y', 'fold', 'z'])
+
+  def test_malformed_group(self):
+    with self.assertRaises(PipelineError):
+      parse_pipeline('fold = ')
+    with self.assertRaises(PipelineError):
+      parse_pipeline('a fold = b')
+
+
+class TestPassManager(unittest.TestCase):
+  def setUp(self):
+    self.computed = []
+    self.log = []
+
+    def count(blocks):
+      self.computed.append('count')
+      return len(blocks)
+
+    @declare(uses=['count'], preserves=['count'])
+    def reads(blocks, count):
+      self.log.append(('reads', count))
+
+    @declare(uses=['count'])
+    def grows(blocks, count):
+      self.log.append(('grows', count))
+      blocks.append(len(blocks))
+
+    # Fixed once there are at least 3 blocks.
+    def until_three(blocks):
+      self.log.append(('until_three', len(blocks)))
+      if len(blocks) < 3:
+        blocks.append(len(blocks))
+        return False
+      return True
+
+    self.manager = PassManager(
+        {'reads': reads, 'grows': grows, 'until_three': until_three},
+        {'count': count})
+
+  def test_analysis_cached_while_preserved(self):
+    steps = self.manager.parse('reads reads')
+    self.manager.run([0], steps)
+    self.assertEqual(self.computed, ['count'])
+    self.assertEqual(self.log, [('reads', 1), ('reads', 1)])
+
+  def test_analysis_invalidated(self):
+    steps = self.manager.parse('reads grows reads')
+    self.manager.run([0], steps)
+    self.assertEqual(self.computed, ['count', 'count'])
+    self.assertEqual(self.log, [('reads', 1), ('grows', 1), ('reads', 2)])
+
+  def test_analysis_uses_analysis(self):
+    @declare(uses=['count'])
+    def double(blocks, count):
+      return 2 * count
+
+    @declare(uses=['double'])
+    def reads_double(blocks, double):
+      self.log.append(('reads_double', double))
+
+    manager = PassManager({'reads_double': reads_double},
+                          {'count': self.manager.analyses['count'], 'double': double})
+    manager.run([0, 1], manager.parse('reads_double'))
+    self.assertEqual(self.computed, ['count'])
+    self.assertEqual(self.log, [('reads_double', 4)])
+
+  def test_group_runs_to_fixpoint(self):
+    steps = self.manager.parse('g = until_three reads; g')
+    blocks = [0]
+    self.manager.run(blocks, steps)
+    self.assertEqual(blocks, [0, 1, 2])
+    self.assertEqual(self.log, [
+        ('until_three', 1), ('reads', 2),
+        ('until_three', 2), ('reads', 3),
+        ('until_three', 3), ('reads', 3)])
+
+  def test_profile(self):
+    def add_block(blocks):
+      blocks.append(Block(f'b{len(blocks)}', [Cmd([], 'ret', None, [])]))
+      return len(blocks) >= 2
+
+    profile = PassProfile(memory=False)
+    manager = PassManager({'add_block': add_block}, {}, profile=profile)
+    manager.run([], manager.parse('g = add_block; g'))
+    self.assertEqual(
+        [(r.name, r.group, r.iteration, r.fixed, r.blocks_before, r.cmds_after)
+         for r in profile.records],
+        [('add_block', 'g', 1, False, 0, 1), ('add_block', 'g', 2, True, 1, 2)])
+    self.assertEqual(profile.groups, [('g', 2)])
+    self.assertEqual(len(profile.table().splitlines()), 3)
+
+  def test_profile_report(self):
+    @declare(reports=True)
+    def count_blocks(blocks, report):
+      report['blocks'] = len(blocks)
+
+    profile = PassProfile(memory=False)
+    manager = PassManager({'count_blocks': count_blocks}, {}, profile=profile)
+    manager.run([Block('b0', [])], ['count_blocks', 'count_blocks'])
+    self.assertEqual([r.report for r in profile.records],
+                     [{'blocks': 1}, {'blocks': 1}])
+    self.assertEqual(profile.reports(), {'count_blocks': {'blocks': 2}})
+    self.assertEqual(profile.table().splitlines()[-1], 'count_blocks: blocks 2')
+    # Without a profile, the pass still gets somewhere to report to.
+    PassManager({'count_blocks': count_blocks}, {}).run([], ['count_blocks'])
+
+  def test_unknown_pass(self):
+    with self.assertRaises(PipelineError):
+      self.manager.parse('reads nope')
+    with self.assertRaises(PipelineError):
+      self.manager.parse('g = reads nope')
+
+  def test_after(self):
+    @declare(after=['grows'])
+    def needs_growth(blocks):
+      pass
+
+    self.manager.passes['needs_growth'] = needs_growth
+    with self.assertRaises(PipelineError):
+      self.manager.parse('reads needs_growth grows')
+    with self.assertRaises(PipelineError):
+      self.manager.parse('g = needs_growth grows; g')
+    self.assertEqual(self.manager.parse('g = grows needs_growth; g'), ['g'])
@@ -0,0 +1,47 @@
+# The strongly connected components of a graph, found with Tarjan's
+# algorithm using an explicit stack. successors maps a node to an iterable of
+# its successors; successors outside of nodes are visited too.
+#
+# Components are returned as lists, each one after every component reachable
+# from it. That is, in reverse topological order.
+def strongly_connected_components(nodes, successors):
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    sccs = []
+
+    def push(node):
+        index[node] = low[node] = len(index)
+        stack.append(node)
+        on_stack.add(node)
+        return (node, iter(successors(node)))
+
+    for root in nodes:
+        if root in index:
+            continue
+        work = [push(root)]
+        while work:
+            node, it = work[-1]
+            for succ in it:
+                if succ not in index:
+                    work.append(push(succ))
+                    break
+                if succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    scc = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        scc.append(member)
+                        if member == node:
+                            break
+                    scc.reverse()
+                    sccs.append(scc)
+    return sccs
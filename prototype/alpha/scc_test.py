@@ -0,0 +1,17 @@
+from scc import strongly_connected_components
+
+import unittest
+
+
+class TestScc(unittest.TestCase):
+  def test_reverse_topological_order(self):
+    graph = {'a': ['b'], 'b': ['a', 'c'], 'c': ['c', 'd'], 'd': []}
+    self.assertEqual(
+        strongly_connected_components(graph, graph.__getitem__),
+        [['d'], ['c'], ['a', 'b']])
+
+  def test_long_path(self):
+    n = 10000
+    sccs = strongly_connected_components(
+        range(n), lambda i: [i + 1] if i + 1 < n else [])
+    self.assertEqual(sccs, [[i] for i in reversed(range(n))])
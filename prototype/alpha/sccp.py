@@ -0,0 +1,353 @@
+import ast
+
+from cfg import CFG
+from common import remove_copies
+from def_use import DefUse
+from passes import declare
+
+
+# Sparse conditional constant propagation (Wegman and Zadeck).
+#
+# Each value starts out UNKNOWN and moves down the lattice to a constant and
+# then to VARYING. Only blocks reachable through executable edges are
+# evaluated, and a br on a constant only makes one of its edges executable, so
+# constants flowing around loops and through branches are found in a single
+# worklist run.
+#
+# The ALU ops are modelled at 8 bits, including their flag results: the last
+# result of a two or three result adc, sbc or ror is Z, and the middle result
+# of a three result one is carry. That is, this runs after add_z_results, and
+# the pass manager rejects pipelines that run it before, since legalize's
+# carry chains are [result, carry] until then. cmp results are [eq, ge]. Flags
+# are the constants 0 and 1.
+#
+# Afterwards, uses of constant values are replaced by the constants, constant
+# results of commands without side effects are dropped, br on a constant
+# becomes an unconditional br, and unreachable blocks are deleted. The CFG is
+# updated to match.
+
+UNKNOWN = None
+VARYING = 'varying'
+
+IMPURE_OPS = ('br', 'jsr', 'rts', 'ret', 'call', 'save', 'restore', 'store', 'asm')
+
+
+@declare(uses=['cfg'], preserves=['cfg'], after=['add_z_results'])
+def sccp(blocks, cfg=None):
+    if cfg is None:
+        cfg = CFG(blocks)
+    rewrite(blocks, cfg, *Solver(blocks, cfg).solve())
+
+
+class Solver:
+    def __init__(self, blocks, cfg):
+        self.blocks = blocks
+        self.blocks_by_name = cfg.blocks_by_name
+        self.du = DefUse(blocks)
+        self.values = {}
+        self.executable_blocks = set()
+        self.executable_edges = set()
+        self.forced_branches = set()
+        self.flow_worklist = []
+        self.ssa_worklist = []
+
+        # The jsr block for each return block, and the rts blocks returning
+        # to it. A return block is only reached through an rts once the jsr
+        # that returns to it has run.
+        self.jsr_for_return = {}
+        self.rts_into = {}
+        for block in blocks:
+            term = block.cmds[-1]
+            if term.op == 'jsr' and len(term.args) > 1:
+                self.jsr_for_return[term.args[1]] = block.name
+            self.rts_into[block.name] = [
+                p.name for p in block.preds if p.cmds[-1].op == 'rts']
+
+    def solve(self):
+        for block in self.blocks:
+            if block is self.blocks[0] or not block.preds:
+                self.flow_worklist.append((None, block.name))
+
+        while True:
+            self._propagate()
+            # A br on a value that never became known (e.g. undef) could go
+            # either way.
+            unresolved = [b for b in self.executable_blocks
+                          if self._is_unresolved_branch(b)]
+            if not unresolved:
+                break
+            for name in unresolved:
+                self.forced_branches.add(name)
+                self._visit_terminator(self.blocks_by_name[name])
+
+        return self.values, self.executable_blocks, self.executable_edges
+
+    def _is_unresolved_branch(self, name):
+        term = self.blocks_by_name[name].cmds[-1]
+        return (term.op == 'br' and len(term.args) == 3 and
+                name not in self.forced_branches and
+                self.value(term.args[0]) is UNKNOWN)
+
+    def _propagate(self):
+        while self.flow_worklist or self.ssa_worklist:
+            while self.flow_worklist:
+                pred, name = self.flow_worklist.pop()
+                if (pred, name) in self.executable_edges:
+                    continue
+                self.executable_edges.add((pred, name))
+                block = self.blocks_by_name[name]
+                if name not in self.executable_blocks:
+                    self.executable_blocks.add(name)
+                    for cmd in block.cmds:
+                        self._visit(cmd)
+                else:
+                    for cmd in block.cmds:
+                        if cmd.op == 'phi':
+                            self._visit(cmd)
+
+            while self.ssa_worklist:
+                value = self.ssa_worklist.pop()
+                for cmd in self.du.uses(value):
+                    if cmd.block.name in self.executable_blocks:
+                        self._visit(cmd)
+
+    def value(self, arg):
+        if arg in self.du.defs:
+            return self.values.get(arg, UNKNOWN)
+        if arg == 'undef':
+            return UNKNOWN
+        return constant(arg)
+
+    def _visit(self, cmd):
+        if cmd.is_terminator():
+            self._visit_terminator(cmd.block)
+            return
+        if cmd.op == 'phi':
+            name = cmd.block.name
+            v = UNKNOWN
+            for i in range(0, len(cmd.args), 2):
+                if (cmd.args[i], name) in self.executable_edges:
+                    v = meet(v, self.value(cmd.args[i+1]))
+            results = [v]
+        else:
+            results = evaluate(cmd, self.value)
+        for r, v in zip(cmd.results, results):
+            if r == '_':
+                continue
+            old = self.values.get(r, UNKNOWN)
+            new = meet(old, v)
+            if new != old:
+                self.values[r] = new
+                self.ssa_worklist.append(r)
+
+    def _visit_terminator(self, block):
+        term = block.cmds[-1]
+        name = block.name
+        if term.op == 'br':
+            if len(term.args) == 1:
+                self.flow_worklist.append((name, term.args[0]))
+                return
+            cond = self.value(term.args[0])
+            if cond is UNKNOWN and name not in self.forced_branches:
+                return
+            if cond in (UNKNOWN, VARYING):
+                self.flow_worklist.append((name, term.args[1]))
+                self.flow_worklist.append((name, term.args[2]))
+            else:
+                self.flow_worklist.append((name, term.args[1 if cond else 2]))
+        elif term.op == 'jsr':
+            self.flow_worklist.append((name, term.args[0]))
+            if len(term.args) > 1:
+                ret = term.args[1]
+                for rts in self.rts_into[ret]:
+                    if rts in self.executable_blocks:
+                        self.flow_worklist.append((rts, ret))
+        elif term.op == 'rts':
+            for ret in term.args:
+                jsr = self.jsr_for_return.get(ret)
+                if jsr is None or jsr in self.executable_blocks:
+                    self.flow_worklist.append((name, ret))
+
+
+def meet(a, b):
+    if a is UNKNOWN:
+        return b
+    if b is UNKNOWN or a == b:
+        return a
+    return VARYING
+
+
+# The value of a constant argument, or VARYING for names that aren't defined
+# by a command (function inputs).
+def constant(arg):
+    if arg == 'true':
+        return 1
+    if arg == 'false':
+        return 0
+    try:
+        if arg.startswith("'"):
+            return ord(ast.literal_eval(arg))
+        return int(arg, 0)
+    except (SyntaxError, TypeError, ValueError):
+        return VARYING
+
+
+# The lattice values of the results of a non-phi command, given a function
+# from arguments to their lattice values.
+def evaluate(cmd, value):
+    n = len(cmd.results)
+    if cmd.op in IMPURE_OPS or cmd.size is not None:
+        return [VARYING] * n
+    args = [value(a) for a in cmd.args]
+
+    if cmd.op == 'copy':
+        return args
+    if cmd.op == 'and':
+        if 0 in args:
+            return [0]
+        if 1 in args:
+            return [args[1] if args[0] == 1 else args[0]]
+        return [VARYING if VARYING in args else UNKNOWN]
+    if cmd.op == 'or':
+        if 1 in args:
+            return [1]
+        if 0 in args:
+            return [args[1] if args[0] == 0 else args[0]]
+        return [VARYING if VARYING in args else UNKNOWN]
+
+    if UNKNOWN in args:
+        return [UNKNOWN] * n
+    if cmd.op == 'not':
+        return [VARYING if args[0] is VARYING else int(not args[0])]
+    if cmd.op in ('cmp', 'eq', 'ge'):
+        same = cmd.args[0] == cmd.args[1]
+        eq = 1 if same else compare(args, lambda a, b: a == b)
+        (a_lo, a_hi), (b_lo, b_hi) = (bounds(a) for a in args)
+        if same or a_lo >= b_hi:
+            ge = 1
+        elif a_hi < b_lo:
+            ge = 0
+        else:
+            ge = VARYING
+        return {'cmp': [eq, ge], 'eq': [eq], 'ge': [ge]}[cmd.op]
+    if cmd.op in ('adc', 'sbc', 'ror'):
+        return flag_results(cmd, *ALU[cmd.op](args))
+    return [VARYING] * n
+
+
+def compare(args, f):
+    if VARYING in args:
+        return VARYING
+    return int(f(*args))
+
+
+# The least and greatest possible value of a byte or flag.
+def bounds(v, top=255):
+    return (0, top) if v is VARYING else (v, v)
+
+
+def adc(args):
+    (a_lo, a_hi), (b_lo, b_hi), (c_lo, c_hi) = (
+        bounds(args[0]), bounds(args[1]), bounds(args[2], 1))
+    lo = a_lo + b_lo + c_lo
+    hi = a_hi + b_hi + c_hi
+    carry = 1 if lo >= 256 else 0 if hi < 256 else VARYING
+    result = lo & 0xff if lo == hi else VARYING
+    return result, carry
+
+
+# The carry in and out of sbc is the inverse of the borrow.
+def sbc(args):
+    (a_lo, a_hi), (b_lo, b_hi), (c_lo, c_hi) = (
+        bounds(args[0]), bounds(args[1]), bounds(args[2], 1))
+    lo = a_lo - b_hi - (1 - c_lo)
+    hi = a_hi - b_lo - (1 - c_hi)
+    carry = 1 if lo >= 0 else 0 if hi < 0 else VARYING
+    result = lo & 0xff if lo == hi else VARYING
+    return result, carry
+
+
+def ror(args):
+    a, c = args
+    carry = VARYING if a is VARYING else a & 1
+    result = VARYING if VARYING in args else (a >> 1) | (c << 7)
+    return result, carry
+
+
+ALU = {'adc': adc, 'sbc': sbc, 'ror': ror}
+
+
+def flag_results(cmd, result, carry):
+    z = VARYING if result is VARYING else int(result == 0)
+    return {1: [result], 2: [result, z], 3: [result, carry, z]}[len(cmd.results)]
+
+
+def rewrite(blocks, cfg, values, executable_blocks, executable_edges):
+    def arg_value(arg):
+        v = values.get(arg)
+        return arg if v in (UNKNOWN, VARYING) else str(v)
+
+    new_blocks = []
+    dead_blocks = []
+    for block in blocks:
+        if block.name not in executable_blocks:
+            dead_blocks.append(block)
+            continue
+        new_blocks.append(block)
+        cmds = []
+        for cmd in block.cmds:
+            if cmd.op == 'phi':
+                (result,) = cmd.results
+                if values.get(result) not in (UNKNOWN, VARYING):
+                    continue
+                args = []
+                for i in range(0, len(cmd.args), 2):
+                    if (cmd.args[i], block.name) in executable_edges:
+                        args += [cmd.args[i], arg_value(cmd.args[i+1])]
+                if len(args) == 2:
+                    cmd.op = 'copy'
+                    del args[0]
+                cmd.args = args
+                cmds.append(cmd)
+                continue
+
+            cmd.args = [arg_value(a) for a in cmd.args]
+            if cmd.op == 'br' and len(cmd.args) == 3:
+                taken = [t for t in cmd.args[1:]
+                         if (block.name, t) in executable_edges]
+                if len(taken) == 1:
+                    cmd.args = taken
+                    cfg.update(block)
+            elif cmd.op == 'jsr' and len(cmd.args) > 1:
+                if cmd.args[1] not in executable_blocks:
+                    del cmd.args[1:]
+            elif cmd.op == 'rts':
+                cmd.args = [r for r in cmd.args
+                            if (block.name, r) in executable_edges]
+                cfg.update(block)
+
+            # and with true and or with false pass their other arg through.
+            if cmd.op in ('and', 'or'):
+                identity = 1 if cmd.op == 'and' else 0
+                args = [constant(a) for a in cmd.args]
+                if identity in args:
+                    del cmd.args[args.index(identity)]
+                    cmd.op = 'copy'
+                    cmds.append(cmd)
+                    continue
+
+            # Drop constant results, and the command if nothing else is left.
+            if cmd.op not in IMPURE_OPS:
+                folded = False
+                for i, r in enumerate(cmd.results):
+                    if values.get(r) not in (UNKNOWN, VARYING):
+                        cmd.results[i] = '_'
+                        folded = True
+                if folded and all(r == '_' for r in cmd.results):
+                    continue
+            cmds.append(cmd)
+        block.cmds = cmds
+    blocks[:] = new_blocks
+    cfg.remove_all(dead_blocks)
+
+    remove_copies(blocks)
@@ -0,0 +1,161 @@
+from sccp import sccp
+
+import unittest
+from textwrap import dedent
+
+from alpha import ANALYSES, PASSES
+from common import strcat
+from parse import parse_lines
+from passes import PassManager, PipelineError
+
+
+def run(text):
+  (func,) = parse_lines(text)
+  sccp(func.blocks)
+  return strcat(*func.blocks)
+
+
+class TestSccp(unittest.TestCase):
+  def test_constant_branch(self):
+    self.assertEqual(run("""
+      main
+        inputs n
+        start
+          a _ _ = adc 200 100 0
+          c = cmp a 44
+          br c left right
+        left
+          br join
+        right
+          br join
+        join
+          d = phi left 1 right n
+          ret d
+      end
+    """), dedent("""\
+      start
+        br left
+      left
+        br join
+      join
+        ret 1
+    """))
+
+  def test_loop_carried_constant(self):
+    self.assertEqual(run("""
+      main
+        inputs n
+        start
+          br loop
+        loop
+          i = phi start 0 loop j
+          j _ _ = adc i 0 0
+          k _ _ = adc n i 0
+          c _ = cmp k 0
+          br c loop done
+        done
+          ret k
+      end
+    """), dedent("""\
+      start
+        br loop
+      loop
+        k _ _ = adc n 0 0
+        c _ = cmp k 0
+        br c loop done
+      done
+        ret k
+    """))
+
+  def test_flags(self):
+    self.assertEqual(run("""
+      main
+        inputs x y
+        start
+          a c1 _ = adc x 0 0
+          b c2 z = sbc x 0 1
+          d c3 _ = ror 3 c1
+          e ge = cmp y 0
+          f = and ge c2
+          g = or z e
+          ret a b c1 c2 c3 d f g
+      end
+    """), dedent("""\
+      start
+        a _ _ = adc x 0 0
+        b _ z = sbc x 0 1
+        e _ = cmp y 0
+        g = or z e
+        ret a b 0 1 1 1 1 g
+    """))
+
+  def test_one_result(self):
+    self.assertEqual(run("""
+      main
+        start
+          a = adc 200 100 0
+          b = sbc 3 5 1
+          ret a b
+      end
+    """), dedent("""\
+      start
+        ret 44 254
+    """))
+
+  def test_runs_after_z_results(self):
+    manager = PassManager(PASSES, ANALYSES)
+    with self.assertRaises(PipelineError):
+      manager.parse('to_ssa lower_cmp legalize; sccp')
+    manager.parse('to_ssa lower_cmp legalize add_z_results; sccp')
+
+  def test_unknown_branch_takes_both_edges(self):
+    self.assertEqual(run("""
+      main
+        start
+          br undef left right
+        left
+          ret 1
+        right
+          ret 2
+      end
+    """), dedent("""\
+      start
+        br undef left right
+      left
+        ret 1
+      right
+        ret 2
+    """))
+
+  def test_return_after_unreachable_call(self):
+    self.assertEqual(run("""
+      main
+        start
+          br 0 call done
+        call
+          jsr foo call_ret
+        call_ret
+          br done
+        done
+          ret
+        other
+          jsr foo other_ret
+        other_ret
+          a _ = cmp 1 1
+          ret a
+        foo
+          rts call_ret other_ret
+      end
+    """), dedent("""\
+      start
+        br done
+      done
+        ret
+      other
+        jsr foo other_ret
+      other_ret
+        ret 1
+      foo
+        rts other_ret
+    """))
+
@@ -1,12 +1,31 @@
 from collections import defaultdict
 import itertools
 
+from cfg import CFG, CFG_ANALYSES
 from common import Cmd
-from common import collect_predecessors, new_name, remove_copies
+from common import Names, new_name, remove_copies
+from def_use import is_use
+from dominance import DominatorTree
+from liveness import compute_liveness
+from passes import declare
+from scc import strongly_connected_components
+
+# Convert blocks to SSA form. engine selects how phis are placed:
+#
+# braun: phis are inserted on the fly while looking up reaching definitions,
+#   and redundant ones are removed afterwards.
+# cytron: phis are placed up front at the iterated dominance frontiers of
+#   each value's definitions, only where the value is live, and values are
+#   renamed in one walk of the dominator tree.
+@declare(uses=['cfg'], preserves=CFG_ANALYSES)
+def to_ssa(blocks, engine='braun', cfg=None):
+    if engine not in ('braun', 'cytron'):
+        raise ValueError(f'unknown SSA engine: {engine}')
+    if cfg is None:
+        cfg = CFG(blocks)
 
-def to_ssa(blocks):
     # SSA values that have been already defined.
-    defns = set()
+    defns = Names()
 
     # A map from a pre-ssa variable to all its post-ssa definitions.
     new_values = defaultdict(set)
@@ -20,18 +39,42 @@ def to_ssa(blocks):
         new_values[result].add(chosen)
         return chosen
 
+    if engine == 'cytron':
+        preds = {b.name: [p.name for p in b.preds] for b in blocks}
+        tree = DominatorTree(blocks, preds)
+        phi_vars = place_phis(blocks, tree)
+
     # Renumber all definitions.
     for block in blocks:
         for cmd in block.cmds:
             cmd.results = list(map(renumber, cmd.results))
 
-    relabel_uses(blocks, new_values, renumber)
+    if engine == 'cytron':
+        rename_values(blocks, cfg, tree, phi_vars, new_values, renumber)
+    else:
+        relabel_uses(blocks, cfg, new_values, renumber)
+
+    remove_redundant_phis(blocks)
+    remove_copies(blocks)
 
 # Replace each use of an old value with the corresponding relabeled value.
 # Inserts phi instructions as necessary.
-def relabel_uses(blocks, new_values, renumber):
-    preds = collect_predecessors(blocks)
-
+#
+# Reaching definitions are found on the fly as in Braun et al., "Simple and
+# Efficient Construction of Static Single Assignment Form". The definition of
+# each value at the end of each block is looked up in a map, and a lookup
+# that reaches the top of a block inserts a phi there and then looks up its
+# arguments in the predecessors. Those lookups are driven by an explicit
+# stack, so long chains of blocks don't recurse.
+#
+# A lookup that reaches the top of the block a jsr returns to skips over the
+# subroutine to the jsr's block if neither the subroutine nor anything it
+# calls defines the value, so values live across calls don't get phis all
+# through the subroutine. Otherwise, lookups carry a stack of the return
+# blocks they passed through, and a lookup that reaches the entry of a
+# subroutine only continues into the jsr that returns to the innermost of
+# them.
+def relabel_uses(blocks, cfg, new_values, renumber):
     rts_targets = set()
     for block in blocks:
         for cmd in block.cmds:
@@ -39,135 +82,388 @@ def relabel_uses(blocks, new_values, renumber):
                 continue
             rts_targets |= set(cmd.args)
 
-    # Look up the reaching definition of a value at a given command.
-    def lookup_renumbered_value(val, cmd_index, block, rts_stack):
-        # Handle constants, block refs, anything not defined by a cmd.
-        if val not in new_values:
-            return val
+    old_value = {}
+    for val, values in new_values.items():
+        for v in values:
+            old_value[v] = val
 
-        # If the value is defined in this block, return the
-        # latest definition.
-        for i in range(cmd_index-1, -1, -1):
-            for r in block.cmds[i].results:
-                if r in new_values[val]:
-                    return r
-
-        # Insert an phi without any arguments.
-        new_v = renumber(val)
-        args = []
-        phi = Cmd([new_v], 'phi_tmp', None, args)
-        block.cmds.insert(0, phi)
-
-        # Recursively look up the arguments of the phi. Since the phi
-        # was already inserted, it will terminate any loops in the
-        # dataflow graph by referencing itself.
-        for pred in preds[block.name]:
-            if pred.cmds[-1].op == 'jsr' and rts_stack:
-                if pred.cmds[-1].args[1] != rts_stack[-1]:
-                    continue
-                else:
-                    args.append(pred.name)
-                    args.append(lookup_value_from_end(val, pred, rts_stack[:-1]))
-            else:
-                args.append(pred.name)
-                args.append(lookup_value_from_end(val, pred, rts_stack))
-        return new_v
+    # The definition of each old value at the end of each block.
+    end_defs = {b.name: {} for b in blocks}
+    for block in blocks:
+        for cmd in block.cmds:
+            for r in cmd.results:
+                if r in old_value:
+                    end_defs[block.name][old_value[r]] = r
+
+    jsr_blocks, subroutine_defs = find_subroutine_defs(blocks, cfg, end_defs)
 
-    # Look up reaching definition of a value from the end of a block.
+    # The phis inserted at the top of each block, by old value.
+    top_phis = {b.name: {} for b in blocks}
+    # The definitions reaching the top of return blocks that were skipped
+    # over to their jsr, by old value.
+    top_skips = {b.name: {} for b in blocks}
+
+    # Look up the definition of val at the end of block, inserting phis as
+    # needed.
     def lookup_value_from_end(val, block, rts_stack):
         if block.name in rts_targets:
             rts_stack += (block.name,)
-        return lookup_renumbered_value(val, len(block.cmds), block, rts_stack)
+        defn = end_defs[block.name].get(val)
+        if defn is not None:
+            return defn
+        return lookup_phi(val, block, rts_stack)
 
-    for block in blocks:
-            rts_stack = ()
+    # Find the definition of val at the top of block, skipping over
+    # subroutines that don't define it. Returns the definition and, if a new
+    # phi had to be inserted for it, the phi's lookup to push on the stack.
+    def lookup_top(val, block, rts_stack):
+        skipped = []
+        while True:
+            phi = top_phis[block.name].get(val)
+            if phi is not None:
+                defn, lookup = phi.results[0], None
+                break
+            defn = top_skips[block.name].get(val)
+            if defn is not None:
+                lookup = None
+                break
+            jsr_block = jsr_blocks.get(block.name)
+            if jsr_block is None or val in subroutine_defs[jsr_block.cmds[-1].args[0]]:
+                phi = insert_phi(val, block)
+                defn, lookup = phi.results[0], (phi, block, rts_stack, iter(block.preds))
+                break
+            skipped.append(block.name)
+            if block.name in rts_targets:
+                rts_stack = rts_stack[:-1]
+            block = jsr_block
             if block.name in rts_targets:
                 rts_stack += (block.name,)
-            for cmd_index, cmd in enumerate(block.cmds):
-                # Only newly added phis should be skipped.
-                if cmd.op == 'phi_tmp':
+            defn = end_defs[block.name].get(val)
+            if defn is not None:
+                lookup = None
+                break
+        for name in skipped:
+            top_skips[name][val] = defn
+        return defn, lookup
+
+    # Look up the definition of val at the top of block, inserting a phi if
+    # there isn't one already.
+    def lookup_phi(val, block, rts_stack):
+        result, lookup = lookup_top(val, block, rts_stack)
+        stack = [lookup] if lookup is not None else []
+        while stack:
+            phi, block, rts_stack, it = stack[-1]
+            for pred in it:
+                pred_stack = rts_stack
+                if pred.cmds[-1].op == 'jsr' and rts_stack:
+                    if pred.cmds[-1].args[1] != rts_stack[-1]:
+                        continue
+                    pred_stack = rts_stack[:-1]
+                if pred.name in rts_targets:
+                    pred_stack += (pred.name,)
+
+                phi.args.append(pred.name)
+                defn = end_defs[pred.name].get(val)
+                if defn is not None:
+                    phi.args.append(defn)
                     continue
-                def lookup_value(val):
-                    nonlocal cmd_index
-                    old_size = len(block.cmds)
-                    ret = lookup_renumbered_value(val, cmd_index, block, rts_stack)
-                    if len(block.cmds) != old_size:
-                        cmd_index += 1
-                    return ret
-                if cmd.op == 'phi':
-                    for i in range(0, len(cmd.args), 2):
-                        blk = cmd.args[i]
-                        (blk,) = (b for b in blocks if b.name == cmd.args[i])
-                        cmd.args[i+1] = lookup_value_from_end(cmd.args[i+1], blk, rts_stack)
-                else:
-                    cmd.args = list(map(lookup_value, cmd.args))
-
-    # Change all temporary phis back to regular phis.
+
+                # Since a new phi is inserted before its args are looked up,
+                # it terminates any loops in the dataflow graph by referencing
+                # itself.
+                defn, lookup = lookup_top(val, pred, pred_stack)
+                phi.args.append(defn)
+                if lookup is not None:
+                    stack.append(lookup)
+                    break
+            else:
+                stack.pop()
+        return result
+
+    def insert_phi(val, block):
+        phi = Cmd([renumber(val)], 'phi', None, [])
+        top_phis[block.name][val] = phi
+        return phi
+
     for block in blocks:
+        rts_stack = ()
+        if block.name in rts_targets:
+            rts_stack += (block.name,)
+        # The latest definition of each old value so far in this block.
+        local_defs = {}
         for cmd in block.cmds:
-            if cmd.op == 'phi_tmp':
-                cmd.op = 'phi'
-
-    # Remove redundant phi instructions and relabel their uses iteratively
-    # until none are left.
-    while True:
-        redundant_phis = collect_redundant_phis(blocks)
-        if not redundant_phis:
-            break
-        remove_redundant_phis(blocks, redundant_phis)
-        relabel_redundant_phi_uses(blocks, redundant_phis)
+            if cmd.op == 'phi':
+                for i in range(1, len(cmd.args), 2):
+                    val = cmd.args[i]
+                    if val in new_values:
+                        pred = cfg.block(cmd.args[i-1])
+                        cmd.args[i] = lookup_value_from_end(val, pred, rts_stack)
+            else:
+                for i, val in enumerate(cmd.args):
+                    # Constants, block refs, anything not defined by a cmd.
+                    if val not in new_values:
+                        continue
+                    if val in local_defs:
+                        cmd.args[i] = local_defs[val]
+                    else:
+                        cmd.args[i] = lookup_phi(val, block, rts_stack)
+            for r in cmd.results:
+                if r in old_value:
+                    local_defs[old_value[r]] = r
 
-    remove_copies(blocks)
+    # Phis inserted later go first, before those inserted earlier.
+    for block in blocks:
+        block.cmds[:0] = reversed(top_phis[block.name].values())
+
+
+# Find the jsr block for each return block, and the old values that each
+# subroutine or anything it calls defines, given the values defined in each
+# block. A subroutine's blocks are those reached from its entry along br
+# edges and from each jsr to its return block. Returns the two as dicts, from
+# return block name to jsr block and from subroutine name to set of values.
+def find_subroutine_defs(blocks, cfg, end_defs):
+    jsr_blocks = {}
+    for block in blocks:
+        term = block.cmds[-1]
+        if term.op == 'jsr' and len(term.args) > 1:
+            jsr_blocks[term.args[1]] = block
+
+    defs = {}
+    callees = {}
+    for block in blocks:
+        term = block.cmds[-1]
+        if term.op != 'jsr' or term.args[0] in defs:
+            continue
+        entry = term.args[0]
+        defs[entry] = set()
+        callees[entry] = set()
+        seen = {entry}
+        work = [entry]
+        while work:
+            b = cfg.block(work.pop())
+            defs[entry].update(end_defs[b.name])
+            t = b.cmds[-1]
+            if t.op == 'jsr':
+                callees[entry].add(t.args[0])
+                succs = t.args[1:]
+            elif t.op == 'br':
+                succs = [s.name for s in b.succs]
+            else:
+                succs = []
+            for s in succs:
+                if s not in seen:
+                    seen.add(s)
+                    work.append(s)
+
+    # Components come callees first, so each one's callees are done.
+    subroutine_defs = {}
+    for scc in strongly_connected_components(callees, lambda s: callees.get(s, ())):
+        d = set()
+        for s in scc:
+            d |= defs.get(s, set())
+            for c in callees.get(s, ()):
+                if c not in scc:
+                    d |= subroutine_defs[c]
+        for s in scc:
+            subroutine_defs[s] = d
+    return jsr_blocks, subroutine_defs
+
+
+def cfg_successor_names(block):
+    return [succ.name for succ in block.succs]
 
 
-def collect_redundant_phis(blocks):
-    redundant_phis = {}
+# Choose where phis go, before definitions are renumbered. A variable gets a
+# phi at each block in the iterated dominance frontier of the blocks defining
+# it, as long as it is live into that block. Returns a list of (block name,
+# variable) pairs.
+def place_phis(blocks, tree):
+    def_blocks = defaultdict(list)
     for block in blocks:
         for cmd in block.cmds:
-            if cmd.op != 'phi':
-                continue
-            (result,) = cmd.results
-            is_redundant = True
-            real_arg = None
-            for arg in cmd.args[1::2]:
-                if arg == result or arg == 'undef':
+            for r in cmd.results:
+                if r != '_' and block.name not in def_blocks[r]:
+                    def_blocks[r].append(block.name)
+
+    live_ins, _ = compute_liveness(blocks, def_blocks, cfg_successor_names)
+    frontiers = tree.frontiers
+
+    phi_vars = []
+    for var, defs in def_blocks.items():
+        has_phi = set()
+        worklist = list(defs)
+        while worklist:
+            name = worklist.pop()
+            for df in frontiers[name]:
+                if df in has_phi or var not in live_ins[df]:
                     continue
-                elif real_arg is None:
-                    real_arg = arg
-                elif real_arg != arg:
-                    is_redundant = False
-                    break
-            if is_redundant:
-                if real_arg is None:
-                    real_arg = 'undef'
-                redundant_phis[result] = real_arg
+                has_phi.add(df)
+                phi_vars.append((df, var))
+                if df not in defs:
+                    worklist.append(df)
+    return phi_vars
 
-    is_closed = False
-    while not is_closed:
-        is_closed = True
-        for phi, val in redundant_phis.items():
-            if val in redundant_phis:
-                redundant_phis[phi] = redundant_phis[val]
-                is_closed = False
 
-    return redundant_phis
+# Insert the phis chosen by place_phis and rename every use to the
+# definition reaching it, walking the dominator tree with a stack of
+# definitions for each variable. Uses with no reaching definition become
+# undef.
+def rename_values(blocks, cfg, tree, phi_vars, new_values, renumber):
 
+    old_value = {}
+    for val, values in new_values.items():
+        for v in values:
+            old_value[v] = val
 
-def remove_redundant_phis(blocks, redundant_phis):
+    new_phis = defaultdict(list)
+    inserted = set()
+    for name, var in phi_vars:
+        phi = Cmd([renumber(var)], 'phi', None, [])
+        old_value[phi.results[0]] = var
+        new_phis[name].append(phi)
+        inserted.add(id(phi))
     for block in blocks:
-        def is_not_redundant_phi(cmd):
+        block.cmds[:0] = new_phis[block.name]
+
+    defs = defaultdict(list)
+
+    def reaching(val):
+        if val not in new_values:
+            return val
+        stack = defs[val]
+        return stack[-1] if stack else 'undef'
+
+    def visit(block):
+        pushed = []
+        for cmd in block.cmds:
             if cmd.op != 'phi':
-                return True
-            (result,) = cmd.results
-            return result not in redundant_phis
-        block.cmds = list(filter(is_not_redundant_phi, block.cmds))
+                cmd.args = [reaching(a) for a in cmd.args]
+            for r in cmd.results:
+                if r in old_value:
+                    defs[old_value[r]].append(r)
+                    pushed.append(old_value[r])
+
+        for succ in block.succs:
+            for cmd in succ.cmds:
+                if cmd.op != 'phi':
+                    break
+                if id(cmd) in inserted:
+                    var = old_value[cmd.results[0]]
+                    cmd.args += [block.name, reaching(var)]
+                    continue
+                for i in range(0, len(cmd.args), 2):
+                    if cmd.args[i] == block.name:
+                        cmd.args[i+1] = reaching(cmd.args[i+1])
+        return pushed
+
+    for root in tree.names:
+        if tree.idom[root] is not None:
+            continue
+        stack = [(root, None)]
+        while stack:
+            name, pushed = stack.pop()
+            if pushed is not None:
+                for val in pushed:
+                    defs[val].pop()
+                continue
+            stack.append((name, visit(cfg.block(name))))
+            for child in reversed(tree.children[name]):
+                stack.append((child, None))
 
 
-def relabel_redundant_phi_uses(blocks, redundant_phis):
-    def relable_redundant_phi_arg(arg):
-        if arg not in redundant_phis:
-            return arg
-        return redundant_phis[arg]
+# Remove redundant phis and relabel their uses, as in section 3.2 of Braun et
+# al. A strongly connected group of phis that refers to only one value outside
+# of itself, not counting undef, is redundant and is replaced by that value.
+# If it refers to more, the phis in it that only refer to each other may still
+# form redundant groups of their own.
+#
+# Components are visited with their operands first, so each group is settled
+# in a single step.
+def remove_redundant_phis(blocks):
+    phis = {}
     for block in blocks:
         for cmd in block.cmds:
-            cmd.args = list(map(relable_redundant_phi_arg, cmd.args))
+            if cmd.op == 'phi':
+                phis[cmd.results[0]] = cmd
+
+    def phi_args(phi):
+        return itertools.islice(phis[phi].args, 1, None, 2)
+
+    replacements = {}
+
+    def resolve(value):
+        while value in replacements:
+            value = replacements[value]
+        return value
+
+    def components(group):
+        def operands(phi):
+            return [a for a in map(resolve, phi_args(phi)) if a in group]
+        return iter(strongly_connected_components(group, operands))
+
+    # Most phis are trivial on their own. Remove those first with a worklist,
+    # requeueing the phis that use each one removed, so only real cycles are
+    # left for the component search.
+    phi_users = defaultdict(list)
+    for phi in phis:
+        for arg in phi_args(phi):
+            if arg in phis:
+                phi_users[arg].append(phi)
+
+    worklist = list(phis)
+    while worklist:
+        phi = worklist.pop()
+        if phi in replacements:
+            continue
+        value = None
+        for arg in phi_args(phi):
+            arg = resolve(arg)
+            if arg == phi or arg == 'undef' or arg == value:
+                continue
+            if value is not None:
+                break
+            value = arg
+        else:
+            replacements[phi] = 'undef' if value is None else value
+            worklist.extend(phi_users[phi])
+
+    remaining = [phi for phi in phis if phi not in replacements]
+    work = [components(set(remaining))]
+    while work:
+        scc = next(work[-1], None)
+        if scc is None:
+            work.pop()
+            continue
+        members = set(scc)
+        outside = {}
+        inner = []
+        for phi in scc:
+            is_inner = True
+            for arg in map(resolve, phi_args(phi)):
+                if arg in members or arg == 'undef':
+                    continue
+                is_inner = False
+                outside[arg] = None
+            if is_inner:
+                inner.append(phi)
+
+        if len(outside) <= 1:
+            value = next(iter(outside), 'undef')
+            for phi in scc:
+                replacements[phi] = value
+        elif inner:
+            work.append(components(set(inner)))
+
+    if not replacements:
+        return
+    for block in blocks:
+        cmds = block.cmds
+        if cmds[0].op == 'phi' and any(
+                cmd.op == 'phi' and cmd.results[0] in replacements for cmd in cmds):
+            cmds[:] = [cmd for cmd in cmds
+                       if cmd.op != 'phi' or cmd.results[0] not in replacements]
+        for cmd in cmds:
+            args = cmd.args
+            for i, a in enumerate(args):
+                if a in replacements and is_use(cmd, i):
+                    args[i] = resolve(a)
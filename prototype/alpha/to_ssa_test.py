@@ -208,3 +208,129 @@ class TestToSsa(unittest.TestCase):
           ret
       end
     """))
+
+  def test_redefined_between_calls(self):
+    (func,) = parse_lines("""
+      main
+        start
+          a = add 1 1
+          jsr foo ret1
+        ret1
+          b = add a a
+          a = add 2 2
+          jsr foo ret2
+        ret2
+          c = add a a
+          ret
+        foo
+          br 1 one two
+        one
+          br two
+        two
+          rts ret1 ret2
+      end
+    """)
+    to_ssa(func.blocks)
+    self.assertMultiLineEqual(str(func), dedent("""\
+      main
+        start
+          a = add 1 1
+          jsr foo ret1
+        ret1
+          b = add a a
+          a1 = add 2 2
+          jsr foo ret2
+        ret2
+          c = add a1 a1
+          ret
+        foo
+          br 1 one two
+        one
+          br two
+        two
+          rts ret1 ret2
+      end
+    """))
+
+  def test_long_chain_of_blocks(self):
+    n = 5000
+    lines = ['main', 'b0', 'a = add 1 1', 'br b1']
+    for i in range(1, n):
+      lines += [f'b{i}', f'br b{i+1}']
+    lines += [f'b{n}', 'c = add a a', 'ret c', 'end']
+    (func,) = parse_lines('\n'.join(lines))
+    to_ssa(func.blocks)
+    self.assertEqual(str(func.blocks[-1]), 'b5000\n  c = add a a\n  ret c\n')
+
+  def test_cytron_engine(self):
+    (func,) = parse_lines("""
+      main
+        start
+          i = copy 0
+          d = copy 0
+          br loop
+        loop
+          i = add i 1
+          d = add i 2
+          c = lt i 10
+          br c loop done
+        done
+          ret i
+      end
+    """)
+    to_ssa(func.blocks, engine='cytron')
+    self.assertMultiLineEqual(str(func), dedent("""\
+      main
+        start
+          br loop
+        loop
+          i2 = phi loop i1 start 0
+          i1 = add i2 1
+          d1 = add i1 2
+          c = lt i1 10
+          br c loop done
+        done
+          ret i1
+      end
+    """))
+
+  def test_unknown_engine(self):
+    (func,) = parse_lines("""
+      main
+        start
+          ret
+      end
+    """)
+    with self.assertRaises(ValueError):
+      to_ssa(func.blocks, engine='other')
+
+  def test_removes_redundant_phi_cycle(self):
+    (func,) = parse_lines("""
+      main
+        start
+          a = add 1 1
+          br 1 loop1 loop2
+        loop1
+          x = phi start a loop2 y
+          br 1 loop2 done
+        loop2
+          y = phi start a loop1 x
+          br 1 loop1 done
+        done
+          ret a
+      end
+    """)
+    to_ssa(func.blocks)
+    self.assertMultiLineEqual(str(func), dedent("""\
+      main
+        start
+          a = add 1 1
+          br 1 loop1 loop2
+        loop1
+          br 1 loop2 done
+        loop2
+          br 1 loop1 done
+        done
+          ret a
+      end
+    """))
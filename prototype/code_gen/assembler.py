@@ -0,0 +1,472 @@
+# Copyright 2018 Daniel Thornburgh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A two-pass assembler for the xa-style assembly emitted by the prototypes.
+
+Supported syntax:
+    - Labels, either followed by a colon or at the start of a line.
+    - Symbol assignment, "name = expr", and origin setting, "* = expr".
+    - The directives .word, .byt and .byte, and .dsb, which emits a count of
+      fill bytes. Strings in .byt are ASCII.
+    - Instructions in upper or lower case, in any addressing mode.
+    - Expressions made of numbers (decimal, $hex or %binary), symbols and "*",
+      joined by "+", "-", "*" and "/" and grouped with parentheses, and
+      optionally prefixed by "<" or ">" to take the low or high byte.
+    - Comments starting with ";" or "//".
+    - The preprocessor line #include "file", which assembles the file in
+      place, relative to the directory of the file including it. The #echo and
+      #print lines that xa shows while assembling are ignored.
+
+As with xa, the output is the bytes of every statement in order, regardless of
+origin, so a program that begins with an Atari executable header assembles
+into an executable file.
+"""
+
+import os
+import re
+
+import attr
+
+import opcodes
+
+
+class AssemblyError(Exception):
+    """Error indicating that the source could not be assembled."""
+
+
+@attr.attrs
+class Program:
+    """The result of assembling a source file.
+
+    Attributes:
+        data: The output bytes.
+        symbols: A dict from symbol name to value.
+        labels: A dict from address to the name of the first label there, or
+            failing that, of a symbol assigned that value.
+        lines: A dict from the address of each instruction to its source text.
+    """
+    data = attr.attrib()
+    symbols = attr.attrib()
+    labels = attr.attrib()
+    lines = attr.attrib()
+
+
+_LABEL = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*):?(?:\s+|$)")
+_TOKEN = re.compile(r"\s*(\$[0-9A-Fa-f]+|%[01]+|[0-9]+|[A-Za-z_][A-Za-z0-9_]*|"
+                    r"[-+*/()])")
+_INCLUDE = re.compile(r'^#include\s+"([^"]+)"$')
+
+# The indirect modes, and the pattern of each, in the order they are tried.
+_INDIRECT_MODES = [
+    ("izx", re.compile(r"^\((.*),\s*[Xx]\s*\)$")),
+    ("izy", re.compile(r"^\((.*)\)\s*,\s*[Yy]$")),
+    ("ind", re.compile(r"^\((.*)\)$")),
+]
+
+# The zero page and absolute modes for operands indexed by nothing, X or Y.
+DIRECT_MODES = {None: ("zp", "abs"), "X": ("zpx", "abx"), "Y": ("zpy", "aby")}
+
+
+def split_operand(operand, modes):
+    """Splits an instruction's operand into its addressing mode and expression.
+
+    Args:
+        operand: The operand text.
+        modes: The addressing modes of the instruction.
+
+    Returns:
+        The mode, the expression, and the index register of the operand. The
+        mode is None if it is zero page or absolute depending on the value of
+        the expression, as given by DIRECT_MODES for the index register.
+    """
+    operand = operand.strip()
+    if not operand or operand.upper() == "A":
+        return ("acc" if "acc" in modes else "imp"), "", None
+    if operand.startswith("#"):
+        return "imm", operand[1:], None
+    for mode, pattern in _INDIRECT_MODES:
+        match = pattern.match(operand)
+        if match:
+            return mode, match.group(1), None
+    if "rel" in modes:
+        return "rel", operand, None
+    match = re.match(r"^(.*),\s*([XxYy])$", operand)
+    if match:
+        return None, match.group(1), match.group(2).upper()
+    return None, operand, None
+
+
+def assemble(text, path=None):
+    """Returns the Program assembled from source text.
+
+    Args:
+        text: The source.
+        path: The file the source was read from, whose directory files are
+            included from. Without it, they are included from the current
+            directory.
+    """
+    assembler = _Assembler(text, path)
+    assembler.run_pass(final=False)
+    return assembler.run_pass(final=True)
+
+
+class _Assembler:  # pylint: disable=too-many-instance-attributes
+    """The state of an assembly, kept between its two passes."""
+
+    def __init__(self, text, path):
+        # Each statement's location, for errors, and text.
+        self.statements = []
+        self.read(text, path, [])
+        self.symbols = {}
+        # Symbols given values with "=", which may be reassigned.
+        self.assigned = set()
+        # The addressing mode chosen for each instruction in the first pass, by
+        # the position of its statement, so that the second pass gives
+        # instructions the same sizes.
+        self.modes = {}
+        # The state of the current pass.
+        self.final = False
+        self.pc = 0
+        self.data = bytearray()
+        self.labels = {}
+        self.lines = {}
+        self.defined = set()
+
+    def read(self, text, path, including):
+        """Adds the statements of source text read from path, expanding
+        includes.
+
+        Args:
+            text: The source.
+            path: The file it was read from, or None.
+            including: The files including it, to catch include cycles.
+        """
+        directory = ""
+        chain = including
+        if path is not None:
+            directory = os.path.dirname(path)
+            chain = including + [os.path.abspath(path)]
+        for number, line in enumerate(text.splitlines(), 1):
+            line = re.split(r";|//", line, 1)[0].rstrip()
+            location = f"line {number}"
+            if including:
+                location = f"{os.path.basename(path)} {location}"
+            stripped = line.strip()
+            if stripped.startswith(("#echo", "#print")):
+                continue
+            if stripped.startswith("#"):
+                match = _INCLUDE.match(stripped)
+                if not match:
+                    raise AssemblyError(f"{location}: bad preprocessor line")
+                included = os.path.join(directory, match.group(1))
+                if os.path.abspath(included) in chain:
+                    raise AssemblyError(f"{location}: {match.group(1)} "
+                                        "includes itself")
+                try:
+                    with open(included, encoding="utf-8") as f:
+                        source = f.read()
+                except OSError as e:
+                    raise AssemblyError(
+                        f"{location}: can't include {match.group(1)}: "
+                        f"{e.strerror}") from None
+                self.read(source, included, chain)
+            elif stripped:
+                self.statements.append((location, line))
+
+    def run_pass(self, final):
+        """Assembles every statement and returns the Program.
+
+        Symbols defined later in the source are unknown in the first pass,
+        and only the final pass raises errors for them.
+        """
+        self.final = final
+        self.pc = 0
+        self.data = bytearray()
+        self.labels = {}
+        self.lines = {}
+        self.defined = set()
+        for position, (location, line) in enumerate(self.statements):
+            try:
+                self.statement(position, line)
+            except AssemblyError as e:
+                raise AssemblyError(f"{location}: {e}") from None
+        for name in sorted(self.assigned & set(self.symbols)):
+            self.labels.setdefault(self.symbols[name], name)
+        return Program(bytes(self.data), dict(self.symbols), self.labels,
+                       self.lines)
+
+    def define(self, name, value):
+        """Defines a label, which may not be redefined."""
+        if name in self.defined or name in self.assigned:
+            raise AssemblyError(f"{name} redefined")
+        self.defined.add(name)
+        self.symbols[name] = value
+
+    def statement(self, position, line):
+        """Assembles a line of source."""
+        stripped = line.strip()
+
+        match = re.match(r"^(\*|[A-Za-z_][A-Za-z0-9_]*)\s*=\s*(.*)$", stripped)
+        if match:
+            name, expr = match.groups()
+            value = self.expr(expr)
+            if name == "*":
+                if value is None:
+                    raise AssemblyError("origin must be known")
+                self.pc = value
+            else:
+                if name in self.defined:
+                    raise AssemblyError(f"{name} redefined")
+                self.assigned.add(name)
+                if value is not None:
+                    self.symbols[name] = value
+            return
+
+        # A label either ends in a colon or starts the line and isn't a
+        # mnemonic or directive.
+        match = _LABEL.match(line)
+        if match and (line[match.end(1):].startswith(":")
+                      or match.group(1).upper() not in opcodes.MODES):
+            name = match.group(1)
+            self.define(name, self.pc)
+            self.labels.setdefault(self.pc, name)
+            line = line[match.end():]
+            stripped = line.strip()
+            if not stripped:
+                return
+
+        if stripped.startswith("."):
+            self.directive(stripped)
+        else:
+            self.instruction(position, stripped)
+
+    def emit(self, *values):
+        """Appends bytes to the output."""
+        for value in values:
+            self.data.append(value & 0xFF)
+            self.pc += 1
+
+    def directive(self, text):
+        """Assembles a directive."""
+        name, _, rest = text.partition(" ")
+        items = _split_items(rest)
+        if name == ".word":
+            for item in items:
+                value = self.expr(item) or 0
+                self.emit(value, value >> 8)
+        elif name in (".byt", ".byte"):
+            for item in items:
+                if item.startswith('"'):
+                    if not item.endswith('"') or len(item) < 2:
+                        raise AssemblyError(f"bad string: {item}")
+                    self.emit(*item[1:-1].encode("ascii"))
+                else:
+                    self.emit(self.expr(item) or 0)
+        elif name == ".dsb":
+            if not 1 <= len(items) <= 2:
+                raise AssemblyError(".dsb takes a count and a fill byte")
+            count = self.expr(items[0])
+            if count is None:
+                # Sizes must be the same in both passes.
+                raise AssemblyError(".dsb count must be known")
+            if count < 0:
+                raise AssemblyError(f"negative .dsb count: {count}")
+            fill = self.expr(items[1]) or 0 if len(items) == 2 else 0
+            self.emit(*[fill] * count)
+        else:
+            raise AssemblyError(f"unknown directive: {name}")
+
+    def instruction(self, position, text):
+        """Assembles the instruction on a line."""
+        mnemonic, _, operand = text.partition(" ")
+        mnemonic = mnemonic.upper()
+        operand = operand.strip()
+        modes = opcodes.MODES.get(mnemonic)
+        if modes is None:
+            raise AssemblyError(f"unknown instruction: {mnemonic}")
+
+        mode, expr, index = split_operand(operand, modes)
+        value = self.expr(expr) if mode not in ("imp", "acc") else None
+        if mode is None:
+            mode = self.modes.get(position)
+            if mode is None:
+                zp, absolute = DIRECT_MODES[index]
+                if value is not None and value < 256 and zp in modes:
+                    mode = zp
+                else:
+                    mode = absolute
+                self.modes[position] = mode
+
+        opcode = opcodes.BY_NAME.get((mnemonic, mode))
+        if opcode is None:
+            raise AssemblyError(f"{mnemonic} has no {mode} mode")
+        if self.final and opcodes.OPERAND_SIZE[mode] and value is None:
+            raise AssemblyError(f"undefined symbol in {expr}")
+
+        self.lines[self.pc] = text
+        address = self.pc
+        self.emit(opcode.code)
+        value = value or 0
+        if mode == "rel":
+            offset = value - (address + 2)
+            if self.final and not -128 <= offset <= 127:
+                raise AssemblyError("branch out of range")
+            self.emit(offset)
+        elif opcodes.OPERAND_SIZE[mode] == 1:
+            if self.final and not 0 <= value < 256:
+                raise AssemblyError(f"operand out of range: {value}")
+            self.emit(value)
+        elif opcodes.OPERAND_SIZE[mode] == 2:
+            self.emit(value, value >> 8)
+
+    def expr(self, text):
+        """Returns the value of an expression at the current address."""
+        return evaluate(text, self.symbols, self.pc)
+
+
+def evaluate(text, symbols, pc=0):
+    """Returns the value of an expression, or None if a symbol is undefined.
+
+    Args:
+        text: The expression.
+        symbols: A dict from symbol name to value.
+        pc: The value of "*".
+
+    Raises:
+        AssemblyError: The expression is malformed.
+    """
+    text = text.strip()
+    byte = None
+    if text[:1] in ("<", ">"):
+        byte, text = text[0], text[1:]
+    tokens = _tokenize(text)
+    if not tokens:
+        raise AssemblyError("missing expression")
+    parser = _ExpressionParser(tokens, symbols, pc)
+    total = parser.sum()
+    if parser.pos != len(tokens):
+        raise AssemblyError(f"bad expression: {text}")
+    if total is None:
+        return None
+    if byte == "<":
+        return total & 0xFF
+    if byte == ">":
+        return (total >> 8) & 0xFF
+    return total
+
+
+def _tokenize(text):
+    """Splits an expression into numbers, symbols, operators and
+    parentheses."""
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if not match:
+            raise AssemblyError(f"bad expression: {text}")
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+
+class _ExpressionParser:
+    """A recursive descent parser evaluating the tokens of an expression.
+
+    As in xa, "*" is the current address where a value is expected, and
+    multiplication where an operator is. Each method returns None if the value
+    depends on an undefined symbol.
+    """
+
+    def __init__(self, tokens, symbols, pc):
+        self.tokens = tokens
+        self.symbols = symbols
+        self.pc = pc
+        self.pos = 0
+
+    def peek(self):
+        """Returns the next token, or None at the end."""
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def sum(self):
+        """Parses terms joined by "+" and "-"."""
+        total = self.product()
+        while self.peek() in ("+", "-"):
+            operator = self.tokens[self.pos]
+            self.pos += 1
+            value = self.product()
+            if total is None or value is None:
+                total = None
+            else:
+                total = total + value if operator == "+" else total - value
+        return total
+
+    def product(self):
+        """Parses factors joined by "*" and "/"."""
+        total = self.factor()
+        while self.peek() in ("*", "/"):
+            operator = self.tokens[self.pos]
+            self.pos += 1
+            value = self.factor()
+            if total is None or value is None:
+                total = None
+            elif operator == "*":
+                total *= value
+            elif value == 0:
+                raise AssemblyError("division by zero")
+            else:
+                total //= value
+        return total
+
+    def factor(self):
+        """Parses a number, symbol, "*", signed factor or parenthesized
+        sum."""
+        token = self.peek()
+        if token is None:
+            raise AssemblyError("missing expression")
+        self.pos += 1
+        if token in ("+", "-"):
+            value = self.factor()
+            return value if value is None or token == "+" else -value
+        if token == "(":
+            value = self.sum()
+            if self.peek() != ")":
+                raise AssemblyError("missing )")
+            self.pos += 1
+            return value
+        if token in ("/", ")"):
+            raise AssemblyError(f"unexpected {token}")
+        return _term_value(token, self.symbols, self.pc)
+
+
+def _term_value(term, symbols, pc):
+    """Returns the value of a term, or None if it is an undefined symbol."""
+    if term.startswith("$"):
+        return int(term[1:], 16)
+    if term.startswith("%"):
+        return int(term[1:], 2)
+    if term.isdigit():
+        return int(term)
+    if term == "*":
+        return pc
+    return symbols.get(term)
+
+
+def _split_items(text):
+    """Splits a directive's arguments on commas outside of strings."""
+    items = []
+    for match in re.finditer(r'\s*("[^"]*"|[^,]+)\s*(?:,|$)', text):
+        item = match.group(1).strip()
+        if item:
+            items.append(item)
+    return items
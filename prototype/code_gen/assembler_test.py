@@ -0,0 +1,134 @@
+# Copyright 2018 Daniel Thornburgh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the assembler."""
+
+import pytest
+
+import assembler
+
+
+def test_addressing_modes():
+    """Test that each addressing mode is encoded."""
+    program = assembler.assemble("""
+        * = $0600
+        LDA #1
+        LDA $12
+        LDA $12,X
+        LDA $1234
+        LDA $1234,X
+        LDA $1234,Y
+        LDA ($12,X)
+        LDA ($12),Y
+        JMP ($1234)
+        ASL
+        ASL A
+        LDX $12,Y
+        RTS
+    """)
+
+    assert program.data == bytes([
+        0xA9, 0x01, 0xA5, 0x12, 0xB5, 0x12, 0xAD, 0x34, 0x12, 0xBD, 0x34, 0x12,
+        0xB9, 0x34, 0x12, 0xA1, 0x12, 0xB1, 0x12, 0x6C, 0x34, 0x12, 0x0A, 0x0A,
+        0xB6, 0x12, 0x60
+    ])
+
+
+def test_forward_reference_is_absolute():
+    """Test that an operand not yet known in the first pass is absolute."""
+    program = assembler.assemble("""
+        * = $0600
+        LDA zp
+        zp = $80
+        LDA zp
+    """)
+
+    assert program.data == bytes([0xAD, 0x80, 0x00, 0xA5, 0x80])
+
+
+def test_labels_and_branches():
+    """Test that labels in either style are branch targets."""
+    program = assembler.assemble("""
+        * = $0600
+loop:   dex
+        bne loop
+done    jmp done
+    """)
+
+    assert program.data == bytes([0xCA, 0xD0, 0xFD, 0x4C, 0x03, 0x06])
+    assert program.symbols["loop"] == 0x0600
+    assert program.labels == {0x0600: "loop", 0x0603: "done"}
+    assert program.lines[0x0601] == "bne loop"
+
+
+def test_data_and_expressions():
+    """Test the data directives and byte selection."""
+    program = assembler.assemble("""
+        * = $1000
+        .word end - 1, $FFFF
+        .byt "Hi",0 ; A comment.
+        LDA #<msg
+        LDA #>msg+1 // Another comment.
+msg     .byte %101, 7
+end = *
+    """)
+
+    assert program.data == (bytes([0x0C, 0x10, 0xFF, 0xFF]) + b"Hi\0" +
+                            bytes([0xA9, 0x0B, 0xA9, 0x10, 0x05, 0x07]))
+
+
+def test_arithmetic():
+    """Test multiplication, division and parentheses in expressions."""
+    program = assembler.assemble("""
+        * = $0700
+        .byt (end - * + 127)/128, 2*3+1, -2+2*(1+2)
+        .dsb 3, $EA
+        .dsb 2
+end = * + 200
+    """)
+
+    assert program.data == bytes([2, 7, 4, 0xEA, 0xEA, 0xEA, 0, 0])
+
+
+def test_include(tmp_path):
+    """Test that included files are found next to the file including them."""
+    lib = tmp_path / "lib.asm"
+    lib.write_text("twice: ASL\nRTS\n")
+    path = tmp_path / "main.asm"
+    path.write_text('* = $0600\n#echo Including\n#print *\n'
+                    'JSR twice\n#include "lib.asm"\n')
+
+    program = assembler.assemble(path.read_text(), str(path))
+
+    assert program.data == bytes([0x20, 0x03, 0x06, 0x0A, 0x60])
+    lib.write_text("twice: ASL\nLDA missing\n")
+    with pytest.raises(assembler.AssemblyError, match="lib.asm line 2"):
+        assembler.assemble(path.read_text(), str(path))
+    with pytest.raises(assembler.AssemblyError, match="can't include"):
+        assembler.assemble('#include "none.asm"', str(path))
+    lib.write_text('#include "main.asm"\n')
+    with pytest.raises(assembler.AssemblyError, match="includes itself"):
+        assembler.assemble(path.read_text(), str(path))
+
+
+def test_errors():
+    """Test that bad source is reported with its line number."""
+    with pytest.raises(assembler.AssemblyError, match="line 1"):
+        assembler.assemble("LDA missing")
+    with pytest.raises(assembler.AssemblyError, match="no imm mode"):
+        assembler.assemble("STA #1")
+    with pytest.raises(assembler.AssemblyError, match="out of range"):
+        assembler.assemble("loop: NOP\n.byt " + ",".join(["0"] * 200) +
+                           "\nBNE loop")
+    with pytest.raises(assembler.AssemblyError, match="redefined"):
+        assembler.assemble("a: NOP\na: NOP")
@@ -0,0 +1,133 @@
+# Copyright 2018 Daniel Thornburgh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""The cycle and size costs of 6502 instructions.
+
+Every search for instruction sequences ranks them with a CostModel, so that
+they all optimize the same metric: a weighted sum of the cycles and bytes
+taken. Cycles are scaled by how often the code runs; bytes are not.
+"""
+
+import attr
+
+import assembler
+import opcodes
+
+
+def cycles(mnemonic, mode, page_crossed=False, taken=False):
+    """Returns the cycles taken by an instruction.
+
+    Arguments:
+        mnemonic: The instruction, in upper case.
+        mode: The addressing mode, as named in opcodes.
+        page_crossed: For indexed modes, whether indexing crossed a page. For
+            branches, whether the target is on a different page than the next
+            instruction.
+        taken: For branches, whether the branch was taken.
+    """
+    opcode = opcodes.BY_NAME[(mnemonic, mode)]
+    if mode == "rel":
+        return opcode.cycles + (1 + page_crossed if taken else 0)
+    return opcode.cycles + (page_crossed and opcode.page_penalty)
+
+
+def size(mnemonic, mode):
+    """Returns the number of bytes taken by an instruction."""
+    return opcodes.BY_NAME[(mnemonic, mode)].size
+
+
+def direct_mode(address, index=None):
+    """Returns the zero page or absolute mode for an address.
+
+    Arguments:
+        address: The address, or None if not known, in which case it is taken
+            to be outside the zero page.
+        index: The index register, if any.
+    """
+    zero_page, absolute = assembler.DIRECT_MODES[index]
+    return zero_page if address is not None and address < 256 else absolute
+
+
+@attr.attrs(frozen=True)
+class CostModel:
+    """A weighting of cycles against bytes.
+
+    Attributes:
+        cycle_weight: The cost of each cycle taken each time the code runs.
+        byte_weight: The cost of each byte of code.
+        taken_probability: The chance that a branch is taken, for branches
+            whose outcome isn't given.
+    """
+    cycle_weight = attr.attrib(default=1)
+    byte_weight = attr.attrib(default=0)
+    taken_probability = attr.attrib(default=0.5)
+
+    def cost(self, mnemonic, mode, weight=1, page_crossed=False, taken=None):
+        """Returns the cost of an instruction.
+
+        Arguments:
+            mnemonic: The instruction, in upper case.
+            mode: The addressing mode.
+            weight: The number of times the instruction runs.
+            page_crossed: As in cycles.
+            taken: As in cycles, or None for a branch taken with
+                taken_probability.
+        """
+        if mode == "rel" and taken is None:
+            not_taken = cycles(mnemonic, mode, page_crossed, taken=False)
+            taken = cycles(mnemonic, mode, page_crossed, taken=True)
+            time = not_taken + self.taken_probability * (taken - not_taken)
+        else:
+            time = cycles(mnemonic, mode, page_crossed, bool(taken))
+        return (self.cycle_weight * weight * time +
+                self.byte_weight * size(mnemonic, mode))
+
+    def instruction_cost(self, instruction, weight=1):
+        """Returns the cost of an instruction from asm.
+
+        The instruction's class is named by its mnemonic, and it has an
+        address if it accesses memory.
+        """
+        address = getattr(instruction, "address", None)
+        mode = "imp" if address is None else direct_mode(address)
+        return self.cost(type(instruction).__name__, mode, weight)
+
+    def statement_cost(self, text, weight=1):
+        """Returns the cost of a line of assembly.
+
+        Labels, directives and blank lines cost nothing. Operands that refer
+        to symbols are taken to be outside the zero page.
+        """
+        words = text.split(None, 1)
+        if not words or words[0][0] in ".=*":
+            return 0
+        mnemonic = words[0].upper()
+        operand = words[1] if len(words) > 1 else ""
+        modes = opcodes.MODES.get(mnemonic)
+        if modes is None:
+            # A label, possibly followed by an instruction.
+            return self.statement_cost(operand, weight)
+
+        mode, expr, index = assembler.split_operand(operand, modes)
+        if mode is None:
+            mode = direct_mode(assembler.evaluate(expr, {}), index)
+            if mode not in modes:
+                mode = assembler.DIRECT_MODES[index][1]
+        return self.cost(mnemonic, mode, weight)
+
+
+# The fastest code, regardless of size.
+SPEED = CostModel()
+
+# The smallest code, with time only breaking ties.
+SIZE = CostModel(cycle_weight=0.001, byte_weight=1)
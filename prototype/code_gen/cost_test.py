@@ -0,0 +1,70 @@
+# Copyright 2018 Daniel Thornburgh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the cost model."""
+
+import asm
+import cost
+
+
+def test_cycles():
+    """Test base cycles and the page crossing and branch penalties."""
+    assert cost.cycles("LDA", "zp") == 3
+    assert cost.cycles("LDA", "abx") == 4
+    assert cost.cycles("LDA", "abx", page_crossed=True) == 5
+    assert cost.cycles("LDA", "izy", page_crossed=True) == 6
+    assert cost.cycles("STA", "abx", page_crossed=True) == 5
+    assert cost.cycles("BNE", "rel") == 2
+    assert cost.cycles("BNE", "rel", taken=True) == 3
+    assert cost.cycles("BNE", "rel", page_crossed=True, taken=True) == 4
+
+
+def test_size():
+    """Test instruction sizes."""
+    assert cost.size("TAX", "imp") == 1
+    assert cost.size("LDA", "zp") == 2
+    assert cost.size("JMP", "ind") == 3
+
+
+def test_weighting():
+    """Test that cycles are scaled by the weight, and bytes are not."""
+    model = cost.CostModel(cycle_weight=1, byte_weight=10)
+
+    assert model.cost("LDA", "abs") == 4 + 30
+    assert model.cost("LDA", "abs", weight=100) == 400 + 30
+    assert cost.SPEED.cost("BEQ", "rel") == 2.5
+    assert cost.SPEED.cost("BEQ", "rel", taken=False) == 2
+
+
+def test_instruction_cost():
+    """Test the costs of asm instructions."""
+    assert cost.SPEED.instruction_cost(asm.TAX()) == 2
+    assert cost.SPEED.instruction_cost(asm.STA(0x80)) == 3
+    assert cost.SPEED.instruction_cost(asm.STA(0x300)) == 4
+    assert cost.SPEED.instruction_cost(asm.PLP()) == 4
+
+
+def test_statement_cost():
+    """Test the costs of lines of assembly."""
+    assert cost.SPEED.statement_cost("LDA #<kHello") == 2
+    assert cost.SPEED.statement_cost("STA 128") == 3
+    assert cost.SPEED.statement_cost("LDA 128+1") == 3
+    assert cost.SPEED.statement_cost("STA bss+2") == 4
+    assert cost.SPEED.statement_cost("LDA (128),Y") == 5
+    assert cost.SPEED.statement_cost("ASL") == 2
+    assert cost.SPEED.statement_cost("JSR 58454", weight=10) == 60
+    assert cost.SPEED.statement_cost("__end JMP __end") == 3
+    assert cost.SPEED.statement_cost("__1:") == 0
+    assert cost.SPEED.statement_cost(".word $FFFF") == 0
+    assert cost.SPEED.statement_cost("start = $0700") == 0
+    assert cost.SPEED.statement_cost("") == 0
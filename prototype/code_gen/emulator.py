@@ -0,0 +1,861 @@
+# Copyright 2018 Daniel Thornburgh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A cycle counting NMOS 6502 emulator with a minimal Atari OS.
+
+The emulator runs Atari executables, or assembly source through the assembler,
+and counts the cycles spent in each instruction and basic block. Those counts
+can be written to a profile, whose block frequencies are used to weight the
+costs of the code generators in place of static loop depth estimates.
+
+Besides executables, programs can be disk or cassette boot images, 16K OSS
+one-chip cartridge images, or routines called as Atari BASIC's USR function
+calls them. The OS boot and cartridge start sequences are followed, and the
+cartridge's banks are switched by accesses to $D5xx.
+
+Of the OS, only the central I/O vector, CIOV, is provided. It supports the put
+characters command to any IOCB, writing to the emulator's output. Programs end
+by returning from their entry point, executing BRK, or jumping to themselves.
+
+Usage:
+    python emulator.py hello.asm --profile hello.json
+    python emulator.py boot.asm --format boot
+"""
+
+import argparse
+import json
+import sys
+
+import attr
+
+import assembler
+import opcodes
+
+CIOV = 0xE456
+IOCB_BASE = 0x0340
+IOCB_SIZE = 0x10
+ICCOM = 0x02
+ICBAL = 0x04
+ICBLL = 0x08
+PUT_CHARACTERS = 0x0B
+ATASCII_EOL = 0x9B
+
+RUNAD = 0x02E0
+INITAD = 0x02E2
+DOSVEC = 0x000A
+FR0 = 0x00D4
+
+BOOT_HEADER_SIZE = 6
+BOOT_RECORD_SIZE = 128
+
+CART_START = 0xA000
+CART_SIZE = 0x4000
+CART_BANK_SIZE = 0x1000
+CART_FIXED = 0xB000
+CARTCS = 0xBFFA
+CART_FLAGS = 0xBFFD
+CARTINIT = 0xBFFE
+CART_START_FLAG = 0x04
+CART_CONTROL = 0xD500
+# The bank of an OSS one-chip cartridge selected into $A000-$AFFF by an
+# access to $D5xx, by the address bits that select it. Bank 0 is always at
+# $B000-$BFFF.
+OSS_BANKS = {0x00: 1, 0x09: 2, 0x01: 3}
+OSS_BANK_BITS = 0x09
+
+# The address the entry point returns to. Reaching it ends the program.
+EXIT = 0xFFF0
+
+DEFAULT_MAX_CYCLES = 100000000
+
+
+class EmulationError(Exception):
+    """Error indicating that a program could not be run."""
+
+
+@attr.attrs
+class Block:
+    """A basic block of executed code.
+
+    Attributes:
+        address: The address of the block's first instruction.
+        label: The name of the label at that address, or None.
+        count: The number of times the block was entered.
+        cycles: The total cycles spent in the block's instructions.
+        instructions: The number of instructions in the block.
+    """
+    address = attr.attrib()
+    label = attr.attrib()
+    count = attr.attrib()
+    cycles = attr.attrib()
+    instructions = attr.attrib()
+
+
+class Machine:  # pylint: disable=too-many-instance-attributes
+    """A 6502 with 64K of RAM and the CIO stub.
+
+    Attributes:
+        memory: The 64K of memory, as a bytearray.
+        a, x, y, s, pc: The registers.
+        n, v, d, i, z, c: The processor status flags, as bools.
+        cycles: The number of cycles executed.
+        output: The bytes written by CIO, as ATASCII.
+        counts: A dict from the address of each executed instruction to the
+            number of times it ran.
+        cycle_counts: A dict from the address of each executed instruction to
+            the number of cycles it took in total.
+        trap_calls: A dict from the address of each OS routine called to the
+            number of calls.
+    """
+
+    def __init__(self):
+        self.memory = bytearray(0x10000)
+        self.a = self.x = self.y = 0
+        self.s = 0xFF
+        self.pc = 0
+        self.n = self.v = self.d = self.z = self.c = False
+        self.i = True
+        self.cycles = 0
+        self.output = bytearray()
+        self.counts = {}
+        self.cycle_counts = {}
+        self.trap_calls = {}
+        self.traps = {CIOV: self._ciov}
+        self.halted = False
+        # The banks of the cartridge inserted, if any.
+        self.banks = None
+
+    def load_xex(self, data):
+        """Loads an Atari executable and returns its run address.
+
+        The run address is that stored in RUNAD, or the start of the first
+        segment if none is. Init routines set through INITAD are run as they
+        are loaded.
+        """
+        pos = 0
+        first = None
+        self.memory[RUNAD:RUNAD + 2] = b"\0\0"
+        while pos < len(data):
+            if data[pos:pos + 2] == b"\xff\xff":
+                pos += 2
+            if pos + 4 > len(data):
+                raise EmulationError("truncated segment header")
+            start = data[pos] | data[pos + 1] << 8
+            end = data[pos + 2] | data[pos + 3] << 8
+            pos += 4
+            if end < start or pos + end - start + 1 > len(data):
+                raise EmulationError(f"bad segment ${start:04X}-${end:04X}")
+            self.memory[INITAD:INITAD + 2] = b"\0\0"
+            self.memory[start:end + 1] = data[pos:pos + end - start + 1]
+            pos += end - start + 1
+            if first is None:
+                first = start
+            init = self.read_word(INITAD)
+            if init:
+                self.run(init)
+        if first is None:
+            raise EmulationError("no segments")
+        return self.read_word(RUNAD) or first
+
+    def load_boot(self, data):
+        """Boots a disk or cassette boot image and returns its run address.
+
+        As the OS does, the records counted in the header are loaded to the
+        address in it, and the boot continuation just after the header is
+        called. If that returns with carry clear, the init routine in the
+        header is called, and the program is run through DOSVEC.
+
+        Raises:
+            EmulationError: The image is truncated, or its boot continuation
+                returned with carry set.
+        """
+        if len(data) < BOOT_HEADER_SIZE:
+            raise EmulationError("truncated boot header")
+        size = data[1] * BOOT_RECORD_SIZE
+        if size > len(data):
+            raise EmulationError(
+                f"{data[1]} records to boot, but only {len(data)} bytes")
+        load = data[2] | data[3] << 8
+        init = data[4] | data[5] << 8
+        self.memory[load:load + size] = data[:size]
+        self.run(load + BOOT_HEADER_SIZE)
+        if self.c:
+            raise EmulationError("boot continuation failed")
+        self.run(init)
+        return self.read_word(DOSVEC)
+
+    def load_cartridge(self, data):
+        """Inserts a 16K OSS one-chip cartridge and returns its run address.
+
+        The image is four 4K banks, the first of which is at $B000-$BFFF.
+        As the OS does, the init routine in the cartridge's trailer is
+        called, and its start address is returned if its flags say to start
+        it.
+
+        Raises:
+            EmulationError: The image is the wrong size, or isn't started.
+        """
+        if len(data) != CART_SIZE:
+            raise EmulationError(f"bad cartridge size: {len(data)} bytes")
+        self.banks = [
+            data[start:start + CART_BANK_SIZE]
+            for start in range(0, len(data), CART_BANK_SIZE)
+        ]
+        self.memory[CART_FIXED:CART_FIXED + CART_BANK_SIZE] = self.banks[0]
+        self.run(self.read_word(CARTINIT))
+        if not self.memory[CART_FLAGS] & CART_START_FLAG:
+            raise EmulationError("cartridge doesn't start")
+        return self.read_word(CARTCS)
+
+    def usr(self, address, *args, max_cycles=DEFAULT_MAX_CYCLES):
+        """Calls a routine as Atari BASIC's USR function does.
+
+        The arguments are left on the stack big-endian, under the number of
+        them, and the routine must pull them all before it returns.
+
+        Returns:
+            The word the routine left in FR0.
+        """
+        self.push((EXIT - 1) >> 8)
+        self.push(EXIT - 1)
+        for arg in reversed(args):
+            self.push(arg)
+            self.push(arg >> 8)
+        self.push(len(args))
+        self._execute(address, max_cycles)
+        return self.read_word(FR0)
+
+    def read_word(self, address):
+        """Returns the little-endian word at address."""
+        return self.memory[address] | self.memory[(address + 1) & 0xFFFF] << 8
+
+    def push(self, value):
+        """Pushes a byte onto the stack."""
+        self.memory[0x100 | self.s] = value & 0xFF
+        self.s = (self.s - 1) & 0xFF
+
+    def pull(self):
+        """Pulls a byte from the stack."""
+        self.s = (self.s + 1) & 0xFF
+        return self.memory[0x100 | self.s]
+
+    @property
+    def p(self):
+        """The status register, with the unused bit set."""
+        return (self.n << 7 | self.v << 6 | 0x20 | self.d << 3 | self.i << 2
+                | self.z << 1 | self.c)
+
+    @p.setter
+    def p(self, value):
+        self.n = bool(value & 0x80)
+        self.v = bool(value & 0x40)
+        self.d = bool(value & 0x08)
+        self.i = bool(value & 0x04)
+        self.z = bool(value & 0x02)
+        self.c = bool(value & 0x01)
+
+    def run(self, address, max_cycles=DEFAULT_MAX_CYCLES):
+        """Calls the subroutine at address and runs until the program ends.
+
+        Raises:
+            EmulationError: The program ran for more than max_cycles cycles,
+                or executed an undocumented opcode.
+        """
+        self.push((EXIT - 1) >> 8)
+        self.push(EXIT - 1)
+        self._execute(address, max_cycles)
+
+    def _execute(self, address, max_cycles):
+        """Runs from address until the program ends."""
+        self.halted = False
+        self.pc = address
+        limit = self.cycles + max_cycles
+        while not self.halted:
+            if self.cycles >= limit:
+                raise EmulationError(f"no exit after {max_cycles} cycles")
+            self.step()
+
+    def step(self):
+        """Executes one instruction, or one call to the OS."""
+        pc = self.pc
+        if pc == EXIT:
+            self.halted = True
+            return
+        trap = self.traps.get(pc)
+        if trap is not None:
+            self.trap_calls[pc] = self.trap_calls.get(pc, 0) + 1
+            trap()
+            # Return as if by RTS.
+            self.pc = (self.pull() | self.pull() << 8) + 1 & 0xFFFF
+            self.cycles += 6
+            return
+
+        opcode = opcodes.BY_CODE.get(self.memory[pc])
+        if opcode is None:
+            raise EmulationError(
+                f"undocumented opcode ${self.memory[pc]:02X} at ${pc:04X}")
+        self.pc = (pc + opcode.size) & 0xFFFF
+        cycles = opcode.cycles
+        address, crossed = self._address(opcode.mode, pc)
+        if crossed and opcode.page_penalty:
+            cycles += 1
+        if (self.banks is not None and address is not None
+                and address & 0xFF00 == CART_CONTROL):
+            self._select_bank(address)
+        execute = getattr(self, "_" + opcode.mnemonic.lower())
+        cycles += execute(opcode.mode, address)
+
+        self.cycles += cycles
+        self.counts[pc] = self.counts.get(pc, 0) + 1
+        self.cycle_counts[pc] = self.cycle_counts.get(pc, 0) + cycles
+
+    def _address(self, mode, pc):
+        """Returns the effective address of an operand and whether indexing
+        crossed a page."""
+        memory = self.memory
+        if mode in ("imp", "acc"):
+            return None, False
+        if mode in ("imm", "rel"):
+            return (pc + 1) & 0xFFFF, False
+        operand = memory[(pc + 1) & 0xFFFF]
+        if mode in ("zp", "zpx", "zpy"):
+            return (operand + self._index(mode)) & 0xFF, False
+        if mode == "izx":
+            pointer = (operand + self.x) & 0xFF
+            return memory[pointer] | memory[(pointer + 1) & 0xFF] << 8, False
+        if mode == "izy":
+            operand = memory[operand] | memory[(operand + 1) & 0xFF] << 8
+        else:
+            operand |= memory[(pc + 2) & 0xFFFF] << 8
+        if mode == "ind":
+            # The NMOS 6502 doesn't carry into the high byte of the pointer.
+            high = (operand & 0xFF00) | ((operand + 1) & 0xFF)
+            return memory[operand] | memory[high] << 8, False
+        return self._indexed(operand, self._index(mode))
+
+    def _index(self, mode):
+        """Returns the index register added by an addressing mode, or 0."""
+        if mode.endswith("x"):
+            return self.x
+        if mode.endswith("y"):
+            return self.y
+        return 0
+
+    @staticmethod
+    def _indexed(base, index):
+        """Returns base plus index, and whether that crossed a page."""
+        address = (base + index) & 0xFFFF
+        return address, (base ^ address) & 0xFF00 != 0
+
+    def _select_bank(self, address):
+        """Maps the cartridge bank selected by an access to $D5xx."""
+        bank = OSS_BANKS.get(address & OSS_BANK_BITS)
+        if bank is None:
+            raise EmulationError(f"unsupported bank select at ${address:04X}")
+        self.memory[CART_START:CART_START + CART_BANK_SIZE] = self.banks[bank]
+
+    def _set_nz(self, value):
+        self.n = value >= 0x80
+        self.z = value == 0
+        return value
+
+    def _read(self, mode, address):
+        return self.a if mode == "acc" else self.memory[address]
+
+    def _write(self, mode, address, value):
+        if mode == "acc":
+            self.a = value
+        else:
+            self.memory[address] = value
+        self._set_nz(value)
+
+    def _branch(self, address, taken):
+        if not taken:
+            return 0
+        offset = self.memory[address]
+        target = (self.pc + offset - (0x100 if offset >= 0x80 else 0)) & 0xFFFF
+        crossed = (target ^ self.pc) & 0xFF00 != 0
+        self.pc = target
+        return 2 if crossed else 1
+
+    # Each instruction is a method named for its lowercased mnemonic. It takes
+    # the addressing mode and effective address and returns any extra cycles
+    # taken, beyond the page crossing penalty. Those that don't use the mode or
+    # address take them as _mode and _address.
+
+    def _adc(self, _mode, address):
+        self._add(self.memory[address])
+        return 0
+
+    def _sbc(self, _mode, address):
+        value = self.memory[address]
+        if not self.d:
+            self._add(value ^ 0xFF)
+            return 0
+        a = self.a
+        borrow = not self.c
+        result = a - value - borrow
+        low = (a & 0x0F) - (value & 0x0F) - borrow
+        high = (a >> 4) - (value >> 4)
+        if low < 0:
+            low -= 6
+            high -= 1
+        if high < 0:
+            high -= 6
+        # Flags are set as in binary mode.
+        self.v = bool((a ^ value) & (a ^ result) & 0x80)
+        self.c = result >= 0
+        self._set_nz(result & 0xFF)
+        self.a = (high << 4 | low & 0x0F) & 0xFF
+        return 0
+
+    def _add(self, value):
+        a = self.a
+        if not self.d:
+            result = a + value + self.c
+            self.v = bool(~(a ^ value) & (a ^ result) & 0x80)
+            self.c = result > 0xFF
+            self.a = self._set_nz(result & 0xFF)
+            return
+        low = (a & 0x0F) + (value & 0x0F) + self.c
+        if low > 9:
+            low += 6
+        high = (a >> 4) + (value >> 4) + (low > 0x0F)
+        # Z is set as in binary mode, and N and V from the intermediate high
+        # digit.
+        self.z = (a + value + self.c) & 0xFF == 0
+        self.n = bool(high & 0x08)
+        self.v = bool(~(a ^ value) & (a ^ high << 4) & 0x80)
+        if high > 9:
+            high += 6
+        self.c = high > 0x0F
+        self.a = (high << 4 | low & 0x0F) & 0xFF
+
+    def _and(self, _mode, address):
+        self.a = self._set_nz(self.a & self.memory[address])
+        return 0
+
+    def _ora(self, _mode, address):
+        self.a = self._set_nz(self.a | self.memory[address])
+        return 0
+
+    def _eor(self, _mode, address):
+        self.a = self._set_nz(self.a ^ self.memory[address])
+        return 0
+
+    def _compare(self, register, address):
+        value = register - self.memory[address]
+        self.c = value >= 0
+        self._set_nz(value & 0xFF)
+        return 0
+
+    def _cmp(self, _mode, address):
+        return self._compare(self.a, address)
+
+    def _cpx(self, _mode, address):
+        return self._compare(self.x, address)
+
+    def _cpy(self, _mode, address):
+        return self._compare(self.y, address)
+
+    def _bit(self, _mode, address):
+        value = self.memory[address]
+        self.n = bool(value & 0x80)
+        self.v = bool(value & 0x40)
+        self.z = self.a & value == 0
+        return 0
+
+    def _lda(self, _mode, address):
+        self.a = self._set_nz(self.memory[address])
+        return 0
+
+    def _ldx(self, _mode, address):
+        self.x = self._set_nz(self.memory[address])
+        return 0
+
+    def _ldy(self, _mode, address):
+        self.y = self._set_nz(self.memory[address])
+        return 0
+
+    def _sta(self, _mode, address):
+        self.memory[address] = self.a
+        return 0
+
+    def _stx(self, _mode, address):
+        self.memory[address] = self.x
+        return 0
+
+    def _sty(self, _mode, address):
+        self.memory[address] = self.y
+        return 0
+
+    def _asl(self, mode, address):
+        value = self._read(mode, address)
+        self.c = value >= 0x80
+        self._write(mode, address, value << 1 & 0xFF)
+        return 0
+
+    def _lsr(self, mode, address):
+        value = self._read(mode, address)
+        self.c = bool(value & 1)
+        self._write(mode, address, value >> 1)
+        return 0
+
+    def _rol(self, mode, address):
+        value = self._read(mode, address)
+        carry = self.c
+        self.c = value >= 0x80
+        self._write(mode, address, (value << 1 | carry) & 0xFF)
+        return 0
+
+    def _ror(self, mode, address):
+        value = self._read(mode, address)
+        carry = self.c
+        self.c = bool(value & 1)
+        self._write(mode, address, value >> 1 | carry << 7)
+        return 0
+
+    def _inc(self, mode, address):
+        self._write(mode, address, (self.memory[address] + 1) & 0xFF)
+        return 0
+
+    def _dec(self, mode, address):
+        self._write(mode, address, (self.memory[address] - 1) & 0xFF)
+        return 0
+
+    def _inx(self, _mode, _address):
+        self.x = self._set_nz((self.x + 1) & 0xFF)
+        return 0
+
+    def _iny(self, _mode, _address):
+        self.y = self._set_nz((self.y + 1) & 0xFF)
+        return 0
+
+    def _dex(self, _mode, _address):
+        self.x = self._set_nz((self.x - 1) & 0xFF)
+        return 0
+
+    def _dey(self, _mode, _address):
+        self.y = self._set_nz((self.y - 1) & 0xFF)
+        return 0
+
+    def _tax(self, _mode, _address):
+        self.x = self._set_nz(self.a)
+        return 0
+
+    def _tay(self, _mode, _address):
+        self.y = self._set_nz(self.a)
+        return 0
+
+    def _txa(self, _mode, _address):
+        self.a = self._set_nz(self.x)
+        return 0
+
+    def _tya(self, _mode, _address):
+        self.a = self._set_nz(self.y)
+        return 0
+
+    def _tsx(self, _mode, _address):
+        self.x = self._set_nz(self.s)
+        return 0
+
+    def _txs(self, _mode, _address):
+        self.s = self.x
+        return 0
+
+    def _pha(self, _mode, _address):
+        self.push(self.a)
+        return 0
+
+    def _php(self, _mode, _address):
+        self.push(self.p | 0x10)
+        return 0
+
+    def _pla(self, _mode, _address):
+        self.a = self._set_nz(self.pull())
+        return 0
+
+    def _plp(self, _mode, _address):
+        self.p = self.pull()
+        return 0
+
+    def _clc(self, _mode, _address):
+        self.c = False
+        return 0
+
+    def _sec(self, _mode, _address):
+        self.c = True
+        return 0
+
+    def _cld(self, _mode, _address):
+        self.d = False
+        return 0
+
+    def _sed(self, _mode, _address):
+        self.d = True
+        return 0
+
+    def _cli(self, _mode, _address):
+        self.i = False
+        return 0
+
+    def _sei(self, _mode, _address):
+        self.i = True
+        return 0
+
+    def _clv(self, _mode, _address):
+        self.v = False
+        return 0
+
+    def _nop(self, _mode, _address):
+        return 0
+
+    def _bcc(self, _mode, address):
+        return self._branch(address, not self.c)
+
+    def _bcs(self, _mode, address):
+        return self._branch(address, self.c)
+
+    def _bne(self, _mode, address):
+        return self._branch(address, not self.z)
+
+    def _beq(self, _mode, address):
+        return self._branch(address, self.z)
+
+    def _bpl(self, _mode, address):
+        return self._branch(address, not self.n)
+
+    def _bmi(self, _mode, address):
+        return self._branch(address, self.n)
+
+    def _bvc(self, _mode, address):
+        return self._branch(address, not self.v)
+
+    def _bvs(self, _mode, address):
+        return self._branch(address, self.v)
+
+    def _jmp(self, _mode, address):
+        if address == (self.pc - 3) & 0xFFFF:
+            # A jump to itself ends the program.
+            self.halted = True
+        self.pc = address
+        return 0
+
+    def _jsr(self, _mode, address):
+        ret = (self.pc - 1) & 0xFFFF
+        self.push(ret >> 8)
+        self.push(ret)
+        self.pc = address
+        return 0
+
+    def _rts(self, _mode, _address):
+        self.pc = (self.pull() | self.pull() << 8) + 1 & 0xFFFF
+        return 0
+
+    def _rti(self, _mode, _address):
+        self.p = self.pull()
+        self.pc = self.pull() | self.pull() << 8
+        return 0
+
+    def _brk(self, _mode, _address):
+        self.halted = True
+        return 0
+
+    def _ciov(self):
+        """CIO, with the IOCB number times 16 in X."""
+        iocb = IOCB_BASE + (self.x & 0x70)
+        command = self.memory[iocb + ICCOM]
+        if command != PUT_CHARACTERS:
+            raise EmulationError(f"unsupported CIO command ${command:02X}")
+        length = self.read_word(iocb + ICBLL)
+        if length == 0:
+            # A zero length puts the single character in A.
+            self.output.append(self.a)
+        else:
+            buffer = self.read_word(iocb + ICBAL)
+            for offset in range(length):
+                self.output.append(self.memory[(buffer + offset) & 0xFFFF])
+        self.y = 1
+        self.n = False
+        self.z = False
+
+    def text(self):
+        """Returns the output as text, with ATASCII end of lines."""
+        return bytes(self.output).replace(bytes([ATASCII_EOL]),
+                                          b"\n").decode("latin-1")
+
+    def blocks(self, entry, labels=None):
+        """Returns the executed basic blocks, sorted by address.
+
+        Blocks begin at the entry point, labels, branch and jump targets, and
+        the instructions after control transfers, and run to the next such
+        instruction or a gap in the executed code.
+
+        Args:
+            entry: The entry point of the program.
+            labels: A dict from address to label name.
+        """
+        labels = labels or {}
+        leaders = {entry} | set(labels)
+        for pc in self.counts:
+            opcode = opcodes.BY_CODE[self.memory[pc]]
+            end = (pc + opcode.size) & 0xFFFF
+            if opcode.mnemonic in opcodes.BRANCHES:
+                offset = self.memory[(pc + 1) & 0xFFFF]
+                leaders.add((end + offset - (0x100 if offset >= 0x80 else 0))
+                            & 0xFFFF)
+                leaders.add(end)
+            elif opcode.mnemonic in ("JMP", "JSR") and opcode.mode == "abs":
+                leaders.add(self.read_word(pc + 1))
+                leaders.add(end)
+            elif opcode.mnemonic in ("JMP", "RTS", "RTI", "BRK"):
+                leaders.add(end)
+
+        blocks = []
+        expected = None
+        for pc in sorted(self.counts):
+            if pc != expected or pc in leaders:
+                blocks.append(Block(pc, labels.get(pc), self.counts[pc], 0, 0))
+            block = blocks[-1]
+            block.cycles += self.cycle_counts[pc]
+            block.instructions += 1
+            expected = pc + opcodes.BY_CODE[self.memory[pc]].size
+        return blocks
+
+    def disassemble(self, pc, labels=None):
+        """Returns the text of the instruction at pc."""
+        labels = labels or {}
+        opcode = opcodes.BY_CODE.get(self.memory[pc])
+        if opcode is None:
+            return f".byt ${self.memory[pc]:02X}"
+        mode = opcode.mode
+        if opcodes.OPERAND_SIZE[mode] == 2:
+            value = self.read_word(pc + 1)
+            operand = labels.get(value, f"${value:04X}")
+        elif mode == "rel":
+            offset = self.memory[pc + 1]
+            value = (pc + 2 + offset -
+                     (0x100 if offset >= 0x80 else 0)) & 0xFFFF
+            operand = labels.get(value, f"${value:04X}")
+        elif opcodes.OPERAND_SIZE[mode] == 1:
+            operand = f"${self.memory[pc + 1]:02X}"
+        else:
+            return opcode.mnemonic
+        formats = {
+            "imm": "#{}",
+            "zpx": "{},X",
+            "abx": "{},X",
+            "zpy": "{},Y",
+            "aby": "{},Y",
+            "izx": "({},X)",
+            "izy": "({}),Y",
+            "ind": "({})",
+        }
+        operand = formats.get(mode, "{}").format(operand)
+        return f"{opcode.mnemonic} {operand}"
+
+    def profile(self, entry, labels=None):
+        """Returns a JSON-compatible profile of the run so far."""
+        labels = labels or {}
+        per_instruction = [{
+            "address": pc,
+            "text": self.disassemble(pc, labels),
+            "count": count,
+            "cycles": self.cycle_counts[pc],
+        } for pc, count in sorted(self.counts.items())]
+        os_calls = [{
+            "address": pc,
+            "calls": calls
+        } for pc, calls in sorted(self.trap_calls.items())]
+        return {
+            "cycles": self.cycles,
+            "instructions": sum(self.counts.values()),
+            "blocks": [attr.asdict(b) for b in self.blocks(entry, labels)],
+            "per_instruction": per_instruction,
+            "os_calls": os_calls,
+        }
+
+
+def read_block_counts(path):
+    """Returns a dict from label to execution count from a profile file."""
+    with open(path, encoding="utf-8") as f:
+        profile = json.load(f)
+    return {
+        block["label"]: block["count"]
+        for block in profile["blocks"] if block["label"] is not None
+    }
+
+
+def run_program(path, max_cycles=DEFAULT_MAX_CYCLES, image_format="xex"):
+    """Loads and runs an executable or assembly source file.
+
+    Args:
+        path: The file, assembled unless its name ends in .xex.
+        max_cycles: The cycles the program may run for.
+        image_format: How the program is loaded: "xex" for an Atari
+            executable, "boot" for a disk or cassette boot image, or
+            "cartridge" for an OSS one-chip cartridge image.
+
+    Returns:
+        The Machine after the run, the entry point, and a dict from address
+        to label name.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    labels = {}
+    if not path.endswith(".xex"):
+        program = assembler.assemble(data.decode(), path)
+        data = program.data
+        labels = program.labels
+    machine = Machine()
+    loaders = {
+        "xex": machine.load_xex,
+        "boot": machine.load_boot,
+        "cartridge": machine.load_cartridge,
+    }
+    entry = loaders[image_format](data)
+    machine.run(entry, max_cycles)
+    return machine, entry, labels
+
+
+def main():
+    """Runs the program given on the command line and prints its output."""
+    parser = argparse.ArgumentParser(
+        description="Run a 6502 program and profile it.")
+    parser.add_argument("program",
+                        help="an Atari executable (.xex) or assembly source")
+    parser.add_argument("--profile",
+                        metavar="FILE",
+                        help="write a JSON profile to FILE")
+    parser.add_argument("--max-cycles", type=int, default=DEFAULT_MAX_CYCLES)
+    parser.add_argument("--format",
+                        choices=["xex", "boot", "cartridge"],
+                        default="xex",
+                        help="how to load the program")
+    args = parser.parse_args()
+
+    try:
+        machine, entry, labels = run_program(args.program, args.max_cycles,
+                                             args.format)
+    except (assembler.AssemblyError, EmulationError) as e:
+        sys.exit(f"{args.program}: {e}")
+    sys.stdout.write(machine.text())
+    print(f"{machine.cycles} cycles", file=sys.stderr)
+    if args.profile is not None:
+        with open(args.profile, "w", encoding="utf-8") as f:
+            json.dump(machine.profile(entry, labels), f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
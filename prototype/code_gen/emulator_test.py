@@ -0,0 +1,233 @@
+# Copyright 2018 Daniel Thornburgh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the emulator."""
+
+import json
+import os
+
+import pytest
+
+import assembler
+import emulator
+
+HELLO = """
+.word $FFFF
+start = $0700
+.word start
+.word bss - 1
+* = start
+LDX #0
+LDA #11
+STA 834
+STX 840
+STX 841
+LDA #<kHello
+STA 128
+LDA #>kHello
+STA 129
+__loop1:
+LDY #0
+LDA (128),Y
+BEQ __end
+JSR 58454
+INC 128
+BNE __1
+INC 129
+__1:
+JMP __loop1
+__end JMP __end
+kHello .byt "Hello, world!",0
+bss = *
+"""
+
+# The end-to-end tests of the compiler, whose expected output is run here.
+TESTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                     "tests")
+
+
+def assemble_test(name):
+    """Assembles the test.asm of an end-to-end test."""
+    path = os.path.join(TESTS, name, "test.asm")
+    with open(path, encoding="utf-8") as f:
+        return assembler.assemble(f.read(), path)
+
+
+def run(source, **registers):
+    """Runs a subroutine at $0600 and returns the machine."""
+    program = assembler.assemble("* = $0600\n" + source + "\nRTS")
+    machine = emulator.Machine()
+    machine.memory[0x0600:0x0600 + len(program.data)] = program.data
+    for register, value in registers.items():
+        setattr(machine, register, value)
+    machine.run(0x0600, max_cycles=10000)
+    return machine
+
+
+def test_hello():
+    """Test that a program printing through CIO runs, and its profile."""
+    program = assembler.assemble(HELLO)
+    machine = emulator.Machine()
+    entry = machine.load_xex(program.data)
+    machine.run(entry)
+
+    assert entry == 0x0700
+    assert machine.text() == "Hello, world!"
+    assert machine.trap_calls == {emulator.CIOV: 13}
+
+    profile = machine.profile(entry, program.labels)
+    counts = {b["label"]: b["count"] for b in profile["blocks"]}
+    assert counts["start"] == 1
+    assert counts["__loop1"] == 14
+    assert counts["__end"] == 1
+    assert profile["cycles"] == machine.cycles
+    assert sum(i["cycles"]
+               for i in profile["per_instruction"]) == machine.cycles - 6 * 13
+    json.dumps(profile)
+
+
+def test_cycles():
+    """Test instruction timings, without penalties."""
+    # LDA #, STA zp, LDA abs, INC abs,X, PHA, PLA and RTS.
+    machine = run("LDA #1\nSTA $80\nLDA $1234\nINC $1234,X\nPHA\nPLA")
+    assert machine.cycles == 2 + 3 + 4 + 7 + 3 + 4 + 6
+
+
+def test_page_cross_penalty():
+    """Test that indexing across a page boundary takes a cycle more."""
+    same_page = run("LDA $1200,X", x=0xFF)
+    crossed = run("LDA $12FF,X", x=1)
+    store = run("STA $12FF,X", x=1)
+
+    assert crossed.cycles == same_page.cycles + 1
+    assert store.cycles == same_page.cycles + 1
+
+
+def test_branch_penalties():
+    """Test that taken branches take a cycle more, and two across pages."""
+    not_taken = run("LDX #1\nBEQ skip\nskip: NOP")
+    taken = run("LDX #0\nBEQ skip\nskip: NOP")
+    program = "LDX #0\nBEQ far\n.byt " + ",".join(["0"] * 120) + "\nfar: NOP"
+    machine = emulator.Machine()
+    # Place the branch so that its target is on the next page.
+    data = assembler.assemble("* = $06C0\n" + program + "\nRTS").data
+    machine.memory[0x06C0:0x06C0 + len(data)] = data
+    machine.run(0x06C0)
+
+    assert taken.cycles == not_taken.cycles + 1
+    assert machine.cycles == not_taken.cycles + 2
+
+
+def test_arithmetic():
+    """Test binary and decimal addition and subtraction."""
+    machine = run("CLC\nLDA #$50\nADC #$50")
+    assert (machine.a, machine.c, machine.v, machine.n) == (0xA0, False, True,
+                                                            True)
+
+    machine = run("SEC\nLDA #$10\nSBC #$20")
+    assert (machine.a, machine.c) == (0xF0, False)
+
+    machine = run("SED\nCLC\nLDA #$19\nADC #$28")
+    assert (machine.a, machine.c) == (0x47, False)
+
+    machine = run("SED\nCLC\nLDA #$58\nADC #$46")
+    assert (machine.a, machine.c) == (0x04, True)
+
+    machine = run("SED\nSEC\nLDA #$42\nSBC #$13")
+    assert (machine.a, machine.c) == (0x29, True)
+
+
+def test_ciov_buffer():
+    """Test that CIO puts a buffer when given a length."""
+    machine = run(
+        "LDX #$10\nLDA #11\nSTA $352\nLDA #<msg\nSTA $354\nLDA #>msg\n"
+        "STA $355\nLDA #3\nSTA $358\nLDA #0\nSTA $359\nJSR $E456\n"
+        "JMP done\nmsg .byt 72,73,155\ndone: NOP")
+
+    assert machine.text() == "HI\n"
+    assert machine.y == 1
+
+
+def test_runaway():
+    """Test that a program that doesn't end is stopped."""
+    machine = emulator.Machine()
+    data = assembler.assemble("* = $0600\nloop: NOP\nJMP loop").data
+    machine.memory[0x0600:0x0600 + len(data)] = data
+
+    with pytest.raises(emulator.EmulationError, match="no exit"):
+        machine.run(0x0600, max_cycles=1000)
+
+
+def test_read_block_counts(tmp_path):
+    """Test that block counts are read back from a written profile."""
+    program = assembler.assemble(HELLO)
+    machine = emulator.Machine()
+    entry = machine.load_xex(program.data)
+    machine.run(entry)
+    path = tmp_path / "profile.json"
+    path.write_text(json.dumps(machine.profile(entry, program.labels)))
+
+    counts = emulator.read_block_counts(str(path))
+
+    assert counts["__loop1"] == 14
+    assert counts["start"] == 1
+
+
+@pytest.mark.parametrize("name", ["atari_disk_boot", "atari_cassette_boot"])
+def test_boot(name):
+    """Test that the boot tests' images boot and run their C routines."""
+    program = assemble_test(name)
+    machine = emulator.Machine()
+    entry = machine.load_boot(program.data)
+    machine.run(entry)
+
+    assert entry == program.symbols["start"]
+    assert machine.a == 0x0A
+    assert machine.read_word(0x0E) == program.symbols["end"]
+    assert machine.read_word(0x02E7) == program.symbols["end"]
+
+
+def test_boot_failure():
+    """Test that a boot continuation returning carry set fails the boot."""
+    data = assembler.assemble("""
+        * = $0700
+        .byt 0, 1
+        .word $0700, $0700
+        SEC
+        RTS
+        .dsb 128 - 8
+    """).data
+    with pytest.raises(emulator.EmulationError, match="boot continuation"):
+        emulator.Machine().load_boot(data)
+
+
+def test_bank_switching():
+    """Test that the bank switching test's cartridge calls into each bank."""
+    program = assemble_test("bank_switching")
+    machine = emulator.Machine()
+    entry = machine.load_cartridge(program.data)
+    machine.run(entry)
+
+    assert entry == program.symbols["start"]
+    assert machine.a == 0x0A
+
+
+def test_basic_usr():
+    """Test that the BASIC USR test's routine subtracts its arguments."""
+    program = assemble_test("atari_basic_usr")
+    machine = emulator.Machine()
+    machine.memory[0x0600:0x0600 + len(program.data)] = program.data
+
+    assert machine.usr(0x0600, 10, 3, 2) == 5
+    assert machine.usr(0x0600, 300) == 44
+    assert machine.s == 0xFF
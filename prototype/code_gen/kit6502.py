@@ -1,12 +1,16 @@
 from attr import attrs, attrib
+from cost import CostModel
 from functools import reduce
 from math import exp
 from numbers import Number
 
+import argparse
 import itertools
 import random
 import sys
 
+import emulator
+
 
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
@@ -48,8 +52,20 @@ class Instruction:
         self._gen(alloc, live_locs(alloc, live_vars))
 
 
-def emit(*args, cost=2):
-    asm.append([" ".join(str(arg) for arg in args), cost * 100**loop_number])
+def emit(*args):
+    text = " ".join(str(arg) for arg in args)
+    asm.append([text, cost_model.statement_cost(text, block_weight())])
+
+
+# The number of times the code being emitted is expected to run. Given a
+# profile, this is the count of the innermost enclosing loop's header, or of
+# the entry point outside of loops. Otherwise, each loop is assumed to run 100
+# times.
+def block_weight():
+    if block_counts is None:
+        return 100**loop_number
+    label = loop_labels[loop_number - 1] if loop_number else "start"
+    return block_counts.get(label, 100**loop_number)
 
 
 @attrs
@@ -71,17 +87,17 @@ class Add(Instruction):
             assert isinstance(loc, Number)
 
         if "Z" in live:
-            emit("PHP", cost=3)
+            emit("PHP")
 
         if alloc[self.destination] == alloc[self.left] and isinstance(
                 self.right, Const) and self.right.value == 1:
             (loc, ) = alloc[self.destination]
             label = new_label()
 
-            emit("INC", loc, cost=5)
+            emit("INC", loc)
             emit("BNE", label)
-            emit("INC", loc + 1, cost=5)
-            emit("{}:".format(label), cost=0)
+            emit("INC", loc + 1)
+            emit("{}:".format(label))
         else:
             (dest_loc, ) = alloc[self.destination]
             (left_loc, ) = alloc[self.left]
@@ -91,27 +107,27 @@ class Add(Instruction):
             right_loc = format_addr(right_loc)
 
             if "A" in live:
-                emit("PHA", cost=3)
+                emit("PHA")
 
             emit("CLC")
-            emit("LDA", left_loc, cost=3.5)
+            emit("LDA", left_loc)
             if isinstance(self.right, Const):
                 emit("ADC #{}".format(self.right.value % 256))
             else:
-                emit("ADC {}".format(right_loc), cost=3.5)
-            emit("STA", dest_loc, cost=3.5)
-            emit("LDA {}+1".format(left_loc, cost=3.5))
+                emit("ADC {}".format(right_loc))
+            emit("STA", dest_loc)
+            emit("LDA {}+1".format(left_loc))
             if isinstance(self.right, Const):
                 emit("ADC #{}".format(self.right.value // 256))
             else:
-                emit("ADC {}+1".format(right_loc), cost=3.5)
-            emit("STA {}+1".format(dest_loc), cost=3.5)
+                emit("ADC {}+1".format(right_loc))
+            emit("STA {}+1".format(dest_loc))
 
             if "A" in live:
-                emit("PLA", cost=4)
+                emit("PLA")
 
         if "Z" in live:
-            emit("PLP", cost=4)
+            emit("PLP")
 
 
 @attrs
@@ -136,15 +152,15 @@ class AsmCall(Instruction):
         clobbered_locs = live_locs(alloc, clobbered_nonconsts)
 
         if "Z" in clobbered_locs:
-            emit("PHP", cost=3)
+            emit("PHP")
         if "A" in clobbered_locs:
-            emit("PHA", cost=3)
+            emit("PHA")
         if "X" in clobbered_locs:
             emit("TXA")
-            emit("PHA", cost=3)
+            emit("PHA")
         if "Y" in clobbered_locs:
             emit("TYA")
-            emit("PHA", cost=3)
+            emit("PHA")
 
         cur_alloc = alloc.copy()
         cur_live_vars = live_vars.copy()
@@ -156,7 +172,7 @@ class AsmCall(Instruction):
             Mov(dest, var).gen(cur_alloc, cur_live_vars)
             cur_live_vars.add(dest)
 
-        emit("JSR", self.address, cost=6)
+        emit("JSR", self.address)
 
         for const in clobbered_consts:
             LoadImm(var).gen({
@@ -164,15 +180,15 @@ class AsmCall(Instruction):
             }, live_vars - clobbered_nonconsts)
 
         if "Y" in clobbered_locs:
-            emit("PLA", cost=4)
+            emit("PLA")
             emit("TAY")
         if "X" in clobbered_locs:
-            emit("PLA", cost=4)
+            emit("PLA")
             emit("TAX")
         if "A" in clobbered_locs:
-            emit("PLA", cost=4)
+            emit("PLA")
         if "Z" in clobbered_locs:
-            emit("PLP", cost=4)
+            emit("PLP")
 
 
 @attrs
@@ -223,7 +239,7 @@ class Load(Instruction):
                 **alloc, self.offset: {"Y"}
             }, live | {addr})
 
-        emit("LDA ({}),Y".format(addr), cost=5)
+        emit("LDA ({}),Y".format(addr))
 
         a_var = Var(1, "a_var")
         Mov(self.destination, a_var)._gen({
@@ -338,16 +354,16 @@ class LoadImm(Instruction):
         assert self.value.size == 1
 
         if "Z" in live:
-            emit("PHP", cost=3)
+            emit("PHP")
 
         locs = alloc[self.value]
         addrs = set(filter(lambda loc: isinstance(loc, Number), locs))
         if "A" in locs:
-            emit("LDA #{}".format(self.value.value), cost=3.5)
+            emit("LDA #{}".format(self.value.value))
         if "X" in locs:
-            emit("LDX #{}".format(self.value.value), cost=3.5)
+            emit("LDX #{}".format(self.value.value))
         if "Y" in locs:
-            emit("LDY #{}".format(self.value.value), cost=3.5)
+            emit("LDY #{}".format(self.value.value))
 
         for addr in addrs:
             addr = format_addr(addr)
@@ -358,7 +374,7 @@ class LoadImm(Instruction):
             Store(address, self.value)._gen(new_alloc, live)
 
         if "Z" in live:
-            emit("PLP", cost=4)
+            emit("PLP")
 
 
 @attrs
@@ -414,7 +430,7 @@ class Mov(Instruction):
         saved_a = False
 
         if "Z" in live:
-            emit("PHP", cost=3)
+            emit("PHP")
 
         def z_to(reg):
             flag_set = new_label()
@@ -438,7 +454,7 @@ class Mov(Instruction):
                     addr = next((format_addr(addr) for addr in locs
                                  if isinstance(addr, Number)), None)
                 assert addr is not None
-                emit("LDA", addr, cost=3.5)
+                emit("LDA", addr)
             else:
                 assert "Z" in locs
                 z_to("A")
@@ -450,7 +466,7 @@ class Mov(Instruction):
                 emit("TAX")
             elif "Y" in locs:
                 if "A" in live and not saved_a:
-                    emit("PHA", cost=3)
+                    emit("PHA")
                     saved_a = True
                 locs.add("A")
                 emit("TYA")
@@ -462,7 +478,7 @@ class Mov(Instruction):
                     addr = next((format_addr(addr) for addr in locs
                                  if isinstance(addr, Number)), None)
                 assert addr is not None
-                emit("LDX", addr, cost=3.5)
+                emit("LDX", addr)
             else:
                 assert "Z" in locs
                 z_to("X")
@@ -474,7 +490,7 @@ class Mov(Instruction):
                 emit("TAY")
             elif "X" in locs:
                 if "A" in live and not saved_a:
-                    emit("PHA", cost=3)
+                    emit("PHA")
                     saved_a = True
                 locs.add("A")
                 emit("TXA")
@@ -486,7 +502,7 @@ class Mov(Instruction):
                     addr = next((format_addr(addr) for addr in locs
                                  if isinstance(addr, Number)), None)
                 assert addr is not None
-                emit("LDY", addr, cost=3.5)
+                emit("LDY", addr)
             else:
                 assert "Z" in locs
                 z_to("Y")
@@ -505,7 +521,7 @@ class Mov(Instruction):
                 loc = "Y"
             else:
                 if "A" in live and not saved_a:
-                    emit("PHA", cost=3)
+                    emit("PHA")
                     saved_a = True
                 tmp = Var(1, "tmp")
                 Mov(tmp, self.source)._gen({**alloc, tmp: {"A"}}, live)
@@ -515,7 +531,7 @@ class Mov(Instruction):
             emit("ST{} {}".format(loc, addr))
 
         if saved_a:
-            emit("PLA", cost=4)
+            emit("PLA")
             if "A" in alloc[self.source]:
                 locs.add("A")
                 locs.add("Z")
@@ -538,16 +554,16 @@ class Mov(Instruction):
                                  if isinstance(addr, Number)), None)
                 assert addr is not None
                 if "A" not in live:
-                    emit("LDA", addr, cost=3.5)
+                    emit("LDA", addr)
                 elif "X" not in live:
-                    emit("LDX", addr, cost=3.5)
+                    emit("LDX", addr)
                 elif "Y" not in live:
-                    emit("LDY", addr, cost=3.5)
+                    emit("LDY", addr)
                 else:
-                    emit("INC", addr, cost=5)
-                    emit("DEC", addr, cost=5)
+                    emit("INC", addr)
+                    emit("DEC", addr)
         elif "Z" in live:
-            emit("PLP", cost=4)
+            emit("PLP")
 
 
 @attrs
@@ -561,20 +577,20 @@ class Store(Instruction):
         assert self.value.size == 1
 
         if "A" in alloc[self.value]:
-            emit("STA", self.address.value, cost=3.5)
+            emit("STA", self.address.value)
         elif "X" in alloc[self.value]:
-            emit("STX", self.address.value, cost=3.5)
+            emit("STX", self.address.value)
         elif "Y" in alloc[self.value]:
-            emit("STY", self.address.value, cost=3.5)
+            emit("STY", self.address.value)
         else:
             if "A" in live:
                 if "Z" in live:
-                    emit("PHP", cost=3)
-                emit("PHA", cost=3)
+                    emit("PHP")
+                emit("PHA")
                 self._gen(alloc, live - {"A", "Z"})
-                emit("PLA", cost=4)
+                emit("PLA")
                 if "Z" in live:
-                    emit("PLP", cost=4)
+                    emit("PLP")
                 return
             dest = Var(1, "dest")
             new_alloc = {**alloc, dest: {"A"}}
@@ -594,6 +610,14 @@ def new_label():
     return label
 
 
+# Loop headers are numbered afresh on each attempt, so that they can be found
+# in a profile of any attempt.
+def new_loop_label():
+    label = "__loop{}".format(len(loop_labels) + 1)
+    loop_labels.append(label)
+    return label
+
+
 def string(name, value):
     strings.append((name, value))
     return Const(2, name, name)
@@ -717,8 +741,10 @@ for a in interference:
 
 def attempt(alloc):
     global asm
+    global loop_labels
     global loop_number
     asm = []
+    loop_labels = []
     loop_number = 0
     emit(".word $FFFF")
     emit("start = $0700")
@@ -743,9 +769,9 @@ def attempt(alloc):
     Store(IOCB0_ICBLL, ZERO).gen(alloc, {IOCB0_ICBLH, ZERO, ONE, kHello})
     Store(IOCB0_ICBLH, ZERO).gen(alloc, {ZERO, ONE, kHello})
     Mov(ptr, kHello).gen(alloc, {ZERO, ONE})
-    loop = new_label()
-    emit("{}:".format(loop))
     loop_number += 1
+    loop = new_loop_label()
+    emit("{}:".format(loop))
     Load(char, ptr, ZERO, zero=done).gen(alloc, {ZERO, ONE, ptr})
     BrFalse(done, "__end").gen(alloc, {ZERO, ONE, ptr, char})
     AsmCall(CIOV, {
@@ -836,6 +862,23 @@ def asm_cost(asm):
     return sum(cost for _, cost in asm)
 
 
+parser = argparse.ArgumentParser(
+    description="Allocate and emit a hello world program.")
+parser.add_argument(
+    "--profile",
+    metavar="FILE",
+    help="weight costs by block counts from an emulator profile")
+parser.add_argument(
+    "--byte-weight",
+    type=float,
+    default=0,
+    help="the cost of each byte of code, where each cycle costs 1")
+args = parser.parse_args()
+cost_model = CostModel(byte_weight=args.byte_weight)
+block_counts = None
+if args.profile is not None:
+    block_counts = emulator.read_block_counts(args.profile)
+
 cost = asm_cost(attempt(alloc))
 best_alloc = alloc
 best_cost = cost
@@ -13,13 +13,14 @@
 # limitations under the License.
 """The Move instruction, which moves a value from one variable to another."""
 
-from itertools import chain
+import heapq
+from itertools import chain, count
 from numbers import Number
 
 import attr
-from sortedcontainers import SortedDict
 
 import asm
+import cost
 from var import Constant, Variable
 
 
@@ -31,6 +32,16 @@ class RuleNotApplicableError(Exception):
     """Error indicating that a rule for an operation does not apply."""
 
 
+@attr.attrs
+class SearchStats:
+    """Counts of the work done by searches for assembly.
+
+    Attributes:
+        expanded: The number of states whose successors were generated.
+    """
+    expanded = attr.attrib(default=0)
+
+
 @attr.attrs
 class Move:
     """Sets a destination variable to have the same value as a source variable.
@@ -48,7 +59,11 @@ class Move:
                 "Destination of Move cannot be constant; did you mean LoadImmediate?"
             )
 
-    def generate(self, allocation, live_variables):
+    def generate(self,
+                 allocation,
+                 live_variables,
+                 cost_model=cost.SPEED,
+                 stats=None):
         """Returns generated assembly for the operation.
 
         A variable being live means that this operation must preserve its value.
@@ -56,6 +71,8 @@ class Move:
         Arguments:
             allocation: The assignment of variables to storage locations.
             live_variables: The set of variables whose values must be preserved.
+            cost_model: The CostModel the assembly is to be cheapest under.
+            stats: A SearchStats to count the search's work in, if any.
         """
         if isinstance(self.source, Constant):
             # Create a temporary constant variable with self.source's value.
@@ -71,41 +88,18 @@ class Move:
                 for loc in allocation[var]:
                     start[loc] = var
 
-            closed = set()
-            open_ = SortedDict({0: [(start, [])]})
-            while open_:
-                cost, list_ = open_.peekitem(0)
-                if not list_:
-                    del open_[cost]
-                    continue
-                state, state_asm = list_.pop()
-
-                if frozenset(state.items()) in closed:
-                    continue
-
-                if self._is_goal(state, allocation, live_variables):
-                    return state_asm
-
-                closed.add(frozenset(state.items()))
-
-                for new_state, move_asm in chain(
-                        _tax(state), _tay(state), _txa(state), _tya(state),
-                        _sta_zp(state), _sta_m(state), _lda(state),
-                        _php(state), _plp(state)):
-                    open_.setdefault(cost + 2, []).append(
-                        (new_state, state_asm + move_asm))
-            raise GenerationError("Goal could not be reached.")
-
-    def _is_goal(self, state, allocation, live_variables):
-        for loc in allocation[self.destination]:
+            # The variable each location must hold once the move is done.
             # NOTE: Each destination location is set to the source value.
-            if loc not in state or state[loc] != self.source:
-                return False
-        for var in live_variables:
-            for loc in allocation[var]:
-                if loc not in state or state[loc] != var:
-                    return False
-        return True
+            goal = {}
+            for var in live_variables:
+                for loc in allocation[var]:
+                    goal[loc] = var
+            for loc in allocation[self.destination]:
+                if goal.get(loc, self.source) != self.source:
+                    raise GenerationError(
+                        f"{loc} is both live and the destination.")
+                goal[loc] = self.source
+            return _search(start, goal, cost_model, stats)
 
     # TODO: Only support flag locations for boolean variables
 
@@ -117,6 +111,136 @@ class Move:
     # TODO: Configurable memory locations.
 
 
+def _search(start, goal, cost_model, stats):  # pylint: disable=too-many-locals
+    """Returns the cheapest assembly taking the start state to the goal.
+
+    Arguments:
+        start: A dict from each location to the variable it holds.
+        goal: A dict from each location that matters to the variable it must
+            hold.
+        cost_model: The CostModel the assembly is to be cheapest under.
+        stats: A SearchStats to count the search's work in, if any.
+    """
+    write_costs = _write_costs(cost_model)
+
+    # An A* search, ordered by the cost so far plus a lower bound on the cost
+    # to go. Ties go to the state furthest along, then to the state found
+    # first. The bound isn't consistent, so a state is expanded again if a
+    # cheaper way to it is found.
+    best_costs = {frozenset(start.items()): 0}
+    counter = count()
+    bound = _lower_bound(start, goal, write_costs)
+    open_ = [(bound, 0, next(counter), start, [])]
+    while open_:
+        _, negative_cost, _, state, state_asm = heapq.heappop(open_)
+        state_cost = -negative_cost
+        if state_cost > best_costs[frozenset(state.items())]:
+            continue
+        if stats is not None:
+            stats.expanded += 1
+
+        if all(state.get(loc) == var for loc, var in goal.items()):
+            return state_asm
+
+        for new_state, move_asm, move_cost in _next_states(state, cost_model):
+            new_cost = state_cost + move_cost
+            key = frozenset(new_state.items())
+            if new_cost >= best_costs.get(key, float("inf")):
+                continue
+            best_costs[key] = new_cost
+            estimate = new_cost + _lower_bound(new_state, goal, write_costs)
+            heapq.heappush(open_, (estimate, -new_cost, next(counter),
+                                   new_state, state_asm + move_asm))
+    raise GenerationError("Goal could not be reached.")
+
+
+def _next_states(state, cost_model):
+    """Yields the states one move away, with each move's assembly and cost."""
+    moves = chain(_tax(state), _tay(state), _txa(state), _tya(state),
+                  _sta_zp(state), _sta_m(state), _lda(state), _php(state),
+                  _plp(state))
+    for new_state, move_asm in moves:
+        yield new_state, move_asm, sum(
+            cost_model.instruction_cost(instruction)
+            for instruction in move_asm)
+
+
+def _write_costs(cost_model):
+    """Returns the least cost of writing to each kind of location.
+
+    The kinds are the registers, "N" (which only PLP can set), "flags" for
+    either flag, "zp" for zero page and "abs" for the rest of memory.
+    """
+
+    def cheapest(*instructions):
+        """Returns the least cost of any of the instructions."""
+        return min(
+            cost_model.instruction_cost(instruction)
+            for instruction in instructions)
+
+    flags = cheapest(asm.TAX(), asm.TAY(), asm.TXA(), asm.TYA(), asm.LDA(0),
+                     asm.PLP())
+    return {
+        "A": cheapest(asm.TXA(), asm.TYA(), asm.LDA(0)),
+        "X": cheapest(asm.TAX()),
+        "Y": cheapest(asm.TAY()),
+        "flags": flags,
+        "N": cheapest(asm.PLP()),
+        "zp": cheapest(asm.STA(0)),
+        "abs": cheapest(asm.STA(256)),
+    }
+
+
+def _lower_bound(state, goal, write_costs):
+    """Returns a lower bound on the cost of reaching the goal from a state.
+
+    Every location not holding its goal variable must be written, and no
+    instruction writes more than one location other than the flags, so the
+    cheapest writes of each can be summed. Beyond that:
+        - X, Y and memory are only written from A, so A must be written with
+          each variable they need that it doesn't hold, and then restored.
+        - N is only set by PLP, and is lost by any register write.
+        - Z is lost by any register write, unless the last one writes its
+          goal variable.
+    """
+    bound = 0
+    registers_written = False
+    # Variables that must pass through A on the way to other locations.
+    through_a = set()
+    for loc, var in goal.items():
+        if state.get(loc) == var or loc in ("N", "Z"):
+            continue
+        if isinstance(loc, Number):
+            bound += write_costs["zp" if loc < 256 else "abs"]
+        else:
+            bound += write_costs.get(loc, 0)
+            registers_written = True
+        if loc != "A" and state.get("A") != var:
+            through_a.add(var)
+
+    through_a.discard(goal.get("A"))
+    written = set(through_a)
+    if through_a:
+        bound += write_costs["A"] * len(through_a)
+        registers_written = True
+        if "A" in goal and state.get("A") == goal["A"]:
+            # A has to be restored.
+            bound += write_costs["A"]
+            written.add(goal["A"])
+
+    if "N" in goal and (registers_written or state.get("N") != goal["N"]):
+        bound += write_costs["N"]
+    elif "Z" in goal:
+        if registers_written:
+            written.update(goal[loc] for loc in ("A", "X", "Y")
+                           if loc in goal and state.get(loc) != goal[loc])
+            if goal["Z"] not in written:
+                bound += write_costs["flags"]
+        elif state.get("Z") != goal["Z"]:
+            bound += write_costs["flags"]
+    return bound
+
+
 def _tax(state):
     if "A" not in state:
         return
@@ -213,7 +337,8 @@ def _sta_m(state):
 
 def _lda(state):
     for loc in state:
-        if isinstance(loc, Number) and loc < 256 and state[loc] != state["A"]:
+        if isinstance(loc, Number) and loc < 256 and state[loc] != state.get(
+                "A"):
             new_state = state.copy()
             new_state["A"] = state[loc]
             try:
@@ -16,6 +16,7 @@
 import pytest
 
 import asm
+import cost
 import move
 from var import Variable
 
@@ -156,3 +157,50 @@ def test_tax_z_live():
     assert move.Move(destination, source).generate(
         allocation, {live}) == [asm.PHP(), asm.TAX(),
                                 asm.PLP()]
+
+
+def test_zero_page_to_a():
+    """Test that an LDA instruction can be emitted."""
+    source = Variable("from")
+    destination = Variable("to")
+    allocation = {source: {0x80}, destination: {"A"}}
+
+    code = move.Move(destination, source).generate(allocation, set())
+    assert code == [asm.LDA(0x80)]
+
+
+def test_live_destination_fails():
+    """Test that a move to a location that must be preserved fails."""
+    source = Variable("from")
+    destination = Variable("to")
+    live = Variable("live")
+    allocation = {source: {"A"}, destination: {"X"}, live: {"X"}}
+
+    with pytest.raises(move.GenerationError):
+        move.Move(destination, source).generate(allocation, {live})
+
+
+def _cost(instructions):
+    return sum(cost.SPEED.instruction_cost(i) for i in instructions)
+
+
+@pytest.mark.parametrize("live_locations", [["A", "Z"], ["A", "N", "Z"]])
+def test_matches_uniform_cost_search(monkeypatch, live_locations):
+    """Test that the A* search is optimal and expands fewer states.
+
+    The search is compared against itself without a heuristic.
+    """
+    source = Variable("from")
+    destination = Variable("to")
+    live = {Variable(loc): {loc} for loc in live_locations}
+    allocation = {source: {"X"}, destination: {"Y", 0, 256}, **live}
+
+    operation = move.Move(destination, source)
+    a_star_stats = move.SearchStats()
+    a_star = operation.generate(allocation, set(live), stats=a_star_stats)
+    monkeypatch.setattr(move, "_lower_bound", lambda *args: 0)
+    uniform_stats = move.SearchStats()
+    uniform = operation.generate(allocation, set(live), stats=uniform_stats)
+
+    assert _cost(a_star) == _cost(uniform)
+    assert a_star_stats.expanded * 4 < uniform_stats.expanded
@@ -0,0 +1,208 @@
+# Copyright 2018 Daniel Thornburgh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""The documented opcodes of the NMOS 6502.
+
+Addressing modes are named as follows:
+    imp: Implied.                   acc: Accumulator.
+    imm: Immediate, #n.             rel: Relative, for branches.
+    zp:  Zero page, n.              abs: Absolute, nnnn.
+    zpx: Zero page indexed, n,X.    abx: Absolute indexed, nnnn,X.
+    zpy: Zero page indexed, n,Y.    aby: Absolute indexed, nnnn,Y.
+    izx: Indexed indirect, (n,X).   ind: Indirect, (nnnn), for JMP.
+    izy: Indirect indexed, (n),Y.
+"""
+
+import attr
+
+# The number of bytes taken by the operand of each addressing mode.
+OPERAND_SIZE = {
+    "imp": 0,
+    "acc": 0,
+    "imm": 1,
+    "rel": 1,
+    "zp": 1,
+    "zpx": 1,
+    "zpy": 1,
+    "izx": 1,
+    "izy": 1,
+    "abs": 2,
+    "abx": 2,
+    "aby": 2,
+    "ind": 2,
+}
+
+BRANCHES = frozenset(["BCC", "BCS", "BEQ", "BMI", "BNE", "BPL", "BVC", "BVS"])
+
+
+@attr.attrs(frozen=True)
+class Opcode:
+    """An instruction and addressing mode, and its encoding and timing.
+
+    Attributes:
+        code: The opcode byte.
+        mnemonic: The instruction, in upper case.
+        mode: The addressing mode.
+        cycles: Cycles taken, not counting the penalties below.
+        page_penalty: Whether an extra cycle is taken when indexing crosses a
+            page boundary. Branches instead take one extra cycle when taken and
+            another if the target is on a different page.
+    """
+    code = attr.attrib()
+    mnemonic = attr.attrib()
+    mode = attr.attrib()
+    cycles = attr.attrib()
+    page_penalty = attr.attrib(default=False)
+
+    @property
+    def size(self):
+        """The number of bytes of the instruction."""
+        return 1 + OPERAND_SIZE[self.mode]
+
+
+# (opcode, cycles) for each mode of the usual read instructions, with a "*"
+# marking a page crossing penalty.
+_READ_MODES = ("imm", "zp", "zpx", "abs", "abx", "aby", "izx", "izy")
+_READ_CYCLES = (2, 3, 4, 4, "4*", "4*", 6, "5*")
+_READS = {
+    "ADC": (0x69, 0x65, 0x75, 0x6D, 0x7D, 0x79, 0x61, 0x71),
+    "AND": (0x29, 0x25, 0x35, 0x2D, 0x3D, 0x39, 0x21, 0x31),
+    "CMP": (0xC9, 0xC5, 0xD5, 0xCD, 0xDD, 0xD9, 0xC1, 0xD1),
+    "EOR": (0x49, 0x45, 0x55, 0x4D, 0x5D, 0x59, 0x41, 0x51),
+    "LDA": (0xA9, 0xA5, 0xB5, 0xAD, 0xBD, 0xB9, 0xA1, 0xB1),
+    "ORA": (0x09, 0x05, 0x15, 0x0D, 0x1D, 0x19, 0x01, 0x11),
+    "SBC": (0xE9, 0xE5, 0xF5, 0xED, 0xFD, 0xF9, 0xE1, 0xF1),
+}
+
+# Read-modify-write instructions, in the modes acc, zp, zpx, abs, abx.
+_RMW_MODES = ("acc", "zp", "zpx", "abs", "abx")
+_RMW_CYCLES = (2, 5, 6, 6, 7)
+_RMWS = {
+    "ASL": (0x0A, 0x06, 0x16, 0x0E, 0x1E),
+    "LSR": (0x4A, 0x46, 0x56, 0x4E, 0x5E),
+    "ROL": (0x2A, 0x26, 0x36, 0x2E, 0x3E),
+    "ROR": (0x6A, 0x66, 0x76, 0x6E, 0x7E),
+    "DEC": (None, 0xC6, 0xD6, 0xCE, 0xDE),
+    "INC": (None, 0xE6, 0xF6, 0xEE, 0xFE),
+}
+
+_IMPLIED = {
+    "BRK": (0x00, 7),
+    "CLC": (0x18, 2),
+    "CLD": (0xD8, 2),
+    "CLI": (0x58, 2),
+    "CLV": (0xB8, 2),
+    "DEX": (0xCA, 2),
+    "DEY": (0x88, 2),
+    "INX": (0xE8, 2),
+    "INY": (0xC8, 2),
+    "NOP": (0xEA, 2),
+    "PHA": (0x48, 3),
+    "PHP": (0x08, 3),
+    "PLA": (0x68, 4),
+    "PLP": (0x28, 4),
+    "RTI": (0x40, 6),
+    "RTS": (0x60, 6),
+    "SEC": (0x38, 2),
+    "SED": (0xF8, 2),
+    "SEI": (0x78, 2),
+    "TAX": (0xAA, 2),
+    "TAY": (0xA8, 2),
+    "TSX": (0xBA, 2),
+    "TXA": (0x8A, 2),
+    "TXS": (0x9A, 2),
+    "TYA": (0x98, 2),
+}
+
+# (mnemonic, mode, opcode, cycles, page penalty) for everything else.
+_OTHERS = (
+    ("BIT", "zp", 0x24, 3, False),
+    ("BIT", "abs", 0x2C, 4, False),
+    ("CPX", "imm", 0xE0, 2, False),
+    ("CPX", "zp", 0xE4, 3, False),
+    ("CPX", "abs", 0xEC, 4, False),
+    ("CPY", "imm", 0xC0, 2, False),
+    ("CPY", "zp", 0xC4, 3, False),
+    ("CPY", "abs", 0xCC, 4, False),
+    ("JMP", "abs", 0x4C, 3, False),
+    ("JMP", "ind", 0x6C, 5, False),
+    ("JSR", "abs", 0x20, 6, False),
+    ("LDX", "imm", 0xA2, 2, False),
+    ("LDX", "zp", 0xA6, 3, False),
+    ("LDX", "zpy", 0xB6, 4, False),
+    ("LDX", "abs", 0xAE, 4, False),
+    ("LDX", "aby", 0xBE, 4, True),
+    ("LDY", "imm", 0xA0, 2, False),
+    ("LDY", "zp", 0xA4, 3, False),
+    ("LDY", "zpx", 0xB4, 4, False),
+    ("LDY", "abs", 0xAC, 4, False),
+    ("LDY", "abx", 0xBC, 4, True),
+    ("STA", "zp", 0x85, 3, False),
+    ("STA", "zpx", 0x95, 4, False),
+    ("STA", "abs", 0x8D, 4, False),
+    ("STA", "abx", 0x9D, 5, False),
+    ("STA", "aby", 0x99, 5, False),
+    ("STA", "izx", 0x81, 6, False),
+    ("STA", "izy", 0x91, 6, False),
+    ("STX", "zp", 0x86, 3, False),
+    ("STX", "zpy", 0x96, 4, False),
+    ("STX", "abs", 0x8E, 4, False),
+    ("STY", "zp", 0x84, 3, False),
+    ("STY", "zpx", 0x94, 4, False),
+    ("STY", "abs", 0x8C, 4, False),
+)
+
+_BRANCH_CODES = {
+    "BPL": 0x10,
+    "BMI": 0x30,
+    "BVC": 0x50,
+    "BVS": 0x70,
+    "BCC": 0x90,
+    "BCS": 0xB0,
+    "BNE": 0xD0,
+    "BEQ": 0xF0,
+}
+
+
+def _build():
+    """Returns the Opcodes, and a dict from each mnemonic to its modes."""
+    opcodes = []
+    for mnemonic, codes in _READS.items():
+        for mode, code, cycles in zip(_READ_MODES, codes, _READ_CYCLES):
+            penalty = isinstance(cycles, str)
+            cycles = int(cycles.rstrip("*")) if penalty else cycles
+            opcodes.append(Opcode(code, mnemonic, mode, cycles, penalty))
+    for mnemonic, codes in _RMWS.items():
+        for mode, code, cycles in zip(_RMW_MODES, codes, _RMW_CYCLES):
+            if code is not None:
+                opcodes.append(Opcode(code, mnemonic, mode, cycles))
+    for mnemonic, (code, cycles) in _IMPLIED.items():
+        opcodes.append(Opcode(code, mnemonic, "imp", cycles))
+    for mnemonic, mode, code, cycles, penalty in _OTHERS:
+        opcodes.append(Opcode(code, mnemonic, mode, cycles, penalty))
+    for mnemonic, code in _BRANCH_CODES.items():
+        opcodes.append(Opcode(code, mnemonic, "rel", 2))
+    modes = {}
+    for opcode in opcodes:
+        modes.setdefault(opcode.mnemonic, set()).add(opcode.mode)
+    return opcodes, modes
+
+
+# The Opcodes, and the set of addressing modes of each mnemonic.
+OPCODES, MODES = _build()
+
+# The Opcode for each opcode byte.
+BY_CODE = {op.code: op for op in OPCODES}
+
+# The Opcode for each (mnemonic, mode) pair.
+BY_NAME = {(op.mnemonic, op.mode): op for op in OPCODES}
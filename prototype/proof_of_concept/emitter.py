@@ -5,6 +5,18 @@ class EmitError(Exception):
     pass
 
 
+# The label of each block, in the order emit places them. Each block falls
+# through to the destination of its jump, until a jump goes back to a block
+# already placed, or a block doesn't end in a jump.
+def block_labels(start):
+    labels = {}
+    block = start
+    while block is not None and block not in labels:
+        labels[block] = "_{}".format(len(labels))
+        block = getattr(block.terminator, "destination", None)
+    return labels
+
+
 def emit(start):
     # Emit prologue.
     print(".word $FFFF")
@@ -13,14 +25,10 @@ def emit(start):
     print(".word end - 1")
     print("* = start")
 
-    block_ids = {}
-
-    block = start
-    while True:
+    labels = block_labels(start)
+    for block in labels:
         # Emit a label for each block.
-        if block not in block_ids:
-            block_ids[block] = len(block_ids)
-        print("_{}:".format(block_ids[block]))
+        print("{}:".format(labels[block]))
 
         # Emit instructions (except terminator).
         for instruction in block.instructions[:-1]:
@@ -29,16 +37,11 @@ def emit(start):
         # JumpAbsolute is currently the only supported block terminator.
         assert isinstance(block.terminator, asm.JumpAbsolute)
 
-        if block.terminator.destination in block_ids:
-            # Jumps to already-emitted blocks must be emitted.
-            print("jmp _{}".format(block_ids[block.terminator.destination]))
-            # Since all jumps are currently unconditional, the first backward jump starts an infinite loop.
-            # This means we are done.
-            break
-        else:
-            # Jumps to not-yet-emitted blocks can be handled using fall-through.
-            # This requires emitting the destination next.
-            block = block.terminator.destination
+    # Jumps to not-yet-emitted blocks are handled using fall-through, so only
+    # the last jump, back to an already-emitted block, must be emitted.
+    # Since all jumps are currently unconditional, the first backward jump
+    # starts an infinite loop. This means we are done.
+    print("jmp {}".format(labels[block.terminator.destination]))
 
     # Emit epilogue.
     print("end = *")
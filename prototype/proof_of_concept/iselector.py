@@ -1,11 +1,17 @@
+import os
 import sys
 from attr import attrs, attrib
 from collections import defaultdict
 from numbers import Number
 
 import asm
+import emitter
 import ir
 
+# The cost model is shared with the code_gen prototype.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'code_gen'))
+from cost import SPEED, direct_mode
+
 
 class InstructionSelectionError(Exception):
     pass
@@ -27,11 +33,22 @@ class State(object):
         return self.registers, self.next_instruction_index
 
 
-def select(start):
+# Select instructions for the blocks reachable from start, ranked by
+# cost_model. Given block_counts, a dict from label to count as read from an
+# emulator profile by emulator.read_block_counts, the cycles of each block are
+# weighted by the number of times it ran, as labeled by the emitter. Blocks
+# missing from the profile are weighted as running once.
+def select(start, cost_model=SPEED, block_counts=None):
     num_iter = 0
     num_closed = 0
+    total_cost = 0
+    labels = emitter.block_labels(start)
 
     for block in ir.blocks_dfs(start):
+        weight = 1
+        if block_counts is not None:
+            weight = block_counts.get(labels.get(block), 1)
+
         # Perform a best-first search to select and schedule instructions for given DAG.
 
         # Search states already optimally reached.
@@ -55,8 +72,7 @@ def select(start):
                     "No way found to implement block: {}".format(block))
 
             # Find the next lowest cost in the frontier
-            while cur_cost not in frontier:
-                cur_cost += 1
+            cur_cost = min(frontier)
 
             # Pull the next best item out of the frontier.
             state = frontier[cur_cost].pop()
@@ -75,6 +91,7 @@ def select(start):
             # If the instruction graph root is covered, we have found optimal instructions for the whole graph.
             if state.next_instruction_index == len(block.instructions):
                 block.instructions = state.instructions
+                total_cost += cur_cost
                 break
 
             def update_state(cost, state):
@@ -87,7 +104,8 @@ def select(start):
             def ConsiderLoadImmediate(register, value):
                 if not isinstance(value, Number):
                     return
-                next_cost = cur_cost + 2
+                next_cost = cur_cost + cost_model.cost('LD' + register, 'imm',
+                                                       weight)
                 next_registers = state.registers | {(register, value)}
                 next_instructions = state.instructions + (asm.LoadImmediate(
                     register, value), )
@@ -112,7 +130,8 @@ def select(start):
             def ConsiderStoreAbsolute(register, address, value):
                 if isinstance(address, Number) and (register,
                                                     value) in state.registers:
-                    next_cost = cur_cost + (3 if address < 256 else 4)
+                    next_cost = cur_cost + cost_model.cost(
+                        'ST' + register, direct_mode(address), weight)
                     next_instructions = state.instructions + (
                         asm.StoreAbsolute(register, address), )
                     update_state(
@@ -131,7 +150,7 @@ def select(start):
 
             # Consider adding JumpAbsolute
             if isinstance(instruction, ir.Jump):
-                next_cost = cur_cost + 3
+                next_cost = cur_cost + cost_model.cost('JMP', 'abs', weight)
                 next_instructions = state.instructions + (asm.JumpAbsolute(
                     instruction.destination), )
                 update_state(
@@ -152,7 +171,8 @@ def select(start):
                     if instruction.Y is not None and (
                             'Y', instruction.Y) not in state.registers:
                         return
-                    next_cost = cur_cost + 6
+                    next_cost = cur_cost + cost_model.cost(
+                        'JSR', 'abs', weight)
                     next_instructions = state.instructions + (
                         asm.JumpSubroutine(instruction.address), )
                     # To be safe, assume that calls clear all computed values.
@@ -167,4 +187,5 @@ def select(start):
     print("Instruction Selector Stats:", file=sys.stderr)
     print("Num iter: {}".format(num_iter), file=sys.stderr)
     print("Num closed: {}".format(num_closed), file=sys.stderr)
+    print("Cost: {}".format(total_cost), file=sys.stderr)
     print(file=sys.stderr)